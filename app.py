@@ -1,52 +1,62 @@
-import streamlit as st
-from database import criar_tabelas, obter_usuario, verificar_senha, get_data, criar_usuario
-# from database_local import criar_tabelas, obter_usuario, verificar_senha
-
-st.set_page_config(page_title="Controle de Estoque", page_icon="🧪", layout="wide")
-
-st.title("🧪 Controle de Estoque de Farmácia")
-st.markdown("""
-Este aplicativo permite gerenciar entradas, saídas e controle de produtos de forma local.
-
-Perfis:
-- **Gestor**: acesso total (inclui Gestão de Acessos).
-- **Visualizador**: apenas **Visão Geral**.
-""")
-
-# --- Bootstrap: cria admin se tabela 'users' estiver vazia ---
-if 'bootstrap_done' not in st.session_state:
-    try:
-        users_sample = get_data("users", "id", limit=1)
-        if not users_sample:
-            criar_usuario("admin", "admin", "gestor", True)
-            st.toast("🔑 Usuário admin criado (login: admin / senha: admin). Altere a senha em **Gestão de Acessos**.", icon="✅")
-    except Exception:
-        # Ambiente sem Supabase configurado não deve travar a app
-        pass
-    st.session_state['bootstrap_done'] = True
-
-with st.sidebar:
-    st.image("logo.png", use_container_width=True)
-    st.write("")  # pequeno espaçamento
-
-# --- Sidebar: Login / Logout ---
-with st.sidebar:
-    st.header("Acesso")
-    if 'user' not in st.session_state:
-        username = st.text_input("Usuário")
-        password = st.text_input("Senha", type="password")
-        if st.button("Entrar", use_container_width=True):
-            u = obter_usuario(username)
-            if not u or not u["is_active"] or not verificar_senha(password, u["password_hash"]):
-                st.error("Usuário ou senha inválidos.")
-            else:
-                st.session_state['user'] = {"id": u["id"], "username": u["username"], "role": u["role"]}
-                st.success(f"Bem-vindo, {u['username']} ({u['role']}).")
-                st.rerun()
-        st.caption("Caso não possua acesso, procurar Helga ou Everson.")
-    else:
-        st.success(f"Logado como: **{st.session_state['user']['username']}** ({st.session_state['user']['role']})")
-        if st.button("Sair", use_container_width=True):
-            st.session_state.pop('user', None)
-            st.rerun()
-    
\ No newline at end of file
+import perf
+import streamlit as st
+from database import (obter_usuario, verificar_senha, iniciar_bootstrap, aguardar_bootstrap, admin_recem_criado,
+                      erro_bootstrap, obter_estudos_usuario)
+perf.marcar("imports do app")
+# from database_local import criar_tabelas, obter_usuario, verificar_senha
+
+st.set_page_config(page_title="Controle de Estoque", page_icon="🧪", layout="wide")
+
+st.title("🧪 Controle de Estoque de Farmácia")
+st.markdown("""
+Este aplicativo permite gerenciar entradas, saídas e controle de produtos de forma local.
+
+Perfis:
+- **Gestor**: acesso total (inclui Gestão de Acessos).
+- **Visualizador**: apenas **Visão Geral**.
+""")
+
+# --- Bootstrap: cria admin se tabela 'users' estiver vazia ---
+# Uma vez por processo e em segundo plano (ver database.iniciar_bootstrap);
+# se falhar, é refeito e o erro aparece junto do login.
+iniciar_bootstrap()
+if admin_recem_criado():
+    st.toast("🔑 Usuário admin criado (login: admin / senha: admin). Altere a senha em **Gestão de Acessos**.", icon="✅")
+
+with st.sidebar:
+    st.image("logo.png", use_container_width=True)
+    st.write("")  # pequeno espaçamento
+
+# --- Sidebar: Login / Logout ---
+with st.sidebar:
+    st.header("Acesso")
+    if 'user' not in st.session_state:
+        username = st.text_input("Usuário")
+        password = st.text_input("Senha", type="password")
+        if st.button("Entrar", use_container_width=True):
+            erro = aguardar_bootstrap()
+            if erro:
+                st.error(f"Falha ao preparar o banco: {erro}")
+            u = obter_usuario(username)
+            if not u or not u["is_active"] or not verificar_senha(password, u["password_hash"]):
+                st.error("Usuário ou senha inválidos.")
+            else:
+                # estudos: ids atribuídos em Gestão de Acessos (None = todos, [] = nenhum); as páginas só carregam esses
+                st.session_state['user'] = {"id": u["id"], "username": u["username"], "role": u["role"],
+                                            "estudos": obter_estudos_usuario(u["id"])}
+                st.success(f"Bem-vindo, {u['username']} ({u['role']}).")
+                st.rerun()
+        elif erro_bootstrap():
+            st.error(f"Falha ao preparar o banco (nova tentativa no login): {erro_bootstrap()}")
+        st.caption("Caso não possua acesso, procurar Helga ou Everson.")
+    else:
+        st.success(f"Logado como: **{st.session_state['user']['username']}** ({st.session_state['user']['role']})")
+        if st.button("Sair", use_container_width=True):
+            st.session_state.pop('user', None)
+            st.rerun()
+
+    if perf.ATIVO:
+        perf.marcar_uma_vez("primeira renderização")
+        st.divider()
+        st.caption("⏱️ Tempos de inicialização (ms desde o início)")
+        st.markdown("\n".join(f"- {etapa}: **{ms:.0f}**" for etapa, ms in perf.marcas()))
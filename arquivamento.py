@@ -0,0 +1,260 @@
+# arquivamento.py
+"""
+Arquivamento de lotes encerrados, para manter `movimentacoes` (o ledger
+quente) pequeno.
+
+Um lote (Estudo + Produto + Validade + Lote) está encerrado quando o saldo é
+zero e a última movimentação é mais antiga que o horizonte (CEMEC_ARQUIVO_DIAS,
+padrão 730 dias). O arquivamento:
+1. copia as movimentações desses lotes para `movimentacoes_arquivo` (upsert por id);
+2. grava um resumo por lote em `lotes_arquivados` (entradas, saídas, nº de
+   movimentações, primeira e última data), refeito a partir de todas as
+   movimentações arquivadas do lote (um lote reaberto e encerrado de novo
+   soma as duas vezes). Entradas e Saídas seguem a definição da Visão Geral:
+   sem as transferências entre localizações;
+3. exclui as movimentações de `movimentacoes`, lote inteiro por requisição.
+Cada etapa pode ser repetida: se o processo parar no meio, basta rodar de novo
+(as movimentações já copiadas que ficaram no ledger são concluídas na próxima
+execução).
+
+As páginas leem só o ledger quente; o arquivo aparece com a opção "Incluir
+arquivados" (Visão Geral usa os resumos, Lançamentos as movimentações) e nas
+exportações.
+
+Execução avulsa:
+    python arquivamento.py                     # simulação: lista o que seria arquivado
+    python arquivamento.py --executar [--dias N]
+    python arquivamento.py --exportar arquivo.csv
+    python arquivamento.py --refazer-resumos   # resumos de todos os lotes, a partir do arquivo
+"""
+import argparse
+import os
+from datetime import date, datetime, timezone
+import numpy as np
+import pandas as pd
+import streamlit as st
+from cubo import TRANSFERENCIA
+from integridade import chave_texto
+from supabase_db import get_data, init_connection
+from memoria import registrar_cache_data
+
+HORIZONTE_DIAS = int(os.environ.get("CEMEC_ARQUIVO_DIAS", "730"))
+TABELA_ARQUIVO = "movimentacoes_arquivo"
+TABELA_RESUMO = "lotes_arquivados"
+LOTE = ["estudo_id", "produto_id", "validade", "lote"]
+TAMANHO_LOTE_GRAVACAO = 500
+TTL_LEITURA_S = 600  # cache das leituras do arquivo ("Incluir arquivados")
+TTL_VERSAO_S = 30    # cache da versão: um arquivamento feito em outro processo aparece em até 30 s
+
+COLUNAS_RESUMO = LOTE + ["entradas", "saidas", "movimentacoes", "primeira_data", "ultima_data"]
+
+def _resumir(df) -> pd.DataFrame:
+    """
+    Um resumo por lote de `df` (validade/lote como texto, '' para vazio), com
+    as COLUNAS_RESUMO e o `saldo` com transferências (não gravado).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_RESUMO + ["saldo"])
+    qtd = pd.to_numeric(df["quantidade"], errors="coerce").fillna(0)
+    entrada, saida = df["tipo_transacao"] == "Entrada", df["tipo_transacao"] == "Saída"
+    transf = df["tipo_acao"] == TRANSFERENCIA if "tipo_acao" in df.columns else False
+    base = pd.DataFrame({
+        "id": df["id"].to_numpy(),
+        "estudo_id": df["estudo_id"].to_numpy(),
+        "produto_id": df["produto_id"].to_numpy(),
+        "validade": chave_texto(df["validade"]).to_numpy(),
+        "lote": chave_texto(df["lote"]).to_numpy(),
+        "data": pd.to_datetime(df["data"], errors="coerce").to_numpy(),
+        "entradas": np.where(entrada & ~transf, qtd, 0.0),
+        "saidas": np.where(saida & ~transf, qtd, 0.0),
+        "saldo": np.select([entrada, saida], [qtd, -qtd], 0.0),
+    })
+    return (
+        base.groupby(LOTE, sort=False)
+            .agg(entradas=("entradas", "sum"), saidas=("saidas", "sum"), movimentacoes=("id", "size"),
+                 primeira_data=("data", "min"), ultima_data=("data", "max"), saldo=("saldo", "sum"))
+            .reset_index()[COLUNAS_RESUMO + ["saldo"]]
+    )
+
+def _lote_de(df) -> pd.DataFrame:
+    """Chave de lote normalizada de cada linha de `df`, na ordem das linhas."""
+    return pd.DataFrame({
+        "estudo_id": df["estudo_id"].to_numpy(),
+        "produto_id": df["produto_id"].to_numpy(),
+        "validade": chave_texto(df["validade"]).to_numpy(),
+        "lote": chave_texto(df["lote"]).to_numpy(),
+    })
+
+def lotes_encerrados(df, horizonte_dias: int = HORIZONTE_DIAS, hoje: date = None):
+    """
+    Retorna (resumo, ids): um resumo por lote encerrado (validade/lote como
+    texto, '' para vazio) e os ids das movimentações desses lotes.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_RESUMO), []
+    hoje = hoje or date.today()
+    resumo = _resumir(df)
+    limite = pd.Timestamp(hoje) - pd.Timedelta(days=horizonte_dias)
+    encerrado = (resumo["saldo"].round(6) == 0) & (resumo["ultima_data"] < limite)
+    resumo = resumo.loc[encerrado, COLUNAS_RESUMO].reset_index(drop=True)
+    no_resumo = _lote_de(df).merge(resumo[LOTE].assign(_encerrado=True), on=LOTE, how="left")["_encerrado"]
+    ids = df["id"][no_resumo.fillna(False).astype(bool).to_numpy()].tolist()
+    return resumo, ids
+
+def _datas_iso(df, colunas):
+    return df.assign(**{c: pd.to_datetime(df[c]).dt.date.astype(str) for c in colunas})
+
+def _registros(df):
+    """DataFrame -> lista de dicts com tipos nativos (NaN vira None) para a API."""
+    return [
+        {k: (None if isinstance(v, float) and np.isnan(v) else v.item() if hasattr(v, "item") else v)
+         for k, v in linha.items()}
+        for linha in df.to_dict("records")
+    ]
+
+def _lotes_inteiros(df, ids) -> list:
+    """Ids em grupos de ~TAMANHO_LOTE_GRAVACAO sem partir lotes (um lote maior que isso vai sozinho)."""
+    linhas = df[df["id"].isin(ids)]
+    grupos, atual = [], []
+    for _, lote in linhas.groupby([_lote_de(linhas)[c].to_numpy() for c in LOTE], sort=False):
+        ids_lote = [int(x) for x in lote["id"]]
+        if atual and len(atual) + len(ids_lote) > TAMANHO_LOTE_GRAVACAO:
+            grupos.append(atual)
+            atual = []
+        atual += ids_lote
+    return grupos + ([atual] if atual else [])
+
+def arquivar(horizonte_dias: int = HORIZONTE_DIAS, executar: bool = False, hoje: date = None) -> dict:
+    """
+    Arquiva os lotes encerrados. Com `executar=False` só calcula o que seria
+    arquivado. Retorna um relatório com nº de lotes e de movimentações.
+
+    Pode ser repetido depois de uma execução interrompida: movimentações que
+    já estão no arquivo e continuam no ledger (cópia feita, exclusão não) são
+    concluídas, e o resumo de cada lote tocado é refeito a partir de
+    `movimentacoes_arquivo` (nunca somado ao anterior). A exclusão vem por
+    último, lote inteiro por requisição.
+    """
+    from database import upsert_data, delete_in  # gravações publicam no change feed
+    movs = pd.DataFrame(get_data("movimentacoes", "*") or [])
+    resumo, ids = lotes_encerrados(movs, horizonte_dias, hoje)
+    ja_arquivados = {r["id"] for r in get_data(TABELA_ARQUIVO, "id") or []} if not movs.empty else set()
+    pendentes = [int(x) for x in movs["id"] if x in ja_arquivados] if ja_arquivados else []
+    relatorio = {"lotes": len(resumo), "movimentacoes": len(ids), "pendentes": len(pendentes),
+                 "executado": False, "resumo": resumo}
+    if not executar or not (ids or pendentes):
+        return relatorio
+
+    agora = datetime.now(timezone.utc).isoformat()
+    arquivo = movs[movs["id"].isin(ids)].assign(arquivado_em=agora)
+    for i in range(0, len(arquivo), TAMANHO_LOTE_GRAVACAO):
+        upsert_data(TABELA_ARQUIVO, _registros(arquivo.iloc[i:i + TAMANHO_LOTE_GRAVACAO]), on_conflict="id")
+
+    # Resumos refeitos do arquivo para todos os lotes tocados (novos e interrompidos)
+    removidos = movs[movs["id"].isin(set(ids) | set(pendentes))]
+    tocados = _lote_de(removidos).drop_duplicates()
+    arquivadas = pd.DataFrame(get_data(TABELA_ARQUIVO, "*", estudos=tuple(tocados["estudo_id"].unique().tolist())) or [])
+    arquivadas = arquivadas[_lote_de(arquivadas).merge(tocados.assign(_tocado=True), on=LOTE, how="left")
+                            ["_tocado"].fillna(False).astype(bool).to_numpy()]
+    _gravar_resumos(arquivadas, agora)
+
+    for grupo in _lotes_inteiros(movs, set(ids) | set(pendentes)):
+        delete_in("movimentacoes", "id", grupo)
+    relatorio["executado"] = True
+    # Mesmo processo (ex.: chamado de uma página): descarta já as leituras em cache
+    versao_arquivo.clear()
+    _movimentacoes_arquivadas.clear()
+    _lotes_arquivados.clear()
+    return relatorio
+
+def _gravar_resumos(arquivadas, agora: str):
+    """Grava (upsert) o resumo de cada lote de `arquivadas`, que deve ter todas as movimentações arquivadas dele."""
+    from database import upsert_data
+    resumos = _datas_iso(_resumir(arquivadas)[COLUNAS_RESUMO], ["primeira_data", "ultima_data"])
+    upsert_data(TABELA_RESUMO, _registros(resumos.assign(arquivado_em=agora)), on_conflict=",".join(LOTE))
+
+def refazer_resumos() -> int:
+    """
+    Refaz o resumo de todos os lotes a partir de `movimentacoes_arquivo` (ex.:
+    resumos gravados antes de as transferências ficarem fora de Entradas e
+    Saídas). Retorna o nº de lotes.
+    """
+    arquivadas = pd.DataFrame(get_data(TABELA_ARQUIVO, "*") or [])
+    if arquivadas.empty:
+        return 0
+    _gravar_resumos(arquivadas, datetime.now(timezone.utc).isoformat())
+    versao_arquivo.clear()
+    _lotes_arquivados.clear()
+    return len(_lote_de(arquivadas).drop_duplicates())
+
+# ---------------------------
+# Leitura do arquivo (opção "Incluir arquivados")
+# ---------------------------
+# As leituras ficam em cache pela versão do arquivo, não só pelo TTL: um
+# arquivamento rodado em outro processo (linha de comando) muda a versão e,
+# vencido o TTL curto da versão, a próxima leitura já busca o arquivo novo.
+@st.cache_data(ttl=TTL_VERSAO_S, show_spinner=False)
+def versao_arquivo(escopo: tuple = None) -> str:
+    """
+    Versão do arquivo no escopo: o `arquivado_em` mais recente dos resumos de
+    lote (cada execução de `arquivar` grava o seu em todos os lotes que
+    arquiva). Consulta de uma linha, guardada por TTL_VERSAO_S segundos.
+    """
+    if escopo is not None and not escopo:
+        return ""
+    query = init_connection().table(TABELA_RESUMO).select("arquivado_em")
+    if escopo is not None:
+        query = query.in_("estudo_id", list(escopo))
+    linhas = query.order("arquivado_em", desc=True).limit(1).execute().data or []
+    return str(linhas[0].get("arquivado_em") or "") if linhas else ""
+
+def movimentacoes_arquivadas(escopo: tuple = None, versao: str = None) -> pd.DataFrame:
+    """Movimentações arquivadas dos estudos do escopo (None = todos)."""
+    return _movimentacoes_arquivadas(escopo, versao_arquivo(escopo) if versao is None else versao)
+
+def lotes_arquivados(escopo: tuple = None, versao: str = None) -> pd.DataFrame:
+    """Resumos dos lotes arquivados dos estudos do escopo (None = todos)."""
+    return _lotes_arquivados(escopo, versao_arquivo(escopo) if versao is None else versao)
+
+# Registradas na contabilidade de memória (memoria.py), que pode descartá-las pelo orçamento
+@st.cache_data(ttl=TTL_LEITURA_S, show_spinner=False)
+def _movimentacoes_arquivadas(escopo: tuple, versao: str) -> pd.DataFrame:
+    df = pd.DataFrame(get_data(TABELA_ARQUIVO, "*", estudos=escopo) or [])
+    registrar_cache_data(_movimentacoes_arquivadas, (escopo, versao), df, TTL_LEITURA_S)
+    return df
+
+@st.cache_data(ttl=TTL_LEITURA_S, show_spinner=False)
+def _lotes_arquivados(escopo: tuple, versao: str) -> pd.DataFrame:
+    df = pd.DataFrame(get_data(TABELA_RESUMO, "*", estudos=escopo) or [])
+    registrar_cache_data(_lotes_arquivados, (escopo, versao), df, TTL_LEITURA_S)
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquiva lotes encerrados de movimentacoes.")
+    parser.add_argument("--dias", type=int, default=HORIZONTE_DIAS,
+                        help=f"horizonte: última movimentação há mais de N dias (padrão {HORIZONTE_DIAS})")
+    parser.add_argument("--executar", action="store_true", help="grava (sem esta opção, só simula)")
+    parser.add_argument("--exportar", metavar="CSV", help="exporta as movimentações arquivadas para CSV e sai")
+    parser.add_argument("--refazer-resumos", action="store_true",
+                        help="refaz os resumos de todos os lotes a partir do arquivo e sai")
+    args = parser.parse_args()
+
+    if args.exportar:
+        arquivadas = pd.DataFrame(get_data(TABELA_ARQUIVO, "*") or [])
+        arquivadas.to_csv(args.exportar, index=False)
+        print(f"{len(arquivadas)} movimentação(ões) arquivada(s) exportada(s) para {args.exportar}.")
+        raise SystemExit(0)
+
+    if args.refazer_resumos:
+        print(f"{refazer_resumos()} resumo(s) de lote refeito(s) a partir do arquivo.")
+        raise SystemExit(0)
+
+    rel = arquivar(args.dias, executar=args.executar)
+    acao = "Arquivados" if rel["executado"] else "Seriam arquivados (simulação; use --executar)"
+    print(f"{acao}: {rel['lotes']} lote(s), {rel['movimentacoes']} movimentação(ões) "
+          f"com última movimentação há mais de {args.dias} dias.")
+    if rel["pendentes"]:
+        print(f"{rel['pendentes']} movimentação(ões) de uma execução interrompida "
+              f"{'concluída(s)' if rel['executado'] else 'a concluir'}.")
+    if rel["lotes"]:
+        print(rel["resumo"].to_string(index=False))
@@ -0,0 +1,99 @@
+# auditoria.py
+"""
+Trilha de auditoria: toda inclusão, alteração ou exclusão em `movimentacoes`,
+`users`, nos estudos atribuídos e nas tabelas de dimensão vira uma linha na
+tabela `auditoria` (só inserção; alterar ou apagar linhas dela é bloqueado).
+
+Cada linha guarda só o que mudou: numa alteração, os campos alterados com o
+valor de antes e o de depois; numa inclusão, os campos preenchidos; numa
+exclusão, a linha inteira (para poder reconstituí-la). Hashes de senha aparecem
+como "***".
+
+A gravação acontece na mesma operação da alteração:
+- Postgres/Supabase: trigger `registrar_auditoria` (migração 0005), na mesma
+  transação do insert/update/delete. O usuário do app chega no cabeçalho
+  CABECALHO_USUARIO de cada requisição de escrita (supabase_db.py);
+- backend local (backend_local.py): sob o mesmo lock da alteração.
+
+Consultas pelos índices (tabela, registro_id, em) e (em): `historico` de um
+registro e `alteracoes_do_periodo`.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+import pandas as pd
+from supabase_db import CABECALHO_USUARIO, init_connection
+
+TABELA = "auditoria"
+TABELAS_AUDITADAS = ("movimentacoes", "users", "usuarios_estudos", "estudos", "produtos",
+                     "localizacao", "tipo_acao", "tipo_produto")
+CAMPOS_MASCARADOS = {"password_hash"}
+MASCARA = "***"
+
+def _mascarar(campos):
+    if campos is None:
+        return None
+    return {k: (MASCARA if k in CAMPOS_MASCARADOS else v) for k, v in campos.items()}
+
+def registro_auditoria(tabela, operacao, antigo=None, novo=None, usuario=None, em=None):
+    """
+    Linha de auditoria de uma alteração (mesmo formato do trigger do Postgres),
+    ou None se um UPDATE não mudou nenhum campo.
+    """
+    antes = depois = None
+    if operacao == "INSERT":
+        depois = {k: v for k, v in novo.items() if v is not None}
+    elif operacao == "DELETE":
+        antes = dict(antigo)
+    else:
+        alterados = [k for k in novo if k in antigo and antigo[k] != novo[k]]
+        if not alterados:
+            return None
+        antes = {k: antigo[k] for k in alterados}
+        depois = {k: novo[k] for k in alterados}
+    return {
+        "tabela": tabela,
+        "registro_id": (novo or antigo or {}).get("id"),
+        "operacao": operacao,
+        "usuario": usuario,
+        "em": em or datetime.now(timezone.utc).isoformat(),
+        "antes": _mascarar(antes),
+        "depois": _mascarar(depois),
+    }
+
+# ---------------------------
+# Consultas
+# ---------------------------
+def historico(tabela: str, registro_id) -> pd.DataFrame:
+    """Alterações de um registro, da mais antiga para a mais recente."""
+    response = (
+        init_connection().table(TABELA).select("*")
+        .eq("tabela", tabela).eq("registro_id", int(registro_id))
+        .order("em").execute()
+    )
+    return pd.DataFrame(response.data or [])
+
+def alteracoes_do_periodo(inicio: date, fim: date = None, tabela: str = None) -> pd.DataFrame:
+    """Alterações feitas entre os dias `inicio` e `fim` (inclusive, em UTC), das mais recentes para as mais antigas."""
+    fim = fim or inicio
+    de = datetime.combine(inicio, time.min, tzinfo=timezone.utc).isoformat()
+    ate = datetime.combine(fim + timedelta(days=1), time.min, tzinfo=timezone.utc).isoformat()
+    consulta = init_connection().table(TABELA).select("*").gte("em", de).lt("em", ate)
+    if tabela:
+        consulta = consulta.eq("tabela", tabela)
+    return pd.DataFrame(consulta.order("em", desc=True).execute().data or [])
+
+def legivel(df) -> pd.DataFrame:
+    """Uma linha por campo alterado: quando, quem, operação, registro, campo, antes e depois."""
+    colunas = ["em", "usuario", "operacao", "tabela", "registro_id", "campo", "antes", "depois"]
+    linhas = []
+    for r in (df.to_dict("records") if not df.empty else []):
+        antes, depois = r.get("antes") or {}, r.get("depois") or {}
+        for campo in dict.fromkeys(list(antes) + list(depois)):
+            if campo == "id":
+                continue
+            linhas.append({**{c: r.get(c) for c in colunas[:5]}, "campo": campo,
+                           "antes": antes.get(campo), "depois": depois.get(campo)})
+    out = pd.DataFrame(linhas, columns=colunas)
+    if not out.empty:
+        out["em"] = pd.to_datetime(out["em"], errors="coerce", utc=True).dt.strftime("%d/%m/%Y %H:%M:%S")
+        out[["antes", "depois"]] = out[["antes", "depois"]].astype(object).where(out[["antes", "depois"]].notna(), "—").astype(str)
+    return out
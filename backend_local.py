@@ -0,0 +1,328 @@
+# backend_local.py
+"""
+Substituto local, em memória, do cliente Supabase (PostgREST).
+
+Implementa o subconjunto do query builder usado pelo app:
+    table().select(cols).eq().neq().is_().in_().gte().lte().order().limit().execute()
+    table().insert(dados).execute()
+    table().update(dados).eq(...).execute()
+    table().delete().eq(...).execute()
+    table().upsert(dados, on_conflict="col1,col2").execute()
+    rpc("saldo_lote", params).execute()
+com respostas no mesmo formato (`.data`, `.count`). Serve para desenvolvimento
+offline (CEMEC_BACKEND=local ou local:demo) e para o teste de carga
+(teste_carga.py), que também usa os contadores de chamadas e a latência
+simulada.
+
+Alterações nas tabelas auditadas geram as linhas de `auditoria` sob o mesmo
+lock, como o trigger do Postgres faz na mesma transação (ver auditoria.py).
+"""
+import copy
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from urllib.parse import unquote
+from auditoria import TABELA as TABELA_AUDITORIA, TABELAS_AUDITADAS, CABECALHO_USUARIO, registro_auditoria
+
+class RespostaLocal:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+    def __iter__(self):
+        # Igual ao APIResponse do postgrest: `data, count = resposta` devolve pares (campo, valor)
+        yield ("data", self.data)
+        yield ("count", self.count)
+
+class ConsultaLocal:
+    """Query builder encadeável sobre uma tabela do ClienteLocal."""
+
+    def __init__(self, cliente, tabela):
+        self._cliente = cliente
+        self._tabela = tabela
+        self._operacao = "select"
+        self._colunas = "*"
+        self._dados = None
+        self._filtros = []
+        self._ordem = []
+        self._limite = None
+        self.headers = {}   # como no postgrest: cabeçalhos enviados com a requisição
+
+    # --- Operações ---
+    def select(self, colunas="*", count=None):
+        self._operacao, self._colunas = "select", colunas
+        return self
+
+    def insert(self, dados, **_):
+        self._operacao, self._dados = "insert", dados
+        return self
+
+    def upsert(self, dados, on_conflict="id", **_):
+        self._operacao, self._dados = "upsert", dados
+        self._conflito = [c.strip() for c in on_conflict.split(",")]
+        return self
+
+    def update(self, dados, **_):
+        self._operacao, self._dados = "update", dados
+        return self
+
+    def delete(self, **_):
+        self._operacao = "delete"
+        return self
+
+    # --- Filtros ---
+    def _filtro(self, coluna, teste):
+        self._filtros.append((coluna, teste))
+        return self
+
+    def eq(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v == valor)
+
+    def neq(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v != valor)
+
+    def gt(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v is not None and v > valor)
+
+    def gte(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v is not None and v >= valor)
+
+    def lt(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v is not None and v < valor)
+
+    def lte(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v is not None and v <= valor)
+
+    def in_(self, coluna, valores):
+        valores = set(valores)
+        return self._filtro(coluna, lambda v: v in valores)
+
+    def is_(self, coluna, valor):
+        if valor in (None, "null"):
+            return self._filtro(coluna, lambda v: v is None)
+        return self._filtro(coluna, lambda v: v is valor or str(v).lower() == str(valor).lower())
+
+    def order(self, coluna, desc=False):
+        self._ordem.append((coluna, desc))
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def execute(self):
+        return self._cliente._executar(self)
+
+    def _casa(self, linha):
+        return all(teste(linha.get(coluna)) for coluna, teste in self._filtros)
+
+class ChamadaLocal:
+    """Chamada de função do banco (rpc), executada por FUNCOES_LOCAIS."""
+
+    def __init__(self, cliente, funcao, params):
+        self._cliente = cliente
+        self._funcao = funcao
+        self._params = dict(params or {})
+
+    def execute(self):
+        return self._cliente._executar_funcao(self._funcao, self._params)
+
+class ClienteLocal:
+    """Banco em memória (tabela -> lista de linhas), seguro para várias threads."""
+
+    def __init__(self, dados=None, latencia_ms: float = 0.0, identificar=None):
+        self._lock = threading.Lock()
+        self._tabelas = {}
+        self._proximo_id = {}
+        self.latencia_ms = latencia_ms
+        # Contagem de chamadas por chave (ex.: sessão simulada no teste de carga)
+        self.identificar = identificar
+        self.chamadas = Counter()
+        for tabela, linhas in (dados or {}).items():
+            self._tabelas[tabela] = [dict(l) for l in linhas]
+            self._proximo_id[tabela] = max((l.get("id") or 0 for l in linhas), default=0) + 1
+
+    def table(self, nome):
+        return ConsultaLocal(self, nome)
+
+    def rpc(self, funcao, params=None):
+        return ChamadaLocal(self, funcao, params)
+
+    def _executar(self, consulta):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        chave = self.identificar() if self.identificar else None
+        with self._lock:
+            self.chamadas[chave] += 1
+            if consulta._tabela == TABELA_AUDITORIA and consulta._operacao in ("update", "delete", "upsert"):
+                raise PermissionError("auditoria é somente inserção")
+            alteracoes = []   # (operação, antes, depois) para a auditoria
+            resposta = self._aplicar(consulta, alteracoes)
+            if alteracoes and consulta._tabela in TABELAS_AUDITADAS:
+                usuario = consulta.headers.get(CABECALHO_USUARIO)
+                usuario = unquote(usuario) if usuario else None  # como decodificar_cabecalho() no Postgres
+                linhas = self._tabelas.setdefault(TABELA_AUDITORIA, [])
+                for op, antes, depois in alteracoes:
+                    registro = registro_auditoria(consulta._tabela, op, antes, depois, usuario)
+                    if registro is not None:
+                        self._acrescentar(TABELA_AUDITORIA, linhas, registro)
+            return resposta
+
+    def _executar_funcao(self, funcao, params):
+        if funcao not in FUNCOES_LOCAIS:
+            raise ValueError(f"função {funcao} não existe no backend local")
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        chave = self.identificar() if self.identificar else None
+        with self._lock:
+            self.chamadas[chave] += 1
+            return RespostaLocal(FUNCOES_LOCAIS[funcao](self._tabelas, **params))
+
+    def _aplicar(self, consulta, alteracoes):
+        """Executa a consulta (chamado sob o lock), anotando as linhas alteradas em `alteracoes`."""
+        linhas = self._tabelas.setdefault(consulta._tabela, [])
+        op = consulta._operacao
+        if op == "upsert":
+            novos = consulta._dados if isinstance(consulta._dados, list) else [consulta._dados]
+            por_chave = {tuple(l.get(c) for c in consulta._conflito): l for l in linhas}
+            gravados = []
+            for registro in novos:
+                existente = por_chave.get(tuple(registro.get(c) for c in consulta._conflito))
+                if existente is not None:
+                    antes = dict(existente)
+                    existente.update(registro)
+                    alteracoes.append(("UPDATE", antes, dict(existente)))
+                    gravados.append(dict(existente))
+                    continue
+                registro = self._acrescentar(consulta._tabela, linhas, registro)
+                por_chave[tuple(registro.get(c) for c in consulta._conflito)] = registro
+                alteracoes.append(("INSERT", None, dict(registro)))
+                gravados.append(dict(registro))
+            return RespostaLocal(gravados, len(gravados))
+        if op == "insert":
+            novos = consulta._dados if isinstance(consulta._dados, list) else [consulta._dados]
+            inseridos = [dict(self._acrescentar(consulta._tabela, linhas, r)) for r in novos]
+            alteracoes.extend(("INSERT", None, r) for r in inseridos)
+            return RespostaLocal(inseridos, len(inseridos))
+        alvo = [l for l in linhas if consulta._casa(l)]
+        if op == "update":
+            for l in alvo:
+                antes = dict(l)
+                l.update(consulta._dados)
+                alteracoes.append(("UPDATE", antes, dict(l)))
+            return RespostaLocal([dict(l) for l in alvo], len(alvo))
+        if op == "delete":
+            ids = {id(l) for l in alvo}
+            self._tabelas[consulta._tabela] = [l for l in linhas if id(l) not in ids]
+            alteracoes.extend(("DELETE", dict(l), None) for l in alvo)
+            return RespostaLocal([dict(l) for l in alvo], len(alvo))
+        for coluna, desc in reversed(consulta._ordem):
+            alvo.sort(key=lambda l: (l.get(coluna) is None, l.get(coluna)), reverse=desc)
+        if consulta._limite is not None:
+            alvo = alvo[:consulta._limite]
+        return RespostaLocal(_projetar(alvo, consulta._colunas), len(alvo))
+
+    def _acrescentar(self, tabela, linhas, registro):
+        """Acrescenta uma cópia de `registro` à tabela, gerando o id se preciso (chamado sob o lock)."""
+        registro = dict(registro)
+        proximo = self._proximo_id.get(tabela, 1)
+        if registro.get("id") is None:
+            registro["id"] = proximo
+        self._proximo_id[tabela] = max(proximo, registro["id"] + 1)
+        linhas.append(registro)
+        return registro
+
+    def dump(self):
+        """Cópia de todas as tabelas (para inspeção e testes)."""
+        with self._lock:
+            return copy.deepcopy(self._tabelas)
+
+def _projetar(linhas, colunas):
+    if colunas.strip() == "*":
+        return [dict(l) for l in linhas]
+    campos = [c.strip() for c in colunas.split(",")]
+    return [{c: l.get(c) for c in campos} for l in linhas]
+
+# ---------------------------
+# Funções do banco (rpc)
+# ---------------------------
+def _saldo_lote(tabelas, p_estudo_id, p_produto_id, p_validade, p_lote, p_localizacao=None):
+    """Como saldo_lote() em migracoes/postgres/0004_saldos_lote.sql."""
+    saldo = 0
+    for l in tabelas.get("movimentacoes", []):
+        if (l.get("estudo_id"), l.get("produto_id"), l.get("validade"), l.get("lote")) != \
+                (p_estudo_id, p_produto_id, p_validade, p_lote):
+            continue
+        if p_localizacao is not None and l.get("localizacao") != (p_localizacao or None):
+            continue
+        if l.get("tipo_transacao") == "Entrada":
+            saldo += l.get("quantidade") or 0
+        elif l.get("tipo_transacao") == "Saída":
+            saldo -= l.get("quantidade") or 0
+    return saldo
+
+FUNCOES_LOCAIS = {"saldo_lote": _saldo_lote}
+
+# ---------------------------
+# Dados de demonstração
+# ---------------------------
+def dados_demo(n_movs: int = 2000, n_estudos: int = 5, n_produtos: int = 60, semente: int = 42, usuarios=()):
+    """
+    Base sintética: estudos, produtos, dimensões e `n_movs` movimentações que
+    nunca deixam um lote negativo. `usuarios`: linhas prontas para `users`.
+    """
+    rnd = random.Random(semente)
+    estudos = [{"id": i, "nome": f"Estudo {i:02d}"} for i in range(1, n_estudos + 1)]
+    tipos = ["Medicamento", "Kit", "Material", "Solução"]
+    nomes = ["Solução salina", "Dipirona", "Kit de coleta", "Seringa", "Água para injeção", "Heparina", "Luvas", "Álcool 70%"]
+    produtos = [
+        {"id": i, "nome": f"{rnd.choice(nomes)} {i}", "estudo_id": rnd.randint(1, n_estudos), "tipo_produto": rnd.choice(tipos)}
+        for i in range(1, n_produtos + 1)
+    ]
+    locais = ["Farmácia", "Freezer", "Geladeira", "Almoxarifado"]
+    movs, saldos = [], {}
+    inicio = date.today() - timedelta(days=3 * 365)
+    for i in range(1, n_movs + 1):
+        prod = rnd.choice(produtos)
+        lote = f"L{prod['id']:03d}-{rnd.randint(1, 4)}"
+        validade = (inicio + timedelta(days=365 + 200 * int(lote[-1]))).isoformat()
+        chave = (prod["id"], lote)
+        dia = inicio + timedelta(days=int(i * 3 * 365 / n_movs))
+        saida = saldos.get(chave, 0) > 0 and rnd.random() < 0.5
+        qtd = rnd.randint(1, saldos[chave]) if saida else rnd.randint(10, 100)
+        saldos[chave] = saldos.get(chave, 0) + (-qtd if saida else qtd)
+        movs.append({
+            "id": i, "data": dia.isoformat(), "tipo_transacao": "Saída" if saida else "Entrada",
+            "estudo_id": prod["estudo_id"], "produto_id": prod["id"], "tipo_produto": prod["tipo_produto"],
+            "quantidade": qtd, "validade": validade, "lote": lote, "nota": None,
+            "tipo_acao": "Dispensação" if saida else "Recebimento", "consideracoes": None,
+            "responsavel": "demo", "localizacao": locais[(prod["id"] + int(lote[-1])) % len(locais)],
+        })
+    return {
+        "movimentacoes": movs,
+        "estudos": estudos,
+        "produtos": produtos,
+        "localizacao": [{"id": i, "nome": n} for i, n in enumerate(locais, 1)],
+        "tipo_acao": [{"id": 1, "nome": "Recebimento"}, {"id": 2, "nome": "Dispensação"}, {"id": 3, "nome": "Ajuste"}],
+        "tipo_produto": [{"id": i, "nome": n} for i, n in enumerate(tipos, 1)],
+        "users": [dict(u, id=i) for i, u in enumerate(usuarios, 1)],
+    }
+
+_instancia = None
+_instancia_lock = threading.Lock()
+
+def cliente_local(modo: str = "") -> ClienteLocal:
+    """Cliente único do processo; `modo="demo"` semeia dados de demonstração na criação."""
+    global _instancia
+    with _instancia_lock:
+        if _instancia is None:
+            _instancia = ClienteLocal(dados_demo() if modo == "demo" else None)
+        return _instancia
+
+def configurar(cliente: ClienteLocal):
+    """Define o cliente local do processo (usado pelo teste de carga antes de abrir sessões)."""
+    global _instancia
+    with _instancia_lock:
+        _instancia = cliente
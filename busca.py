@@ -0,0 +1,113 @@
+# busca.py
+"""
+Índice de busca de produtos, insensível a acentos e maiúsculas.
+
+Nome do produto, estudo e tipo de produto são normalizados (sem acentos, em
+minúsculas) e quebrados em tokens, indexados por prefixo e por trigramas:
+"solucao" encontra "Solução Salina", "sal sol" também, e "soluçao salna"
+ainda encontra pelo trigrama. O índice é um derivado do repositório, montado
+uma vez por versão de `produtos`/`estudos` e compartilhado entre as sessões.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+# Peso de cada campo no ranking e do tipo de casamento do token
+PESOS_CAMPOS = {"nome": 1.0, "estudo": 0.5, "tipo_produto": 0.5}
+PESO_EXATO, PESO_PREFIXO, PESO_TRIGRAMA = 1.0, 0.8, 0.6
+SIMILARIDADE_MINIMA = 0.4
+
+def normalizar(texto) -> str:
+    """Minúsculas e sem acentos ("Solução" -> "solucao")."""
+    if texto is None:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+def tokenizar(texto) -> list:
+    return re.findall(r"[a-z0-9]+", normalizar(texto))
+
+def trigramas(token: str) -> set:
+    t = f"  {token} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+class IndiceBusca:
+    """Índice invertido (prefixos e trigramas de tokens) sobre documentos com campos de texto."""
+
+    def __init__(self, documentos):
+        """`documentos`: iterável de (id, {campo: texto}) com campos de PESOS_CAMPOS."""
+        self._rotulos = {}                       # id -> nome normalizado (desempate)
+        self._prefixos = defaultdict(dict)       # prefixo -> {id: peso}
+        self._exatos = defaultdict(dict)         # token -> {id: peso}
+        self._trigramas = defaultdict(set)       # trigrama -> {token}
+        for doc_id, campos in documentos:
+            self._rotulos[doc_id] = normalizar(campos.get("nome"))
+            for campo, peso in PESOS_CAMPOS.items():
+                for tok in tokenizar(campos.get(campo)):
+                    if self._exatos[tok].get(doc_id, 0) < peso:
+                        self._exatos[tok][doc_id] = peso
+                    for i in range(1, len(tok) + 1):
+                        p = self._prefixos[tok[:i]]
+                        if p.get(doc_id, 0) < peso:
+                            p[doc_id] = peso
+                    for tri in trigramas(tok):
+                        self._trigramas[tri].add(tok)
+
+    def __len__(self):
+        return len(self._rotulos)
+
+    def _pontuar_token(self, qtok: str) -> dict:
+        """Melhor pontuação de cada documento para um token da consulta."""
+        pontos = {}
+        for doc_id, peso in self._prefixos.get(qtok, {}).items():
+            pontos[doc_id] = peso * PESO_PREFIXO
+        for doc_id, peso in self._exatos.get(qtok, {}).items():
+            pontos[doc_id] = max(pontos.get(doc_id, 0), peso * PESO_EXATO)
+        if pontos:
+            return pontos
+        # Sem casamento por prefixo: tolera erros de digitação pela similaridade de trigramas
+        qtri = trigramas(qtok)
+        candidatos = set().union(*(self._trigramas.get(t, ()) for t in qtri)) if qtri else set()
+        for tok in candidatos:
+            ttri = trigramas(tok)
+            sim = len(qtri & ttri) / len(qtri | ttri)
+            if sim < SIMILARIDADE_MINIMA:
+                continue
+            for doc_id, peso in self._exatos[tok].items():
+                pontos[doc_id] = max(pontos.get(doc_id, 0), peso * PESO_TRIGRAMA * sim)
+        return pontos
+
+    def buscar(self, consulta: str, limite: int = None, ids=None) -> list:
+        """
+        Lista de (id, pontuação) em ordem de relevância. Todos os tokens da
+        consulta precisam casar com algum campo. `ids` restringe o universo
+        (ex.: produtos do estudo selecionado).
+        """
+        qtoks = tokenizar(consulta)
+        if not qtoks:
+            return []
+        total = None
+        for qtok in dict.fromkeys(qtoks):
+            pontos = self._pontuar_token(qtok)
+            if total is None:
+                total = pontos
+            else:
+                total = {d: total[d] + p for d, p in pontos.items() if d in total}
+            if not total:
+                return []
+        if ids is not None:
+            total = {d: p for d, p in total.items() if d in ids}
+        ranking = sorted(total.items(), key=lambda dp: (-dp[1], self._rotulos.get(dp[0], "")))
+        return ranking[:limite] if limite else ranking
+
+def indice_produtos(df_produtos, df_estudos) -> IndiceBusca:
+    """Índice sobre os produtos (nome, estudo e tipo de produto)."""
+    if df_produtos.empty:
+        return IndiceBusca([])
+    nomes_estudo = {} if df_estudos.empty else dict(zip(df_estudos["id"], df_estudos["nome"]))
+    return IndiceBusca(
+        (pid, {"nome": nome, "estudo": nomes_estudo.get(eid), "tipo_produto": tipo})
+        for pid, nome, eid, tipo in zip(
+            df_produtos["id"], df_produtos["nome"], df_produtos["estudo_id"], df_produtos["tipo_produto"]
+        )
+    )
@@ -0,0 +1,192 @@
+# cubo.py
+"""
+Cubo de saldos por Estudo + Produto + Validade + Lote + Localização.
+
+O ledger é agregado uma vez (por versão de `movimentacoes`, como derivado do
+repositório) na granularidade mais fina. Consultas por localização e rollups
+por qualquer subconjunto das dimensões partem desse cubo, que tem uma linha por
+lote e local, sem varrer o ledger de novo; cada rollup é guardado na primeira
+vez que é pedido.
+
+Transferências entre localizações são gravadas como um par Saída (origem) +
+Entrada (destino) com tipo de ação TRANSFERENCIA: o saldo do lote não muda e
+elas ficam separadas das Entradas/Saídas de fato no cubo.
+
+`alocar_fefo` reparte uma Saída entre os lotes de um produto pela validade mais
+próxima (FEFO), a partir dos saldos por lote do cubo numa localização
+(`CuboSaldos.saldos_lote`): a Saída é gravada nessa localização e só pode levar
+o que está guardado nela.
+
+`lotes_visao_geral` prepara as linhas por lote da Visão Geral (validade já
+convertida, farol e rótulos prontos), para os filtros da página serem só
+máscaras sobre elas.
+"""
+import threading
+from datetime import date
+import numpy as np
+import pandas as pd
+from integridade import chave_texto
+
+TRANSFERENCIA = "Transferência"
+DIMENSOES = ["estudo_id", "produto_id", "validade", "lote", "localizacao"]
+LOTE = DIMENSOES[:4]
+MEDIDAS = ["entradas", "saidas", "transf_entrada", "transf_saida", "saldo"]
+# Validade/lote como gravados no banco (as dimensões são normalizadas só para
+# agrupar); uma Saída gerada a partir do cubo grava estes, para cair no mesmo lote
+GRAVADOS = ["validade_gravada", "lote_gravado"]
+# Com Copy-on-Write (padrão a partir do pandas 3), uma cópia rasa já isola o cache
+# das alterações feitas nas páginas; em versões anteriores, só uma cópia profunda
+_COPIA_RASA_ISOLA = int(pd.__version__.split(".")[0]) >= 3
+
+def copia_de_leitura(df) -> pd.DataFrame:
+    """Cópia de um DataFrame guardado em cache para entregar a uma página."""
+    return df.copy(deep=not _COPIA_RASA_ISOLA)
+
+
+def montar_cubo(df) -> pd.DataFrame:
+    """Uma linha por lote e localização com entradas, saídas, transferências, saldo e os valores gravados."""
+    if df.empty:
+        return pd.DataFrame(columns=DIMENSOES + MEDIDAS + GRAVADOS)
+    qtd = pd.to_numeric(df["quantidade"], errors="coerce").fillna(0).to_numpy()
+    entrada = (df["tipo_transacao"] == "Entrada").to_numpy()
+    saida = (df["tipo_transacao"] == "Saída").to_numpy()
+    transf = (df["tipo_acao"] == TRANSFERENCIA).to_numpy() if "tipo_acao" in df.columns else np.zeros(len(df), bool)
+    base = pd.DataFrame({
+        "estudo_id": df["estudo_id"].to_numpy(),
+        "produto_id": df["produto_id"].to_numpy(),
+        "validade": chave_texto(df["validade"]).to_numpy(),
+        "lote": chave_texto(df["lote"]).to_numpy(),
+        "localizacao": chave_texto(df["localizacao"]).to_numpy() if "localizacao" in df.columns else "",
+        "entradas": np.where(entrada & ~transf, qtd, 0.0),
+        "saidas": np.where(saida & ~transf, qtd, 0.0),
+        "transf_entrada": np.where(entrada & transf, qtd, 0.0),
+        "transf_saida": np.where(saida & transf, qtd, 0.0),
+    })
+    grupos = base.groupby(DIMENSOES, sort=False)
+    cubo = grupos[MEDIDAS[:-1]].sum().reset_index()
+    cubo["saldo"] = cubo["entradas"] + cubo["transf_entrada"] - cubo["saidas"] - cubo["transf_saida"]
+    # Primeiro valor gravado de cada grupo, na ordem dos grupos do cubo (ngroup; -1 = chave nula, fora do cubo)
+    numero = grupos.ngroup().to_numpy()
+    gravados = pd.DataFrame({"validade_gravada": df["validade"].to_numpy(), "lote_gravado": df["lote"].to_numpy()})
+    cubo[GRAVADOS] = gravados[numero >= 0].groupby(numero[numero >= 0], sort=True).first().to_numpy()
+    return cubo
+
+class CuboSaldos:
+    """Cubo de saldos com rollups sob demanda (guardados por conjunto de dimensões)."""
+
+    def __init__(self, cubo: pd.DataFrame):
+        self._cubo = cubo
+        self._rollups = {}
+        self._lock = threading.Lock()
+        # Lote -> {localização: saldo}, para as consultas pontuais do formulário
+        self._por_lote = {}
+        for *chave, local, saldo in zip(*(cubo[c] for c in DIMENSOES), cubo["saldo"]):
+            self._por_lote.setdefault(tuple(chave), {})[local] = saldo
+
+    def __len__(self):
+        return len(self._cubo)
+
+    @property
+    def base(self) -> pd.DataFrame:
+        return copia_de_leitura(self._cubo)
+
+    def rollup(self, dimensoes) -> pd.DataFrame:
+        """Medidas somadas por `dimensoes` (subconjunto de DIMENSOES, em qualquer ordem)."""
+        dimensoes = tuple(dimensoes)
+        invalidas = set(dimensoes) - set(DIMENSOES)
+        if invalidas:
+            raise ValueError(f"Dimensões inválidas: {sorted(invalidas)}")
+        with self._lock:
+            pronto = self._rollups.get(dimensoes)
+        if pronto is None:
+            if not dimensoes:
+                pronto = self._cubo[MEDIDAS].sum().to_frame().T
+            elif self._cubo.empty:
+                pronto = pd.DataFrame(columns=list(dimensoes) + MEDIDAS)
+            else:
+                pronto = self._cubo.groupby(list(dimensoes), sort=False)[MEDIDAS].sum().reset_index()
+            with self._lock:
+                self._rollups[dimensoes] = pronto
+        return copia_de_leitura(pronto)
+
+    def saldos_lote(self, localizacao=None) -> pd.DataFrame:
+        """
+        Saldos por lote (LOTE + medidas + GRAVADOS): no total ou, com
+        `localizacao` ('' = sem localização), só nela.
+        """
+        if localizacao is None:
+            gravados = self._cubo.groupby(LOTE, sort=False)[GRAVADOS].first().reset_index()
+            return self.rollup(LOTE).merge(gravados, on=LOTE, how="left")
+        base = self._cubo[self._cubo["localizacao"] == _texto(localizacao)]
+        return base.drop(columns="localizacao").reset_index(drop=True)
+
+    def saldos_por_local(self, estudo_id, produto_id, validade, lote) -> dict:
+        """Localização -> saldo de um lote ('' = sem localização)."""
+        chave = (estudo_id, produto_id, _texto(validade), _texto(lote))
+        return dict(self._por_lote.get(chave, {}))
+
+    def saldo(self, estudo_id, produto_id, validade, lote, localizacao=None) -> float:
+        """Saldo de um lote, no total ou numa localização."""
+        por_local = self.saldos_por_local(estudo_id, produto_id, validade, lote)
+        if localizacao is None:
+            return sum(por_local.values())
+        return por_local.get(_texto(localizacao), 0.0)
+
+def _texto(valor) -> str:
+    """Mesma normalização das chaves do cubo para um valor avulso (date, str ou None)."""
+    if valor is None:
+        return ""
+    valor = valor.isoformat() if hasattr(valor, "isoformat") else str(valor).strip()
+    return "" if valor in ("N/A", "None", "nan") else valor
+
+def valor_gravado(valor):
+    """Valor de GRAVADOS para um payload de insert (None quando vazio)."""
+    return None if valor is None or valor == "" or (isinstance(valor, float) and np.isnan(valor)) else valor
+
+def alocar_fefo(lotes, quantidade, hoje: date = None):
+    """
+    Reparte `quantidade` entre `lotes` (colunas validade, lote e saldo, com
+    validade/lote como texto) pela validade mais próxima primeiro. Lotes
+    vencidos ou sem saldo ficam de fora; lotes sem validade vão por último.
+    Retorna (alocacao, falta): as linhas usadas com a coluna `quantidade` e o
+    que não coube no saldo disponível.
+    """
+    hoje = hoje or date.today()
+    validade_dt = pd.to_datetime(lotes["validade"], errors="coerce")
+    disponivel = lotes.assign(validade_dt=validade_dt)
+    disponivel = disponivel[(disponivel["saldo"] > 0) & ~(validade_dt < pd.Timestamp(hoje))]
+    disponivel = disponivel.sort_values(["validade_dt", "lote"], kind="mergesort", na_position="last")
+    saldo = disponivel["saldo"].to_numpy(dtype=float)
+    anterior = np.cumsum(saldo) - saldo
+    usado = np.clip(quantidade - anterior, 0, saldo)
+    alocacao = disponivel.drop(columns="validade_dt").assign(quantidade=usado)
+    return alocacao[alocacao["quantidade"] > 0].reset_index(drop=True), max(float(quantidade) - float(usado.sum()), 0.0)
+
+# Farol de validade: (limite de dias para vencer, cor); acima do último, 🟢
+FAROL = [(0, "🔴"), (31, "🟠"), (61, "🟡"), (91, "🔵")]
+
+def farois(validades, hoje: date = None) -> np.ndarray:
+    """Emoji do farol para cada validade ('' quando não há validade)."""
+    hoje = hoje or date.today()
+    dias = (pd.to_datetime(pd.Series(validades), errors="coerce") - pd.Timestamp(hoje)).dt.days.to_numpy(dtype=float)
+    cores = np.select([dias < limite for limite, _ in FAROL], [cor for _, cor in FAROL], "🟢")
+    return np.where(np.isnan(dias), "", cores)
+
+def lotes_visao_geral(lotes, hoje: date = None) -> pd.DataFrame:
+    """
+    Linhas por lote da Visão Geral a partir de `lotes` (chaves de LOTE com
+    entradas e saídas sem transferências): Entradas, Saidas, Saldo Total,
+    validade convertida (validade_dt), Farol e Validade (BR).
+    """
+    if lotes.empty:
+        return pd.DataFrame(columns=LOTE + ["Entradas", "Saidas", "Saldo Total", "validade_dt", "Farol", "Validade (BR)"])
+    base = lotes.groupby(LOTE, sort=False)[["entradas", "saidas"]].sum().reset_index()
+    validade_dt = pd.to_datetime(base["validade"], errors="coerce")
+    return base[LOTE].assign(
+        Entradas=base["entradas"].round(0).astype(int),
+        Saidas=base["saidas"].round(0).astype(int),
+        **{"Saldo Total": (base["entradas"] - base["saidas"]).round(0).astype(int)},
+        validade_dt=validade_dt,
+        Farol=farois(base["validade"], hoje),
+        **{"Validade (BR)": validade_dt.dt.strftime("%d/%m/%Y").fillna("—")},
+    )
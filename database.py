@@ -1,59 +1,213 @@
-# database.py
-from supabase_db import (
-    supabase,
-    obter_usuario,
-    criar_usuario,
-    atualizar_usuario,
-    deletar_usuario,
-    get_data,
-    insert_data,
-    update_data,
-    delete_data,
-    verificar_senha
-)
-import pandas as pd
-
-def conectar():
-    """Retorna o cliente Supabase. 'conn' será o objeto 'supabase'."""
-    return supabase
-
-def criar_tabelas():
-    # Supabase: tabelas criadas manualmente.
-    pass
-
-def obter_saldo(estudo_id, produto_id, validade, lote):
-    """
-    Retorna o saldo atual (Entradas - Saídas) para a combinação
-    Estudo + Produto + Validade + Lote, usando Supabase.
-    Trata None, '' e 'N/A' como nulos.
-    """
-    query = (
-        supabase
-        .table("movimentacoes")
-        .select("quantidade, tipo_transacao")
-        .eq("estudo_id", estudo_id)
-        .eq("produto_id", produto_id)
-    )
-
-    # --- Validade ---
-    if validade in (None, "", "N/A"):
-        query = query.is_("validade", "null")
-    else:
-        v = validade.isoformat() if hasattr(validade, "isoformat") else str(validade)
-        query = query.eq("validade", v)
-
-    # --- Lote ---
-    if not lote:
-        query = query.is_("lote", "null")
-    else:
-        query = query.eq("lote", str(lote))
-
-    response = query.execute()
-
-    if not getattr(response, "data", None):
-        return 0
-
-    df = pd.DataFrame(response.data)
-    entradas = df.loc[df["tipo_transacao"] == "Entrada", "quantidade"].sum()
-    saidas = df.loc[df["tipo_transacao"] == "Saída", "quantidade"].sum()
-    return int(entradas - saidas)
+# database.py
+import threading
+import time
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+from supabase_db import (
+    init_connection,
+    obter_usuario,
+    criar_usuario,
+    atualizar_usuario,
+    deletar_usuario,
+    get_data,
+    verificar_senha,
+    obter_estudos_usuario,
+    definir_estudos_usuario
+)
+import supabase_db
+from notificacoes import obter_feed, evento
+
+def conectar():
+    """Retorna o cliente Supabase (criado sob demanda no primeiro uso)."""
+    return init_connection()
+
+def criar_tabelas():
+    """
+    Aplica as migrações pendentes (migrar.py) quando CEMEC_DATABASE_URL aponta
+    para uma conexão direta com o banco; sem ela (só a API do Supabase), o
+    schema é mantido rodando `python migrar.py` à parte.
+    """
+    from migrar import migrar_configurado
+    return migrar_configurado()
+
+# --- Escrita: publica cada alteração no change feed (ver notificacoes.py) ---
+def _publicar(table_name, tipo, linhas):
+    feed = obter_feed()
+    if not linhas:
+        # Sem as linhas afetadas, os assinantes recarregam a tabela inteira
+        feed.publicar(evento(table_name, tipo))
+        return
+    for linha in linhas:
+        if tipo == "DELETE":
+            feed.publicar(evento(table_name, tipo, antigo=linha))
+        else:
+            feed.publicar(evento(table_name, tipo, novo=linha))
+
+def insert_data(table_name, data):
+    res = supabase_db.insert_data(table_name, data)
+    _publicar(table_name, "INSERT", res)
+    return res
+
+def update_data(table_name, data, eq_col, eq_val):
+    res = supabase_db.update_data(table_name, data, eq_col, eq_val)
+    _publicar(table_name, "UPDATE", res)
+    return res
+
+def delete_data(table_name, eq_col, eq_val):
+    res = supabase_db.delete_data(table_name, eq_col, eq_val)
+    _publicar(table_name, "DELETE", res)
+    return res
+
+def upsert_data(table_name, data, on_conflict="id"):
+    res = supabase_db.upsert_data(table_name, data, on_conflict)
+    _publicar(table_name, "UPDATE", res)
+    return res
+
+def delete_in(table_name, col, values):
+    res = supabase_db.delete_in(table_name, col, values)
+    # Exclusão em massa: um único evento sem linhas (os assinantes recarregam a tabela)
+    _publicar(table_name, "DELETE", None)
+    return res
+
+def assinar_alteracoes(callback):
+    """Assina o change feed do processo: `callback(evento)` a cada linha alterada."""
+    return obter_feed().assinar(callback)
+
+# --- Bootstrap: aplica migrações pendentes e cria admin se tabela 'users' estiver vazia ---
+# Roda uma única vez por processo, em segundo plano, para não pesar na
+# primeira requisição de cada sessão. Se falhar (ex.: banco fora do ar), o
+# erro aparece no login e o bootstrap é refeito: no próximo login ou, a
+# cada página, passados NOVA_TENTATIVA_S segundos.
+NOVA_TENTATIVA_S = 30.0
+_bootstrap = {"iniciado": False, "admin_criado": False, "avisado": False, "erro": None, "falhou_em": 0.0}
+_bootstrap_lock = threading.Lock()
+_bootstrap_thread = None
+
+def _garantir_admin():
+    erros = []
+    try:
+        criar_tabelas()
+    except Exception as e:
+        print(f"[migrar] migrações não aplicadas: {e}", flush=True)
+        erros.append(f"migrações não aplicadas ({e})")
+    try:
+        users_sample = get_data("users", "id", limit=1)
+        if not users_sample:
+            criar_usuario("admin", "admin", "gestor", True)
+            _bootstrap["admin_criado"] = True
+    except Exception as e:
+        # Ambiente sem Supabase configurado não deve travar a app
+        erros.append(f"usuário admin não verificado ({e})")
+    with _bootstrap_lock:
+        _bootstrap["erro"] = "; ".join(erros) or None
+        if erros:
+            _bootstrap["iniciado"] = False
+            _bootstrap["falhou_em"] = time.monotonic()
+
+def iniciar_bootstrap(forcar: bool = False):
+    """
+    Dispara o bootstrap do admin padrão, no máximo uma vez por processo. Depois
+    de uma falha, dispara de novo passados NOVA_TENTATIVA_S (ou já, com `forcar`).
+    """
+    global _bootstrap_thread
+    with _bootstrap_lock:
+        if _bootstrap["iniciado"]:
+            return
+        if _bootstrap["erro"] and not forcar and time.monotonic() - _bootstrap["falhou_em"] < NOVA_TENTATIVA_S:
+            return
+        _bootstrap["iniciado"] = True
+        _bootstrap_thread = threading.Thread(target=_garantir_admin, name="cemec-bootstrap", daemon=True)
+        add_script_run_ctx(_bootstrap_thread)  # permite usar o st.cache_resource do cliente
+        _bootstrap_thread.start()
+
+def aguardar_bootstrap(timeout: float = 10.0):
+    """
+    Espera o bootstrap terminar (usado no login, caso o admin ainda esteja
+    sendo criado), refazendo-o se a última tentativa falhou. Retorna o erro da
+    tentativa (ou None).
+    """
+    iniciar_bootstrap(forcar=True)
+    if _bootstrap_thread is not None:
+        _bootstrap_thread.join(timeout)
+    return erro_bootstrap()
+
+def erro_bootstrap():
+    """Erro da última tentativa de bootstrap (None se deu certo ou ainda não terminou)."""
+    with _bootstrap_lock:
+        return _bootstrap["erro"]
+
+def admin_recem_criado() -> bool:
+    """True uma única vez, quando o bootstrap acabou de criar o admin (para exibir o aviso)."""
+    with _bootstrap_lock:
+        if _bootstrap["admin_criado"] and not _bootstrap["avisado"]:
+            _bootstrap["avisado"] = True
+            return True
+    return False
+
+# Função saldo_lote() ausente (migração 0004 não aplicada): PostgREST responde
+# PGRST202 (ou 42883 do Postgres). Detectado uma vez por processo.
+_ERROS_FUNCAO_AUSENTE = {"PGRST202", "42883"}
+_saldo_rpc = {"disponivel": True}
+
+def obter_saldo(estudo_id, produto_id, validade, lote, localizacao=None):
+    """
+    Retorna o saldo atual (Entradas - Saídas) para a combinação
+    Estudo + Produto + Validade + Lote, somado no banco pela função
+    saldo_lote() (migração 0004), via RPC; num banco sem a migração, soma as
+    movimentações do lote trazidas pela API.
+    Trata None, '' e 'N/A' como nulos. Com `localizacao`, só o saldo
+    guardado naquele local ('' = sem local); sem ela, o saldo do lote em
+    todos os locais.
+    """
+    if validade in (None, "", "N/A"):
+        validade = None
+    else:
+        validade = validade.isoformat() if hasattr(validade, "isoformat") else str(validade)
+    lote = str(lote) if lote else None
+    if _saldo_rpc["disponivel"]:
+        try:
+            response = init_connection().rpc("saldo_lote", {
+                "p_estudo_id": estudo_id,
+                "p_produto_id": produto_id,
+                "p_validade": validade,
+                "p_lote": lote,
+                "p_localizacao": localizacao,
+            }).execute()
+            return int(response.data or 0)
+        except Exception as e:
+            if getattr(e, "code", None) not in _ERROS_FUNCAO_AUSENTE:
+                raise
+            _saldo_rpc["disponivel"] = False
+    return _saldo_somado(estudo_id, produto_id, validade, lote, localizacao)
+
+def _saldo_somado(estudo_id, produto_id, validade, lote, localizacao):
+    """obter_saldo sem a função do banco: traz as movimentações do lote e soma aqui."""
+    query = (
+        init_connection()
+        .table("movimentacoes")
+        .select("quantidade, tipo_transacao")
+        .eq("estudo_id", estudo_id)
+        .eq("produto_id", produto_id)
+    )
+    query = query.is_("validade", "null") if validade is None else query.eq("validade", validade)
+    query = query.is_("lote", "null") if lote is None else query.eq("lote", lote)
+    if localizacao is not None:
+        query = query.eq("localizacao", localizacao) if localizacao else query.is_("localizacao", "null")
+    linhas = query.execute().data or []
+    # Soma direta (sem pandas): poucas linhas e evita importar pandas no caminho do login
+    entradas = sum(r["quantidade"] or 0 for r in linhas if r["tipo_transacao"] == "Entrada")
+    saidas = sum(r["quantidade"] or 0 for r in linhas if r["tipo_transacao"] == "Saída")
+    return int(entradas - saidas)
+
+def obter_movimentacoes_produtos(estudo_id, produto_ids,
+                                 colunas="estudo_id, produto_id, validade, lote, localizacao, "
+                                         "quantidade, tipo_transacao, tipo_acao"):
+    """Movimentações de vários produtos de um estudo numa única consulta (para conferir saldos em lote)."""
+    response = (
+        init_connection()
+        .table("movimentacoes")
+        .select(colunas)
+        .eq("estudo_id", estudo_id)
+        .in_("produto_id", list(produto_ids))
+        .execute()
+    )
+    return response.data or []
@@ -0,0 +1,129 @@
+# integridade.py
+"""
+Verificação de integridade do ledger: nenhum lote pode ficar com saldo negativo
+em nenhum ponto do seu histórico.
+
+O ledger é ordenado por lote (Estudo + Produto + Validade + Lote), data e id, e
+o saldo corrido de cada lote é uma soma cumulativa agrupada (vetorizada) das
+quantidades com sinal (+Entrada, -Saída).
+
+- `verificar_ledger`: checagem em lote do ledger inteiro.
+- `verificar_alteracao`: checagem incremental de uma edição/exclusão, antes de
+  gravá-la, olhando só os lotes que ela toca.
+- `chave_texto`: normalização das chaves de texto, compartilhada com os
+  outros módulos que agrupam por lote.
+
+Execução avulsa (relatório do banco inteiro):
+    python integridade.py
+"""
+import numpy as np
+import pandas as pd
+
+CHAVE_LOTE = ["estudo_id", "produto_id", "validade", "lote"]
+
+def chave_texto(serie):
+    """Chave (validade, lote, localização...) como texto, com None, '' e 'N/A' tratados como o mesmo valor nulo ('')."""
+    texto = serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+    return texto.replace({"N/A": "", "None": "", "nan": ""})
+
+def _preparar(df):
+    """Chaves normalizadas, data parseada e movimento com sinal."""
+    tipo = df["tipo_transacao"]
+    sinal = np.select([tipo == "Entrada", tipo == "Saída"], [1.0, -1.0], 0.0)
+    return pd.DataFrame({
+        "id": df["id"].to_numpy(),
+        "estudo_id": df["estudo_id"].to_numpy(),
+        "produto_id": df["produto_id"].to_numpy(),
+        "validade": chave_texto(df["validade"]).to_numpy(),
+        "lote": chave_texto(df["lote"]).to_numpy(),
+        "data": pd.to_datetime(df["data"], errors="coerce").to_numpy(),
+        "movimento": pd.to_numeric(df["quantidade"], errors="coerce").fillna(0).to_numpy() * sinal,
+    })
+
+def saldos_corridos(df) -> pd.DataFrame:
+    """Ledger ordenado por lote, data e id, com o saldo corrido de cada lote após cada linha."""
+    base = _preparar(df).sort_values(CHAVE_LOTE + ["data", "id"], kind="mergesort", na_position="last")
+    base["saldo_corrido"] = base.groupby(CHAVE_LOTE, sort=False)["movimento"].cumsum()
+    return base.reset_index(drop=True)
+
+def verificar_ledger(df):
+    """
+    Retorna (lotes, linhas):
+    - lotes: um registro por lote que ficou negativo (primeira data negativa,
+      menor saldo, nº de linhas negativas e saldo final);
+    - linhas: cada movimentação após a qual o saldo do lote ficou abaixo de zero.
+    Ambos vazios quando o ledger está íntegro.
+    """
+    if df.empty:
+        return _vazio_lotes(), _vazio_linhas()
+    base = saldos_corridos(df)
+    linhas = base[base["saldo_corrido"] < 0]
+    if linhas.empty:
+        return _vazio_lotes(), _vazio_linhas()
+    lotes = (
+        linhas.groupby(CHAVE_LOTE, sort=False)
+              .agg(primeira_data=("data", "min"),
+                   primeiro_id=("id", "first"),
+                   menor_saldo=("saldo_corrido", "min"),
+                   linhas_negativas=("id", "size"))
+              .reset_index()
+    )
+    finais = base.groupby(CHAVE_LOTE, sort=False)["saldo_corrido"].last().rename("saldo_final").reset_index()
+    lotes = lotes.merge(finais, on=CHAVE_LOTE, how="left")
+    return lotes, linhas[CHAVE_LOTE + ["id", "data", "movimento", "saldo_corrido"]].reset_index(drop=True)
+
+def verificar_alteracao(df, registro_id, alteracoes=None):
+    """
+    Checa, antes de gravar, a edição (`alteracoes` = campos novos) ou a exclusão
+    (`alteracoes=None`) da movimentação `registro_id`. Só os lotes de antes e de
+    depois da alteração são recalculados. Retorna (lotes, linhas) como
+    `verificar_ledger`, apenas com os lotes que a alteração deixa negativos ou
+    ainda mais negativos do que já estavam.
+    """
+    antes = df[df["id"] == registro_id]
+    if antes.empty:
+        return _vazio_lotes(), _vazio_linhas()
+    depois = antes.copy()
+    for campo, valor in (alteracoes or {}).items():
+        if campo in depois.columns:
+            depois[campo] = [valor]
+
+    # Só as linhas dos lotes tocados (pré-filtro barato por estudo/produto)
+    chaves = pd.concat([_preparar(antes), _preparar(depois)])[CHAVE_LOTE].drop_duplicates()
+    pares = df["estudo_id"].isin(chaves["estudo_id"]) & df["produto_id"].isin(chaves["produto_id"])
+    candidatas = df[pares]
+    no_lote = pd.MultiIndex.from_frame(_preparar(candidatas)[CHAVE_LOTE]).isin(pd.MultiIndex.from_frame(chaves))
+    sub_antes = candidatas[no_lote]
+    sub_depois = sub_antes[sub_antes["id"] != registro_id]
+    if alteracoes is not None:
+        sub_depois = pd.concat([sub_depois, depois], ignore_index=True)
+
+    lotes_antes, _ = verificar_ledger(sub_antes)
+    lotes_depois, linhas_depois = verificar_ledger(sub_depois)
+    if lotes_depois.empty:
+        return lotes_depois, linhas_depois
+    comparacao = lotes_depois.merge(
+        lotes_antes[CHAVE_LOTE + ["menor_saldo"]], on=CHAVE_LOTE, how="left", suffixes=("", "_antes")
+    )
+    piora = comparacao["menor_saldo"] < comparacao["menor_saldo_antes"].fillna(0)
+    lotes = comparacao.loc[piora, lotes_depois.columns].reset_index(drop=True)
+    linhas = linhas_depois.merge(lotes[CHAVE_LOTE], on=CHAVE_LOTE, how="inner")
+    return lotes, linhas
+
+def _vazio_lotes():
+    return pd.DataFrame(columns=CHAVE_LOTE + ["primeira_data", "primeiro_id", "menor_saldo", "linhas_negativas", "saldo_final"])
+
+def _vazio_linhas():
+    return pd.DataFrame(columns=CHAVE_LOTE + ["id", "data", "movimento", "saldo_corrido"])
+
+if __name__ == "__main__":
+    from supabase_db import get_data
+    lotes, linhas = verificar_ledger(pd.DataFrame(get_data("movimentacoes", "*") or []))
+    if lotes.empty:
+        print("Ledger íntegro: nenhum lote com saldo negativo.")
+    else:
+        print(f"{len(lotes)} lote(s) com saldo negativo em {len(linhas)} movimentação(ões):")
+        print(lotes.to_string(index=False))
+        print()
+        print(linhas.to_string(index=False))
+        raise SystemExit(1)
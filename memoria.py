@@ -0,0 +1,185 @@
+# memoria.py
+"""
+Contabilidade de memória dos dados guardados pelo app e orçamento global com
+despejo LRU.
+
+Consumidores contabilizados:
+- repositórios (repositorio.py), um por escopo de estudos: as tabelas
+  carregadas e cada agregado derivado;
+- motores de relatórios (relatorios.py): bases mensais e pivôs guardados;
+- st.cache_data (arquivamento.py): movimentações e lotes arquivados, pelo
+  tamanho no momento do cálculo (acertos no cache não atualizam o último uso);
+- st.session_state: cada execução de página registra o estado da própria
+  sessão (`registrar_sessao`).
+
+Cada consumidor informa suas entradas como dicts {"nome", "bytes", "usado_em"
+(time.monotonic), "descartar" (função ou None), "ordem"}. Os tamanhos dos
+DataFrames são medidos uma vez por versão (memory_usage profundo).
+
+Com CEMEC_MEMORIA_MB definido, `aplicar_orcamento` (chamado por
+`registrar_sessao` a cada execução de página) descarta entradas recalculáveis,
+da usada há mais tempo para a mais recente, até o total caber no orçamento.
+Descartar só custa um recálculo ou uma releitura do banco na próxima vez que o
+dado for pedido. Entradas usadas nos últimos IDADE_MINIMA_S segundos e o
+session_state das sessões não são descartados; no empate, derivados e pivôs
+saem antes das bases e das tabelas de que dependem.
+"""
+import os
+import sys
+import threading
+import time
+from functools import partial
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+ORCAMENTO_BYTES = int(float(os.environ.get("CEMEC_MEMORIA_MB", "0")) * 1e6)  # 0 = sem limite
+IDADE_MINIMA_S = 30.0        # entradas usadas há menos tempo que isso não são descartadas
+SESSAO_INATIVA_S = 3600.0    # sessões sem execução há mais tempo saem da contabilidade
+
+_lock = threading.Lock()
+_cache_data = {}   # (função, argumentos) -> entrada
+_sessoes = {}      # id da sessão -> entrada
+_despejos = {"entradas": 0, "bytes": 0}
+
+def tamanho(valor, _vistos=None) -> int:
+    """Bytes aproximados de um objeto (DataFrames pelo memory_usage profundo, contêineres somando os itens)."""
+    vistos = set() if _vistos is None else _vistos
+    if id(valor) in vistos:
+        return 0
+    vistos.add(id(valor))
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, (pd.Series, pd.Index)):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    total = sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        total += sum(tamanho(k, vistos) + tamanho(v, vistos) for k, v in valor.items())
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        total += sum(tamanho(v, vistos) for v in valor)
+    elif hasattr(valor, "__dict__") and not isinstance(valor, type):
+        # Objetos do app (ex.: CuboSaldos, índice de busca): os atributos
+        total += tamanho(vars(valor), vistos)
+    return total
+
+# ---------------------------
+# Registro de st.cache_data e st.session_state
+# ---------------------------
+def registrar_cache_data(funcao, args: tuple, valor, ttl: float):
+    """Chamada de dentro de uma função com @st.cache_data: registra o valor calculado para `args`."""
+    agora, bytes_ = time.monotonic(), tamanho(valor)
+    with _lock:
+        _cache_data[(funcao, args)] = {
+            "nome": f"{getattr(funcao, '__name__', funcao)}{args}",
+            "bytes": bytes_,
+            "usado_em": agora,
+            "expira_em": agora + ttl,
+            "descartar": partial(_descartar_cache_data, funcao, args),
+            "ordem": 1,
+        }
+
+def _descartar_cache_data(funcao, args):
+    funcao.clear(*args)
+    with _lock:
+        _cache_data.pop((funcao, args), None)
+
+def registrar_sessao():
+    """Registra o tamanho do st.session_state desta sessão e aplica o orçamento (início de cada página)."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    estado = {k: st.session_state[k] for k in list(st.session_state.keys())}
+    agora, bytes_ = time.monotonic(), tamanho(estado)
+    with _lock:
+        _sessoes[ctx.session_id] = {
+            "nome": (estado.get("user") or {}).get("username") or "(sem login)",
+            "bytes": bytes_,
+            "usado_em": agora,
+            "descartar": None,
+            "ordem": 3,
+        }
+        for sessao in [s for s, e in _sessoes.items() if agora - e["usado_em"] > SESSAO_INATIVA_S]:
+            del _sessoes[sessao]
+    aplicar_orcamento()
+
+# ---------------------------
+# Contabilidade e orçamento
+# ---------------------------
+def _rotulo_escopo(escopo):
+    return "todos os estudos" if escopo is None else "estudos " + ", ".join(map(str, escopo))
+
+def entradas() -> list:
+    """Todas as entradas contabilizadas, cada uma com o consumidor dono dela."""
+    from repositorio import repositorios_ativos
+    from relatorios import motores_ativos
+    todas = []
+    for escopo, repo in repositorios_ativos().items():
+        todas += [{**e, "consumidor": f"Repositório ({_rotulo_escopo(escopo)})"} for e in repo.entradas_memoria()]
+    for escopo, motor in motores_ativos().items():
+        todas += [{**e, "consumidor": f"Relatórios ({_rotulo_escopo(escopo)})"} for e in motor.entradas_memoria()]
+    agora = time.monotonic()
+    with _lock:
+        for chave in [c for c, e in _cache_data.items() if e["expira_em"] < agora]:
+            del _cache_data[chave]
+        todas += [{**e, "consumidor": "st.cache_data"} for e in _cache_data.values()]
+        todas += [{**e, "consumidor": "st.session_state"} for e in _sessoes.values()]
+    return todas
+
+def aplicar_orcamento(orcamento: int = None) -> list:
+    """
+    Descarta entradas (LRU) até o total caber em `orcamento` bytes (padrão:
+    CEMEC_MEMORIA_MB). Retorna as entradas descartadas.
+    """
+    orcamento = ORCAMENTO_BYTES if orcamento is None else orcamento
+    if not orcamento:
+        return []
+    todas = entradas()
+    total = sum(e["bytes"] for e in todas)
+    if total <= orcamento:
+        return []
+    limite = time.monotonic() - IDADE_MINIMA_S
+    candidatas = sorted((e for e in todas if e["descartar"] is not None and e["usado_em"] < limite),
+                        key=lambda e: (e["usado_em"], e["ordem"]))
+    descartadas = []
+    for entrada in candidatas:
+        if total <= orcamento:
+            break
+        if entrada["descartar"]() is False:
+            continue  # ocupada (ex.: carga em andamento); fica para a próxima
+        total -= entrada["bytes"]
+        descartadas.append(entrada)
+    if descartadas:
+        with _lock:
+            _despejos["entradas"] += len(descartadas)
+            _despejos["bytes"] += sum(e["bytes"] for e in descartadas)
+    return descartadas
+
+def relatorio(top: int = None) -> pd.DataFrame:
+    """Maiores consumidores: uma linha por entrada, da maior para a menor."""
+    agora = time.monotonic()
+    linhas = [{
+        "Consumidor": e["consumidor"],
+        "Item": e["nome"],
+        "MB": e["bytes"] / 1e6,
+        "Último uso (s)": round(agora - e["usado_em"]) if e["usado_em"] else None,
+        "Descartável": e["descartar"] is not None,
+    } for e in entradas()]
+    df = pd.DataFrame(linhas, columns=["Consumidor", "Item", "MB", "Último uso (s)", "Descartável"])
+    df = df.sort_values("MB", ascending=False, ignore_index=True)
+    return df.head(top) if top else df
+
+def resumo() -> dict:
+    """Total contabilizado, orçamento e despejos feitos desde o início do processo."""
+    todas = entradas()
+    with _lock:
+        despejos = dict(_despejos)
+    return {
+        "total_bytes": sum(e["bytes"] for e in todas),
+        "orcamento_bytes": ORCAMENTO_BYTES,
+        "sessoes": sum(e["consumidor"] == "st.session_state" for e in todas),
+        "despejos": despejos["entradas"],
+        "bytes_despejados": despejos["bytes"],
+    }
@@ -0,0 +1,55 @@
+-- 0001_schema_inicial.sql (Postgres/Supabase)
+-- Tabelas do app. "if not exists": em bancos criados à mão pelo painel do
+-- Supabase, as tabelas existentes ficam como estão.
+
+create table if not exists estudos (
+  id bigint generated by default as identity primary key,
+  nome text not null
+);
+
+create table if not exists localizacao (
+  id bigint generated by default as identity primary key,
+  nome text not null
+);
+
+create table if not exists tipo_acao (
+  id bigint generated by default as identity primary key,
+  nome text not null
+);
+
+create table if not exists tipo_produto (
+  id bigint generated by default as identity primary key,
+  nome text not null
+);
+
+create table if not exists produtos (
+  id bigint generated by default as identity primary key,
+  nome text not null,
+  estudo_id bigint references estudos(id),
+  tipo_produto text
+);
+
+create table if not exists users (
+  id bigint generated by default as identity primary key,
+  username text not null,
+  password_hash text not null,
+  role text not null default 'visualizador',
+  is_active boolean not null default true
+);
+
+create table if not exists movimentacoes (
+  id bigint generated by default as identity primary key,
+  data date not null,
+  tipo_transacao text not null,
+  estudo_id bigint references estudos(id),
+  produto_id bigint references produtos(id),
+  tipo_produto text,
+  quantidade numeric not null,
+  validade date,
+  lote text,
+  nota text,
+  tipo_acao text,
+  consideracoes text,
+  responsavel text,
+  localizacao text
+);
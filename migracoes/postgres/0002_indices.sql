@@ -0,0 +1,15 @@
+-- 0002_indices.sql
+-- Índices dos caminhos de acesso do app (ver CONSULTAS_QUENTES em migrar.py).
+
+-- obter_saldo, obter_movimentacoes_produtos e o filtro por escopo de estudos
+-- (o prefixo estudo_id / estudo_id + produto_id também usa este índice)
+create index if not exists ix_movimentacoes_lote on movimentacoes (estudo_id, produto_id, validade, lote);
+
+-- Lançamentos e relatórios por período
+create index if not exists ix_movimentacoes_data on movimentacoes (data);
+
+-- Produtos de um estudo (cadastro e formulários de movimentação)
+create index if not exists ix_produtos_estudo on produtos (estudo_id);
+
+-- Login: um usuário por username (falha se já houver duplicados; resolva antes de migrar)
+create unique index if not exists ux_users_username on users (username);
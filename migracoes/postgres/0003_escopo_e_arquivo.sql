@@ -0,0 +1,28 @@
+-- 0003_escopo_e_arquivo.sql (Postgres/Supabase)
+-- Estudos por usuário (Gestão de Acessos) e arquivo de lotes encerrados (arquivamento.py).
+
+create table if not exists usuarios_estudos (
+  id bigint generated by default as identity primary key,
+  usuario_id bigint not null references users(id) on delete cascade,
+  estudo_id bigint not null references estudos(id) on delete cascade,
+  unique (usuario_id, estudo_id)
+);
+
+create table if not exists movimentacoes_arquivo (like movimentacoes including all);
+alter table movimentacoes_arquivo add column if not exists arquivado_em timestamptz;
+create index if not exists ix_movimentacoes_arquivo_estudo on movimentacoes_arquivo (estudo_id);
+
+create table if not exists lotes_arquivados (
+  id bigint generated by default as identity primary key,
+  estudo_id bigint not null,
+  produto_id bigint not null,
+  validade text not null default '',
+  lote text not null default '',
+  entradas numeric,
+  saidas numeric,
+  movimentacoes integer,
+  primeira_data date,
+  ultima_data date,
+  arquivado_em timestamptz,
+  unique (estudo_id, produto_id, validade, lote)
+);
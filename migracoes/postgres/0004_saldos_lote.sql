@@ -0,0 +1,18 @@
+-- 0004_saldos_lote.sql (Postgres/Supabase)
+-- Saldo de um lote calculado no banco, servido pelo índice ix_movimentacoes_lote:
+-- database.obter_saldo chama esta função via RPC em vez de trazer as
+-- movimentações do lote. p_localizacao null = todos os locais; '' = sem local.
+
+create or replace function saldo_lote(p_estudo_id bigint, p_produto_id bigint, p_validade date,
+                                      p_lote text, p_localizacao text default null)
+returns numeric
+language sql stable as $$
+  select coalesce(sum(case when tipo_transacao = 'Entrada' then quantidade
+                           when tipo_transacao = 'Saída' then -quantidade else 0 end), 0)
+    from movimentacoes
+   where estudo_id = p_estudo_id
+     and produto_id = p_produto_id
+     and validade is not distinct from p_validade
+     and lote is not distinct from p_lote
+     and (p_localizacao is null or localizacao is not distinct from nullif(p_localizacao, ''))
+$$;
@@ -0,0 +1,89 @@
+-- 0005_auditoria.sql (Postgres/Supabase)
+-- Trilha de auditoria (auditoria.py): uma linha por inclusão, alteração ou
+-- exclusão nas tabelas auditadas, gravada pelo trigger na mesma transação da
+-- alteração. Só os campos alterados são guardados; o usuário do app vem do
+-- cabeçalho x-cemec-usuario da requisição (PostgREST expõe os cabeçalhos em
+-- request.headers), codificado como URL.
+
+create table if not exists auditoria (
+  id bigint generated by default as identity primary key,
+  tabela text not null,
+  registro_id bigint,
+  operacao text not null,
+  usuario text,
+  em timestamptz not null default now(),
+  antes jsonb,
+  depois jsonb
+);
+
+-- Histórico de um registro e alterações de um período
+create index if not exists ix_auditoria_registro on auditoria (tabela, registro_id, em);
+create index if not exists ix_auditoria_em on auditoria (em);
+
+-- Cabeçalhos HTTP só levam ASCII: supabase_db.py envia o usuário codificado
+-- (urllib.parse.quote) e a trilha guarda o nome decodificado
+create or replace function decodificar_cabecalho(p text) returns text
+language sql immutable strict as $$
+  select convert_from(coalesce(string_agg(
+           case when t.m[1] is not null then decode(substr(t.m[1], 2), 'hex')
+                else convert_to(t.m[2], 'UTF8') end, ''::bytea order by t.n), ''::bytea), 'UTF8')
+    from regexp_matches(p, '(%[0-9A-Fa-f]{2})|([^%]+|%)', 'g') with ordinality as t(m, n)
+$$;
+
+create or replace function registrar_auditoria() returns trigger
+language plpgsql security definer set search_path = public as $$
+declare
+  v_antes jsonb := case when tg_op <> 'INSERT' then to_jsonb(old) end;
+  v_depois jsonb := case when tg_op <> 'DELETE' then to_jsonb(new) end;
+  v_id bigint := (coalesce(v_depois, v_antes) ->> 'id')::bigint;
+  v_usuario text := coalesce(
+    decodificar_cabecalho(nullif(current_setting('request.headers', true), '')::json ->> 'x-cemec-usuario'),
+    current_user
+  );
+begin
+  if tg_op = 'UPDATE' then
+    -- Só os campos alterados, com o valor de antes e o de depois
+    select jsonb_object_agg(a.key, a.value), jsonb_object_agg(a.key, v_depois -> a.key)
+      into v_antes, v_depois
+      from jsonb_each(v_antes) a
+     where a.value is distinct from v_depois -> a.key;
+    if v_antes is null then
+      return null;  -- nenhum campo mudou
+    end if;
+  elsif tg_op = 'INSERT' then
+    v_depois := jsonb_strip_nulls(v_depois);
+  end if;
+  -- Hash de senha: registra que mudou, sem o valor
+  if v_antes ? 'password_hash' then v_antes := v_antes || '{"password_hash": "***"}'; end if;
+  if v_depois ? 'password_hash' then v_depois := v_depois || '{"password_hash": "***"}'; end if;
+
+  insert into auditoria (tabela, registro_id, operacao, usuario, antes, depois)
+  values (tg_table_name, v_id, tg_op, v_usuario, v_antes, v_depois);
+  return null;
+end
+$$;
+
+-- Somente inserção: a trilha não pode ser alterada nem apagada
+create or replace function bloquear_alteracao_auditoria() returns trigger
+language plpgsql as $$
+begin
+  raise exception 'auditoria é somente inserção';
+end
+$$;
+
+drop trigger if exists tr_auditoria_somente_insercao on auditoria;
+create trigger tr_auditoria_somente_insercao before update or delete on auditoria
+  for each row execute function bloquear_alteracao_auditoria();
+
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['movimentacoes', 'users', 'usuarios_estudos', 'estudos', 'produtos',
+                           'localizacao', 'tipo_acao', 'tipo_produto'] loop
+    execute format('drop trigger if exists tr_auditoria on %I', t);
+    execute format('create trigger tr_auditoria after insert or update or delete on %I '
+                   'for each row execute function registrar_auditoria()', t);
+  end loop;
+end
+$$;
@@ -0,0 +1,10 @@
+-- 0006_escopo_explicito.sql (Postgres/Supabase)
+-- Escopo de estudos explícito: users.todos_estudos libera todos os estudos; sem
+-- ele, o usuário vê só as linhas de usuarios_estudos (nenhuma = nenhum estudo).
+-- Antes, "nenhuma linha" significava "todos": uma troca de estudos que falhasse
+-- no meio, ou a exclusão do único estudo atribuído, liberava tudo.
+
+alter table users add column if not exists todos_estudos boolean not null default true;
+
+update users set todos_estudos = false
+ where exists (select 1 from usuarios_estudos ue where ue.usuario_id = users.id);
@@ -0,0 +1,54 @@
+-- 0001_schema_inicial.sql (SQLite)
+-- Tabelas do app. "if not exists": tabelas existentes ficam como estão.
+
+create table if not exists estudos (
+  id integer primary key autoincrement,
+  nome text not null
+);
+
+create table if not exists localizacao (
+  id integer primary key autoincrement,
+  nome text not null
+);
+
+create table if not exists tipo_acao (
+  id integer primary key autoincrement,
+  nome text not null
+);
+
+create table if not exists tipo_produto (
+  id integer primary key autoincrement,
+  nome text not null
+);
+
+create table if not exists produtos (
+  id integer primary key autoincrement,
+  nome text not null,
+  estudo_id integer references estudos(id),
+  tipo_produto text
+);
+
+create table if not exists users (
+  id integer primary key autoincrement,
+  username text not null,
+  password_hash text not null,
+  role text not null default 'visualizador',
+  is_active integer not null default 1
+);
+
+create table if not exists movimentacoes (
+  id integer primary key autoincrement,
+  data text not null,
+  tipo_transacao text not null,
+  estudo_id integer references estudos(id),
+  produto_id integer references produtos(id),
+  tipo_produto text,
+  quantidade real not null,
+  validade text,
+  lote text,
+  nota text,
+  tipo_acao text,
+  consideracoes text,
+  responsavel text,
+  localizacao text
+);
@@ -0,0 +1,43 @@
+-- 0003_escopo_e_arquivo.sql (SQLite)
+-- Estudos por usuário (Gestão de Acessos) e arquivo de lotes encerrados (arquivamento.py).
+
+create table if not exists usuarios_estudos (
+  id integer primary key autoincrement,
+  usuario_id integer not null references users(id) on delete cascade,
+  estudo_id integer not null references estudos(id) on delete cascade,
+  unique (usuario_id, estudo_id)
+);
+
+create table if not exists movimentacoes_arquivo (
+  id integer primary key,
+  data text not null,
+  tipo_transacao text not null,
+  estudo_id integer,
+  produto_id integer,
+  tipo_produto text,
+  quantidade real not null,
+  validade text,
+  lote text,
+  nota text,
+  tipo_acao text,
+  consideracoes text,
+  responsavel text,
+  localizacao text,
+  arquivado_em text
+);
+create index if not exists ix_movimentacoes_arquivo_estudo on movimentacoes_arquivo (estudo_id);
+
+create table if not exists lotes_arquivados (
+  id integer primary key autoincrement,
+  estudo_id integer not null,
+  produto_id integer not null,
+  validade text not null default '',
+  lote text not null default '',
+  entradas real,
+  saidas real,
+  movimentacoes integer,
+  primeira_data text,
+  ultima_data text,
+  arquivado_em text,
+  unique (estudo_id, produto_id, validade, lote)
+);
@@ -0,0 +1,4 @@
+-- 0004_saldos_lote.sql (SQLite)
+-- A função saldo_lote() do Postgres (RPC de database.obter_saldo) não tem
+-- equivalente em SQLite; o backend local a implementa em backend_local.py.
+-- Versão mantida para a numeração seguir igual nos dois dialetos.
@@ -0,0 +1,289 @@
+-- 0005_auditoria.sql (SQLite)
+-- Trilha de auditoria (auditoria.py): uma linha por inclusão, alteração ou
+-- exclusão nas tabelas auditadas, gravada pelos triggers na mesma transação da
+-- alteração. Só os campos alterados são guardados. SQLite não conhece o
+-- usuário do app: `usuario` fica nulo.
+
+create table if not exists auditoria (
+  id integer primary key autoincrement,
+  tabela text not null,
+  registro_id integer,
+  operacao text not null,
+  usuario text,
+  em text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')),
+  antes text,
+  depois text
+);
+
+-- Histórico de um registro e alterações de um período
+create index if not exists ix_auditoria_registro on auditoria (tabela, registro_id, em);
+create index if not exists ix_auditoria_em on auditoria (em);
+
+-- Somente inserção
+drop trigger if exists tr_auditoria_sem_update;
+create trigger tr_auditoria_sem_update before update on auditoria
+begin
+  select raise(abort, 'auditoria é somente inserção');
+end;
+drop trigger if exists tr_auditoria_sem_delete;
+create trigger tr_auditoria_sem_delete before delete on auditoria
+begin
+  select raise(abort, 'auditoria é somente inserção');
+end;
+
+-- movimentacoes
+drop trigger if exists tr_auditoria_movimentacoes_insert;
+create trigger tr_auditoria_movimentacoes_insert after insert on movimentacoes
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'movimentacoes', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'data', new.data, 'tipo_transacao', new.tipo_transacao,
+      'estudo_id', new.estudo_id, 'produto_id', new.produto_id,
+      'tipo_produto', new.tipo_produto, 'quantidade', new.quantidade,
+      'validade', new.validade, 'lote', new.lote, 'nota', new.nota,
+      'tipo_acao', new.tipo_acao, 'consideracoes', new.consideracoes,
+      'responsavel', new.responsavel, 'localizacao', new.localizacao))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_movimentacoes_update;
+create trigger tr_auditoria_movimentacoes_update after update on movimentacoes
+when old.data is not new.data
+     or old.tipo_transacao is not new.tipo_transacao
+     or old.estudo_id is not new.estudo_id
+     or old.produto_id is not new.produto_id
+     or old.tipo_produto is not new.tipo_produto
+     or old.quantidade is not new.quantidade
+     or old.validade is not new.validade
+     or old.lote is not new.lote
+     or old.nota is not new.nota
+     or old.tipo_acao is not new.tipo_acao
+     or old.consideracoes is not new.consideracoes
+     or old.responsavel is not new.responsavel
+     or old.localizacao is not new.localizacao
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'movimentacoes', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'data' as campo, old.data as antes, new.data as depois where old.data is not new.data
+          union all select 'tipo_transacao', old.tipo_transacao, new.tipo_transacao where old.tipo_transacao is not new.tipo_transacao
+          union all select 'estudo_id', old.estudo_id, new.estudo_id where old.estudo_id is not new.estudo_id
+          union all select 'produto_id', old.produto_id, new.produto_id where old.produto_id is not new.produto_id
+          union all select 'tipo_produto', old.tipo_produto, new.tipo_produto where old.tipo_produto is not new.tipo_produto
+          union all select 'quantidade', old.quantidade, new.quantidade where old.quantidade is not new.quantidade
+          union all select 'validade', old.validade, new.validade where old.validade is not new.validade
+          union all select 'lote', old.lote, new.lote where old.lote is not new.lote
+          union all select 'nota', old.nota, new.nota where old.nota is not new.nota
+          union all select 'tipo_acao', old.tipo_acao, new.tipo_acao where old.tipo_acao is not new.tipo_acao
+          union all select 'consideracoes', old.consideracoes, new.consideracoes where old.consideracoes is not new.consideracoes
+          union all select 'responsavel', old.responsavel, new.responsavel where old.responsavel is not new.responsavel
+          union all select 'localizacao', old.localizacao, new.localizacao where old.localizacao is not new.localizacao);
+end;
+drop trigger if exists tr_auditoria_movimentacoes_delete;
+create trigger tr_auditoria_movimentacoes_delete after delete on movimentacoes
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('movimentacoes', old.id, 'DELETE', json_object(
+    'id', old.id, 'data', old.data, 'tipo_transacao', old.tipo_transacao,
+    'estudo_id', old.estudo_id, 'produto_id', old.produto_id,
+    'tipo_produto', old.tipo_produto, 'quantidade', old.quantidade,
+    'validade', old.validade, 'lote', old.lote, 'nota', old.nota,
+    'tipo_acao', old.tipo_acao, 'consideracoes', old.consideracoes,
+    'responsavel', old.responsavel, 'localizacao', old.localizacao));
+end;
+
+-- users
+drop trigger if exists tr_auditoria_users_insert;
+create trigger tr_auditoria_users_insert after insert on users
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'users', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'username', new.username, 'password_hash', '***', 'role', new.role,
+      'is_active', new.is_active))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_users_update;
+create trigger tr_auditoria_users_update after update on users
+when old.username is not new.username
+     or old.password_hash is not new.password_hash
+     or old.role is not new.role
+     or old.is_active is not new.is_active
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'users', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'username' as campo, old.username as antes, new.username as depois where old.username is not new.username
+          union all select 'password_hash', '***', '***' where old.password_hash is not new.password_hash
+          union all select 'role', old.role, new.role where old.role is not new.role
+          union all select 'is_active', old.is_active, new.is_active where old.is_active is not new.is_active);
+end;
+drop trigger if exists tr_auditoria_users_delete;
+create trigger tr_auditoria_users_delete after delete on users
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('users', old.id, 'DELETE', json_object(
+    'id', old.id, 'username', old.username, 'password_hash', '***', 'role', old.role,
+    'is_active', old.is_active));
+end;
+
+-- usuarios_estudos
+drop trigger if exists tr_auditoria_usuarios_estudos_insert;
+create trigger tr_auditoria_usuarios_estudos_insert after insert on usuarios_estudos
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'usuarios_estudos', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'usuario_id', new.usuario_id, 'estudo_id', new.estudo_id))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_usuarios_estudos_update;
+create trigger tr_auditoria_usuarios_estudos_update after update on usuarios_estudos
+when old.usuario_id is not new.usuario_id
+     or old.estudo_id is not new.estudo_id
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'usuarios_estudos', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'usuario_id' as campo, old.usuario_id as antes, new.usuario_id as depois where old.usuario_id is not new.usuario_id
+          union all select 'estudo_id', old.estudo_id, new.estudo_id where old.estudo_id is not new.estudo_id);
+end;
+drop trigger if exists tr_auditoria_usuarios_estudos_delete;
+create trigger tr_auditoria_usuarios_estudos_delete after delete on usuarios_estudos
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('usuarios_estudos', old.id, 'DELETE', json_object(
+    'id', old.id, 'usuario_id', old.usuario_id, 'estudo_id', old.estudo_id));
+end;
+
+-- estudos
+drop trigger if exists tr_auditoria_estudos_insert;
+create trigger tr_auditoria_estudos_insert after insert on estudos
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'estudos', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'nome', new.nome))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_estudos_update;
+create trigger tr_auditoria_estudos_update after update on estudos
+when old.nome is not new.nome
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'estudos', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'nome' as campo, old.nome as antes, new.nome as depois where old.nome is not new.nome);
+end;
+drop trigger if exists tr_auditoria_estudos_delete;
+create trigger tr_auditoria_estudos_delete after delete on estudos
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('estudos', old.id, 'DELETE', json_object(
+    'id', old.id, 'nome', old.nome));
+end;
+
+-- produtos
+drop trigger if exists tr_auditoria_produtos_insert;
+create trigger tr_auditoria_produtos_insert after insert on produtos
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'produtos', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'nome', new.nome, 'estudo_id', new.estudo_id, 'tipo_produto', new.tipo_produto))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_produtos_update;
+create trigger tr_auditoria_produtos_update after update on produtos
+when old.nome is not new.nome
+     or old.estudo_id is not new.estudo_id
+     or old.tipo_produto is not new.tipo_produto
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'produtos', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'nome' as campo, old.nome as antes, new.nome as depois where old.nome is not new.nome
+          union all select 'estudo_id', old.estudo_id, new.estudo_id where old.estudo_id is not new.estudo_id
+          union all select 'tipo_produto', old.tipo_produto, new.tipo_produto where old.tipo_produto is not new.tipo_produto);
+end;
+drop trigger if exists tr_auditoria_produtos_delete;
+create trigger tr_auditoria_produtos_delete after delete on produtos
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('produtos', old.id, 'DELETE', json_object(
+    'id', old.id, 'nome', old.nome, 'estudo_id', old.estudo_id,
+    'tipo_produto', old.tipo_produto));
+end;
+
+-- localizacao
+drop trigger if exists tr_auditoria_localizacao_insert;
+create trigger tr_auditoria_localizacao_insert after insert on localizacao
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'localizacao', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'nome', new.nome))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_localizacao_update;
+create trigger tr_auditoria_localizacao_update after update on localizacao
+when old.nome is not new.nome
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'localizacao', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'nome' as campo, old.nome as antes, new.nome as depois where old.nome is not new.nome);
+end;
+drop trigger if exists tr_auditoria_localizacao_delete;
+create trigger tr_auditoria_localizacao_delete after delete on localizacao
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('localizacao', old.id, 'DELETE', json_object(
+    'id', old.id, 'nome', old.nome));
+end;
+
+-- tipo_acao
+drop trigger if exists tr_auditoria_tipo_acao_insert;
+create trigger tr_auditoria_tipo_acao_insert after insert on tipo_acao
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'tipo_acao', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'nome', new.nome))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_tipo_acao_update;
+create trigger tr_auditoria_tipo_acao_update after update on tipo_acao
+when old.nome is not new.nome
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'tipo_acao', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'nome' as campo, old.nome as antes, new.nome as depois where old.nome is not new.nome);
+end;
+drop trigger if exists tr_auditoria_tipo_acao_delete;
+create trigger tr_auditoria_tipo_acao_delete after delete on tipo_acao
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('tipo_acao', old.id, 'DELETE', json_object(
+    'id', old.id, 'nome', old.nome));
+end;
+
+-- tipo_produto
+drop trigger if exists tr_auditoria_tipo_produto_insert;
+create trigger tr_auditoria_tipo_produto_insert after insert on tipo_produto
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'tipo_produto', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'nome', new.nome))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_tipo_produto_update;
+create trigger tr_auditoria_tipo_produto_update after update on tipo_produto
+when old.nome is not new.nome
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'tipo_produto', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'nome' as campo, old.nome as antes, new.nome as depois where old.nome is not new.nome);
+end;
+drop trigger if exists tr_auditoria_tipo_produto_delete;
+create trigger tr_auditoria_tipo_produto_delete after delete on tipo_produto
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('tipo_produto', old.id, 'DELETE', json_object(
+    'id', old.id, 'nome', old.nome));
+end;
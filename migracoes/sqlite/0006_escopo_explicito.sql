@@ -0,0 +1,46 @@
+-- 0006_escopo_explicito.sql (SQLite)
+-- Escopo de estudos explícito: users.todos_estudos libera todos os estudos; sem
+-- ele, o usuário vê só as linhas de usuarios_estudos (nenhuma = nenhum estudo).
+-- Antes, "nenhuma linha" significava "todos": uma troca de estudos que falhasse
+-- no meio, ou a exclusão do único estudo atribuído, liberava tudo.
+
+alter table users add column todos_estudos integer not null default 1;
+
+update users set todos_estudos = 0
+ where exists (select 1 from usuarios_estudos ue where ue.usuario_id = users.id);
+
+-- Triggers de auditoria de users (0005) com a nova coluna
+drop trigger if exists tr_auditoria_users_insert;
+create trigger tr_auditoria_users_insert after insert on users
+begin
+  insert into auditoria (tabela, registro_id, operacao, depois)
+  select 'users', new.id, 'INSERT', json_group_object(key, value)
+    from json_each(json_object(
+      'username', new.username, 'password_hash', '***', 'role', new.role,
+      'is_active', new.is_active, 'todos_estudos', new.todos_estudos))
+   where value is not null;
+end;
+drop trigger if exists tr_auditoria_users_update;
+create trigger tr_auditoria_users_update after update on users
+when old.username is not new.username
+     or old.password_hash is not new.password_hash
+     or old.role is not new.role
+     or old.is_active is not new.is_active
+     or old.todos_estudos is not new.todos_estudos
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes, depois)
+  select 'users', new.id, 'UPDATE', json_group_object(campo, antes), json_group_object(campo, depois)
+    from (select 'username' as campo, old.username as antes, new.username as depois where old.username is not new.username
+          union all select 'password_hash', '***', '***' where old.password_hash is not new.password_hash
+          union all select 'role', old.role, new.role where old.role is not new.role
+          union all select 'is_active', old.is_active, new.is_active where old.is_active is not new.is_active
+          union all select 'todos_estudos', old.todos_estudos, new.todos_estudos where old.todos_estudos is not new.todos_estudos);
+end;
+drop trigger if exists tr_auditoria_users_delete;
+create trigger tr_auditoria_users_delete after delete on users
+begin
+  insert into auditoria (tabela, registro_id, operacao, antes)
+  values ('users', old.id, 'DELETE', json_object(
+    'id', old.id, 'username', old.username, 'password_hash', '***', 'role', old.role,
+    'is_active', old.is_active, 'todos_estudos', old.todos_estudos));
+end;
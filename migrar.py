@@ -0,0 +1,233 @@
+# migrar.py
+"""
+Migrações versionadas do schema, para Postgres (Supabase) e SQLite.
+
+Cada migração é um arquivo `migracoes/<dialeto>/NNNN_nome.sql`, com o mesmo
+número nos dois dialetos. As versões aplicadas ficam na tabela
+`schema_migrations`; cada migração pendente roda numa transação junto com o
+registro da sua versão (aplica inteira ou não aplica).
+
+O app fala com o Supabase pela API REST (PostgREST), que não executa DDL: as
+migrações usam uma conexão direta, configurada em CEMEC_DATABASE_URL
+(`postgresql://...`, a connection string do painel do Supabase, ou
+`sqlite:///caminho/estoque.db`). Postgres requer o pacote `psycopg`, importado
+só aqui.
+
+`verificar_indices` confere, no banco, se cada consulta quente do app
+(CONSULTAS_QUENTES) tem um índice que a sirva.
+
+Execução avulsa:
+    python migrar.py                      # aplica as pendentes
+    python migrar.py --status             # lista aplicadas e pendentes
+    python migrar.py --verificar-indices  # consultas quentes sem índice (sai com 1 se houver)
+    python migrar.py --url sqlite:///estoque.db
+"""
+import argparse
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+PASTA_MIGRACOES = Path(__file__).resolve().parent / "migracoes"
+URL_PADRAO = os.environ.get("CEMEC_DATABASE_URL", "")
+LOCK_MIGRACOES = 7_331_001  # chave do advisory lock (Postgres)
+
+# Consultas quentes do app -> tabela e colunas de filtro (na ordem mais seletiva)
+CONSULTAS_QUENTES = [
+    ("Saldo de um lote (obter_saldo)", "movimentacoes", ["estudo_id", "produto_id", "validade", "lote"]),
+    ("Movimentações dos produtos de um estudo", "movimentacoes", ["estudo_id", "produto_id"]),
+    ("Ledger do escopo de estudos do usuário", "movimentacoes", ["estudo_id"]),
+    ("Movimentações por período", "movimentacoes", ["data"]),
+    ("Produtos de um estudo", "produtos", ["estudo_id"]),
+    ("Login (obter_usuario)", "users", ["username"]),
+    ("Estudos do usuário", "usuarios_estudos", ["usuario_id"]),
+    ("Arquivo do escopo de estudos", "movimentacoes_arquivo", ["estudo_id"]),
+    ("Resumo de um lote arquivado", "lotes_arquivados", ["estudo_id", "produto_id", "validade", "lote"]),
+    ("Histórico de um registro (auditoria)", "auditoria", ["tabela", "registro_id"]),
+    ("Alterações de um período (auditoria)", "auditoria", ["em"]),
+]
+
+# ---------------------------
+# Conexão
+# ---------------------------
+class Banco:
+    """Conexão direta (fora do PostgREST) com o dialeto, para DDL e consultas ao catálogo."""
+
+    def __init__(self, conexao, dialeto: str):
+        self.conexao = conexao
+        self.dialeto = dialeto
+
+    def consultar(self, sql: str, params=()):
+        cur = self.conexao.execute(sql, params)
+        return cur.fetchall()
+
+    def executar_em_transacao(self, script: str, registro: tuple):
+        """Roda `script` e grava `registro` (versão, nome) em schema_migrations, tudo ou nada."""
+        agora = datetime.now(timezone.utc).isoformat()
+        if self.dialeto == "postgres":
+            with self.conexao.transaction():
+                self.conexao.execute(script)
+                self.conexao.execute("insert into schema_migrations (versao, nome, aplicada_em) values (%s, %s, %s)",
+                                     (*registro, agora))
+            return
+        # SQLite em autocommit (isolation_level=None): a transação é a do próprio script
+        try:
+            self.conexao.executescript(f"begin;\n{script}\n;")
+            self.conexao.execute("insert into schema_migrations (versao, nome, aplicada_em) values (?, ?, ?)",
+                                 (*registro, agora))
+            self.conexao.execute("commit")
+        except Exception:
+            if self.conexao.in_transaction:
+                self.conexao.execute("rollback")
+            raise
+
+    def fechar(self):
+        self.conexao.close()
+
+def conectar(url: str = None) -> Banco:
+    """Abre a conexão de `url` (ou CEMEC_DATABASE_URL): postgresql://... ou sqlite:///arquivo.db."""
+    url = url or URL_PADRAO
+    if url.startswith("sqlite://"):
+        caminho = url[len("sqlite:///"):] or ":memory:"
+        conexao = sqlite3.connect(caminho, isolation_level=None, check_same_thread=False)
+        conexao.execute("pragma foreign_keys = on")
+        return Banco(conexao, "sqlite")
+    if url.startswith(("postgres://", "postgresql://")):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise RuntimeError("Migrações em Postgres requerem o pacote psycopg (pip install 'psycopg[binary]').") from e
+        return Banco(psycopg.connect(url, autocommit=True), "postgres")
+    raise ValueError("Defina CEMEC_DATABASE_URL (postgresql://... ou sqlite:///arquivo.db) para rodar as migrações.")
+
+# ---------------------------
+# Migrações
+# ---------------------------
+def migracoes_disponiveis(dialeto: str) -> list:
+    """[(versão, nome, caminho)] dos arquivos NNNN_nome.sql do dialeto, em ordem."""
+    encontradas = []
+    for caminho in sorted((PASTA_MIGRACOES / dialeto).glob("*.sql")):
+        m = re.match(r"(\d+)_(.+)\.sql$", caminho.name)
+        if m:
+            encontradas.append((int(m.group(1)), m.group(2), caminho))
+    return encontradas
+
+def _garantir_tabela_versoes(banco: Banco):
+    tipo_data = "timestamptz" if banco.dialeto == "postgres" else "text"
+    sql = (f"create table if not exists schema_migrations "
+           f"(versao integer primary key, nome text not null, aplicada_em {tipo_data} not null)")
+    banco.conexao.execute(sql)
+
+def versoes_aplicadas(banco: Banco) -> set:
+    _garantir_tabela_versoes(banco)
+    return {linha[0] for linha in banco.consultar("select versao from schema_migrations")}
+
+def pendentes(banco: Banco) -> list:
+    aplicadas = versoes_aplicadas(banco)
+    return [m for m in migracoes_disponiveis(banco.dialeto) if m[0] not in aplicadas]
+
+def migrar(banco: Banco, ate: int = None) -> list:
+    """Aplica as migrações pendentes (até a versão `ate`, se dada). Retorna as versões aplicadas."""
+    if banco.dialeto == "postgres":
+        # Processos subindo ao mesmo tempo: um aplica, os demais esperam e não encontram pendentes
+        banco.consultar("select pg_advisory_lock(%s)", (LOCK_MIGRACOES,))
+    try:
+        aplicadas = []
+        for versao, nome, caminho in pendentes(banco):
+            if ate is not None and versao > ate:
+                break
+            banco.executar_em_transacao(caminho.read_text(encoding="utf-8"), (versao, nome))
+            aplicadas.append(versao)
+        return aplicadas
+    finally:
+        if banco.dialeto == "postgres":
+            banco.consultar("select pg_advisory_unlock(%s)", (LOCK_MIGRACOES,))
+
+def migrar_configurado() -> list:
+    """Aplica as pendentes no banco de CEMEC_DATABASE_URL; sem configuração, não faz nada."""
+    if not URL_PADRAO:
+        return []
+    banco = conectar(URL_PADRAO)
+    try:
+        return migrar(banco)
+    finally:
+        banco.fechar()
+
+# ---------------------------
+# Verificação de índices
+# ---------------------------
+def indices(banco: Banco) -> dict:
+    """Tabela -> lista de índices, cada um como a lista ordenada das suas colunas."""
+    por_tabela = {}
+    if banco.dialeto == "postgres":
+        linhas = banco.consultar("""
+            select t.relname, array_agg(a.attname order by k.ord)
+              from pg_index x
+              join pg_class t on t.oid = x.indrelid
+              join pg_namespace n on n.oid = t.relnamespace
+              cross join lateral unnest(x.indkey) with ordinality as k(attnum, ord)
+              join pg_attribute a on a.attrelid = t.oid and a.attnum = k.attnum
+             where n.nspname = 'public'
+             group by t.relname, x.indexrelid
+        """)
+        for tabela, colunas in linhas:
+            por_tabela.setdefault(tabela, []).append(list(colunas))
+        return por_tabela
+    tabelas = [l[0] for l in banco.consultar("select name from sqlite_master where type = 'table'")]
+    for tabela in tabelas:
+        for indice in banco.consultar(f"pragma index_list('{tabela}')"):
+            colunas = [c[2] for c in sorted(banco.consultar(f"pragma index_info('{indice[1]}')"))]
+            por_tabela.setdefault(tabela, []).append(colunas)
+    return por_tabela
+
+def _colunas_servidas(indice: list, colunas: list) -> int:
+    """Quantas colunas de filtro o índice atende: o prefixo dele formado só por colunas da consulta."""
+    n = 0
+    for coluna in indice:
+        if coluna not in colunas:
+            break
+        n += 1
+    return n
+
+def verificar_indices(banco: Banco) -> list:
+    """
+    Uma linha por consulta quente: (descrição, tabela, colunas, situação,
+    índice que melhor a serve). Situação: 'ok' (o índice cobre todas as
+    colunas de filtro), 'parcial' (só um prefixo delas) ou 'sem índice'.
+    """
+    por_tabela = indices(banco)
+    relatorio = []
+    for descricao, tabela, colunas in CONSULTAS_QUENTES:
+        melhor = max(por_tabela.get(tabela, []), key=lambda ix: _colunas_servidas(ix, colunas), default=None)
+        servidas = _colunas_servidas(melhor, colunas) if melhor else 0
+        situacao = "ok" if servidas == len(colunas) else "parcial" if servidas else "sem índice"
+        relatorio.append((descricao, tabela, colunas, situacao, melhor if servidas else None))
+    return relatorio
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações versionadas do schema.")
+    parser.add_argument("--url", default=URL_PADRAO, help="postgresql://... ou sqlite:///arquivo.db (padrão: CEMEC_DATABASE_URL)")
+    parser.add_argument("--status", action="store_true", help="lista migrações aplicadas e pendentes")
+    parser.add_argument("--ate", type=int, help="aplica só até esta versão")
+    parser.add_argument("--verificar-indices", action="store_true", help="lista consultas quentes sem índice")
+    args = parser.parse_args()
+
+    banco = conectar(args.url)
+    try:
+        if args.status:
+            aplicadas = versoes_aplicadas(banco)
+            for versao, nome, _ in migracoes_disponiveis(banco.dialeto):
+                print(f"{versao:04d} {nome}: {'aplicada' if versao in aplicadas else 'pendente'}")
+        elif args.verificar_indices:
+            faltando = 0
+            for descricao, tabela, colunas, situacao, indice in verificar_indices(banco):
+                faltando += situacao != "ok"
+                extra = f" (índice: {', '.join(indice)})" if indice else ""
+                print(f"[{situacao}] {descricao}: {tabela}({', '.join(colunas)}){extra}")
+            raise SystemExit(1 if faltando else 0)
+        else:
+            aplicadas = migrar(banco, args.ate)
+            print(f"{len(aplicadas)} migração(ões) aplicada(s)" + (f": {aplicadas}" if aplicadas else "."))
+    finally:
+        banco.fechar()
@@ -0,0 +1,184 @@
+# notificacoes.py
+"""
+Feed de alterações de linhas (change feed) usado para manter os caches frescos.
+
+Cada evento é um dict:
+    {"tabela": "movimentacoes", "tipo": "INSERT" | "UPDATE" | "DELETE",
+     "novo": {...} | None, "antigo": {...} | None}
+
+Fontes de eventos, escolhidas por CEMEC_NOTIFICADOR:
+- "local" (padrão): só as gravações feitas por este processo, publicadas pelo
+  database.py. Sem dependências externas.
+- "arquivo:<caminho>": barramento em arquivo JSON Lines compartilhado pelos
+  processos da mesma máquina (desenvolvimento offline e testes).
+- "supabase": Supabase Realtime (postgres_changes). Em produção, habilite o
+  Realtime para as tabelas em TABELAS_MONITORADAS.
+As gravações locais são sempre entregues aos assinantes deste processo.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import streamlit as st
+
+TABELAS_MONITORADAS = ("movimentacoes", "produtos", "estudos", "localizacao", "tipo_acao", "tipo_produto")
+TIPOS = ("INSERT", "UPDATE", "DELETE")
+
+def evento(tabela, tipo, novo=None, antigo=None) -> dict:
+    return {"tabela": tabela, "tipo": tipo, "novo": novo, "antigo": antigo}
+
+# ---------------------------
+# Feed (barramento em memória)
+# ---------------------------
+class Feed:
+    """Distribui eventos aos assinantes do processo e às fontes externas de saída."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes = []
+        self._saidas = []          # fontes que também propagam as gravações locais
+        self.fontes = {"local": "ativo"}
+        self.eventos_recebidos = 0
+
+    def assinar(self, callback):
+        """Registra `callback(evento)`; retorna uma função que cancela a assinatura."""
+        with self._lock:
+            self._assinantes.append(callback)
+        def cancelar():
+            with self._lock:
+                if callback in self._assinantes:
+                    self._assinantes.remove(callback)
+        return cancelar
+
+    def entregar(self, ev: dict):
+        """Entrega um evento aos assinantes deste processo (falhas de um não afetam os outros)."""
+        with self._lock:
+            assinantes = list(self._assinantes)
+            self.eventos_recebidos += 1
+        for callback in assinantes:
+            try:
+                callback(ev)
+            except Exception as e:
+                print(f"[notificacoes] assinante falhou: {e}", flush=True)
+
+    def publicar(self, ev: dict):
+        """Publica uma gravação feita por este processo."""
+        self.entregar(ev)
+        for saida in list(self._saidas):
+            saida.publicar(ev)
+
+    def adicionar_saida(self, fonte):
+        self._saidas.append(fonte)
+
+    @property
+    def remoto_ativo(self) -> bool:
+        """True se alguma fonte externa (arquivo/supabase) está entregando eventos."""
+        return any(estado == "ativo" for nome, estado in self.fontes.items() if nome != "local")
+
+# ---------------------------
+# Fonte: arquivo JSON Lines
+# ---------------------------
+class BarramentoArquivo:
+    """Barramento entre processos via arquivo JSON Lines (uma linha por evento)."""
+
+    def __init__(self, feed: Feed, caminho: str, intervalo: float = 0.5):
+        self._feed = feed
+        self._caminho = caminho
+        self._intervalo = intervalo
+        self._origem = f"{os.getpid()}-{id(self)}"
+        self._lock = threading.Lock()
+        open(caminho, "a", encoding="utf-8").close()
+        self._posicao = os.path.getsize(caminho)  # só eventos posteriores à inicialização
+        threading.Thread(target=self._acompanhar, name="cemec-feed-arquivo", daemon=True).start()
+        feed.fontes["arquivo"] = "ativo"
+
+    def publicar(self, ev: dict):
+        linha = json.dumps({**ev, "origem": self._origem}, default=str, ensure_ascii=False)
+        with self._lock, open(self._caminho, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+
+    def _acompanhar(self):
+        while True:
+            time.sleep(self._intervalo)
+            try:
+                with open(self._caminho, "r", encoding="utf-8") as f:
+                    f.seek(self._posicao)
+                    linhas = f.readlines()
+                    # Linha incompleta (escrita em andamento) fica para a próxima leitura
+                    if linhas and not linhas[-1].endswith("\n"):
+                        linhas.pop()
+                    self._posicao += sum(len(l.encode("utf-8")) for l in linhas)
+            except OSError:
+                continue
+            for linha in linhas:
+                try:
+                    ev = json.loads(linha)
+                except ValueError:
+                    continue
+                if ev.pop("origem", None) != self._origem:
+                    self._feed.entregar(ev)
+
+# ---------------------------
+# Fonte: Supabase Realtime
+# ---------------------------
+class FonteSupabaseRealtime:
+    """Assina postgres_changes das tabelas monitoradas numa thread com loop asyncio próprio."""
+
+    def __init__(self, feed: Feed, url: str, key: str, tabelas=TABELAS_MONITORADAS):
+        self._feed = feed
+        self._url = url
+        self._key = key
+        self._tabelas = tabelas
+        feed.fontes["supabase"] = "conectando"
+        threading.Thread(target=self._rodar, name="cemec-feed-realtime", daemon=True).start()
+
+    def _rodar(self):
+        try:
+            asyncio.run(self._assinar())
+        except Exception as e:
+            self._feed.fontes["supabase"] = f"erro: {e}"
+
+    def _ao_mudar(self, payload):
+        data = payload.get("data", payload)
+        tipo = str(data.get("type", "")).split(".")[-1].upper()
+        self._feed.entregar(evento(
+            data.get("table"), tipo,
+            novo=data.get("record") or None,
+            antigo=data.get("old_record") or None,
+        ))
+
+    def _ao_inscrever(self, estado, erro=None):
+        estado = str(estado).split(".")[-1].upper()
+        if estado == "SUBSCRIBED":
+            self._feed.fontes["supabase"] = "ativo"
+        elif erro is not None or estado in ("CHANNEL_ERROR", "TIMED_OUT", "CLOSED"):
+            self._feed.fontes["supabase"] = f"erro: {erro or estado}"
+
+    async def _assinar(self):
+        from realtime import AsyncRealtimeClient
+        cliente = AsyncRealtimeClient(f"{self._url.rstrip('/')}/realtime/v1", self._key)
+        await cliente.connect()
+        canal = cliente.channel("cemec-alteracoes")
+        for tabela in self._tabelas:
+            canal.on_postgres_changes("*", table=tabela, schema="public", callback=self._ao_mudar)
+        await canal.subscribe(self._ao_inscrever)
+        await asyncio.Event().wait()  # mantém o loop vivo; o cliente reconecta sozinho
+
+# ---------------------------
+# Instância do processo
+# ---------------------------
+@st.cache_resource
+def obter_feed() -> Feed:
+    """Feed único do processo, com a fonte configurada em CEMEC_NOTIFICADOR."""
+    feed = Feed()
+    config = os.environ.get("CEMEC_NOTIFICADOR", "local").strip()
+    try:
+        if config.startswith("arquivo:"):
+            feed.adicionar_saida(BarramentoArquivo(feed, config.split(":", 1)[1]))
+        elif config == "supabase":
+            FonteSupabaseRealtime(feed, os.environ.get("SUPABASE_URL", ""), os.environ.get("SUPABASE_KEY", ""))
+    except Exception as e:
+        # Sem a fonte externa o app segue funcionando com o TTL do cache
+        feed.fontes[config] = f"erro: {e}"
+    return feed
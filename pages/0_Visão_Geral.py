@@ -1,209 +1,338 @@
-import streamlit as st
-import pandas as pd
-from datetime import datetime, date
-from database import get_data
-
-st.set_page_config(page_title="Visão Geral do Estoque", layout="wide")
-st.title("📊 Visão Geral do Estoque")
-
-# ---------------------------
-# Helpers
-# ---------------------------
-def fmt_date_br(d) -> str:
-    """Formata datas (str/date/datetime) para dd/mm/aaaa apenas para exibição."""
-    if d in (None, "", "N/A"):
-        return "—"
-    try:
-        if isinstance(d, (date, datetime)):
-            return d.strftime("%d/%m/%Y")
-        dt = pd.to_datetime(d, errors="coerce")
-        if pd.isna(dt):
-            return str(d)
-        return dt.strftime("%d/%m/%Y")
-    except Exception:
-        return str(d)
-
-def farol(validade_value):
-    """Retorna emoji do farol conforme dias para vencer."""
-    if validade_value in (None, "", "N/A"):
-        return ""
-    try:
-        # suporta tanto string ISO quanto date/datetime
-        if isinstance(validade_value, (date, datetime)):
-            validade_date = validade_value if isinstance(validade_value, date) else validade_value.date()
-        else:
-            validade_date = pd.to_datetime(validade_value, errors="coerce")
-            if pd.isna(validade_date):
-                return ""
-            validade_date = validade_date.date()
-        dias = (validade_date - date.today()).days
-        if dias < 0:
-            return "🔴"  # vencido
-        elif dias <= 30:
-            return "🟠"  # 0-30d
-        elif dias <= 60:
-            return "🟡"  # 31-60d
-        elif dias <= 90:
-            return "🔵"  # 61-90d
-        else:
-            return "🟢"  # >90d
-    except Exception:
-        return ""
-
-# ---------------------------
-# Gatekeeper (gestor e visualizador)
-# ---------------------------
-user = st.session_state.get('user')
-if not user:
-    st.error("Faça login para continuar.")
-    st.stop()
-
-# ---------------------------
-# Carregar dados
-# ---------------------------
-try:
-    df_movs = pd.DataFrame(get_data("movimentacoes", "*") or [])
-    if df_movs.empty:
-        st.warning("Nenhuma movimentação registrada.")
-        st.stop()
-
-    df_estudos = pd.DataFrame(get_data("estudos", "id, nome") or [])
-    df_produtos = pd.DataFrame(get_data("produtos", "id, nome") or [])
-
-    # Enriquecimento
-    df_movs = pd.merge(df_movs, df_estudos, left_on='estudo_id', right_on='id', how='left', suffixes=('', '_est'))
-    df_movs.rename(columns={'nome': 'estudo'}, inplace=True)
-
-    df_movs = pd.merge(df_movs, df_produtos, left_on='produto_id', right_on='id', how='left', suffixes=('', '_prod'))
-    df_movs.rename(columns={'nome': 'produto'}, inplace=True)
-
-    # Campos de interesse
-    df = df_movs[['id', 'data', 'tipo_transacao', 'estudo', 'produto', 'tipo_produto',
-                  'quantidade', 'validade', 'lote']].copy()
-
-    # Normalização para evitar NaN no agrupamento
-    df[['estudo', 'produto', 'validade', 'lote', 'tipo_transacao']] = \
-        df[['estudo', 'produto', 'validade', 'lote', 'tipo_transacao']].fillna('')
-
-except Exception as e:
-    st.error(f"Erro ao carregar dados: {e}")
-    st.stop()
-
-# ---------------------------
-# Filtros superiores
-# ---------------------------
-col_esq, col_dir = st.columns([1, 1])
-
-with col_esq:
-    estudo_filter = st.multiselect("Filtrar por Estudo", sorted([x for x in df['estudo'].unique() if x]))
-with col_dir:
-    produto_filter = st.multiselect("Filtrar por Produto", sorted([x for x in df['produto'].unique() if x]))
-
-if estudo_filter:
-    df = df[df['estudo'].isin(estudo_filter)]
-if produto_filter:
-    df = df[df['produto'].isin(produto_filter)]
-
-# Filtro opcional por período de validade
-c_chk, c_periodo = st.columns([1, 3])
-with c_chk:
-    considerar_validade = st.checkbox("Filtrar por intervalo de validade", value=False)
-
-if considerar_validade:
-    df["validade_dt"] = pd.to_datetime(df["validade"], errors="coerce")
-    min_valid = df["validade_dt"].min(skipna=True)
-    max_valid = df["validade_dt"].max(skipna=True)
-    if pd.isna(min_valid) or pd.isna(max_valid):
-        default_range = (date.today(), date.today())
-    else:
-        default_range = (min_valid.date(), max_valid.date())
-    with c_periodo:
-        intervalo_validade = st.date_input(
-            "Intervalo de Validade",
-            value=default_range,
-            help="Selecione início e fim do intervalo de validade."
-        )
-    if isinstance(intervalo_validade, (list, tuple)) and len(intervalo_validade) == 2:
-        dt_ini, dt_fim = intervalo_validade
-    else:
-        dt_ini = dt_fim = intervalo_validade
-    dt_ini = pd.to_datetime(dt_ini) if dt_ini else None
-    dt_fim = pd.to_datetime(dt_fim) if dt_fim else None
-    if (dt_ini is not None) and (dt_fim is not None):
-        df = df[df["validade_dt"].between(dt_ini, dt_fim, inclusive="both")].copy()
-
-# ---------------------------
-# Agregação
-# ---------------------------
-# Colunas derivadas para Entradas e Saídas
-df['Entradas'] = (df['tipo_transacao'] == 'Entrada').astype(int) * df['quantidade'].astype(float)
-df['Saidas'] = (df['tipo_transacao'] == 'Saída').astype(int) * df['quantidade'].astype(float)
-
-agrupado = (
-    df.groupby(['estudo', 'produto', 'validade', 'lote'], dropna=False)
-      .agg(Entradas=('Entradas', 'sum'),
-           Saidas=('Saidas', 'sum'))
-      .reset_index()
-)
-
-agrupado['Saldo Total'] = agrupado['Entradas'] - agrupado['Saidas']
-
-# Farol e datas para exibição
-agrupado['Farol'] = agrupado['validade'].apply(farol)
-agrupado['Validade (BR)'] = agrupado['validade'].apply(fmt_date_br)
-
-# ---------------------------
-# Filtro de saldos zerados
-# ---------------------------
-c_zero, _ = st.columns([1, 3])
-with c_zero:
-    apenas_saldos_zerados = st.checkbox("Mostrar apenas saldos zerados", value=False)
-
-if apenas_saldos_zerados:
-    agrupado = agrupado[agrupado['Saldo Total'].fillna(0) == 0]
-
-# Ajustes finais de tipo e ordenação
-agrupado = agrupado.fillna({'lote': ''})
-agrupado[['Entradas', 'Saidas', 'Saldo Total']] = agrupado[['Entradas', 'Saidas', 'Saldo Total']].round(0).astype(int)
-agrupado = agrupado.sort_values(by=['estudo', 'produto', 'validade', 'lote'], na_position="last")
-
-# ---------------------------
-# Tabela
-# ---------------------------
-if not agrupado.empty:
-    cols_show = ['Farol', 'estudo', 'produto', 'Validade (BR)', 'lote', 'Entradas', 'Saidas', 'Saldo Total']
-    st.dataframe(
-        agrupado[cols_show]
-                .rename(columns={
-                    'estudo': 'Estudo',
-                    'produto': 'Produto',
-                    'lote': 'Lote',
-                    'Entradas': 'Entradas',
-                    'Saidas': 'Saídas',
-                    'Saldo Total': 'Saldo Total'
-                }),
-        use_container_width=True,
-        hide_index=True,
-        column_config={
-            "Farol": st.column_config.Column(width="small"),
-            "Estudo": st.column_config.Column(width="medium"),
-            "Produto": st.column_config.Column(width="large"),
-            "Validade (BR)": st.column_config.Column(width="small"),
-            "Lote": st.column_config.Column(width="small"),
-            "Entradas": st.column_config.Column(width="small"),
-            "Saídas": st.column_config.Column(width="small"),
-            "Saldo Total": st.column_config.Column(width="small"),
-        }
-    )
-
-    st.divider()
-    st.subheader("Métricas Gerais")
-    c1, c2, c3 = st.columns(3)
-    with c1:
-        st.metric("Total de Entradas", f"{agrupado['Entradas'].sum():.0f}")
-    with c2:
-        st.metric("Total de Saídas", f"{agrupado['Saidas'].sum():.0f}")
-    with c3:
-        st.metric("Saldo Geral", f"{agrupado['Saldo Total'].sum():.0f}")
-else:
-    st.info("Nenhum item para exibir com os filtros atuais.")
+import streamlit as st
+import numpy as np
+import pandas as pd
+from datetime import datetime, date
+from repositorio import repositorio_do_usuario, escopo_do_usuario
+from arquivamento import lotes_arquivados
+from previsao import JANELAS_DIAS
+from cubo import LOTE, farois, lotes_visao_geral
+from memoria import registrar_sessao
+
+st.set_page_config(page_title="Visão Geral do Estoque", layout="wide")
+st.title("📊 Visão Geral do Estoque")
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def fmt_date_br(d) -> str:
+    """Formata datas (str/date/datetime) para dd/mm/aaaa apenas para exibição."""
+    if d in (None, "", "N/A"):
+        return "—"
+    try:
+        if isinstance(d, (date, datetime)):
+            return d.strftime("%d/%m/%Y")
+        dt = pd.to_datetime(d, errors="coerce")
+        if pd.isna(dt):
+            return str(d)
+        return dt.strftime("%d/%m/%Y")
+    except Exception:
+        return str(d)
+
+def _nomes(df_dim):
+    """Série id -> nome de uma tabela de dimensão."""
+    return df_dim.set_index("id")["nome"] if not df_dim.empty else pd.Series(dtype=object)
+
+# ---------------------------
+# Gatekeeper (gestor e visualizador)
+# ---------------------------
+registrar_sessao()
+user = st.session_state.get('user')
+if not user:
+    st.error("Faça login para continuar.")
+    st.stop()
+
+# ---------------------------
+# Carregar dados
+# ---------------------------
+try:
+    # Cubo por lote (saldos, validade convertida, farol e previsão), calculado no
+    # repositório uma vez por versão do ledger e por dia; os filtros abaixo são
+    # só máscaras sobre ele
+    repo = repositorio_do_usuario(user)
+    vg, prev_produtos, prev_lotes = repo.derivado("visao_geral")
+except Exception as e:
+    st.error(f"Erro ao carregar dados: {e}")
+    st.stop()
+
+# Lotes encerrados e arquivados (arquivamento.py) só entram quando pedidos, pelos resumos
+incluir_arquivados = st.checkbox("Incluir arquivados", value=False,
+                                 help="Soma os lotes encerrados que foram movidos para o arquivo.")
+if incluir_arquivados:
+    try:
+        arq = lotes_visao_geral(lotes_arquivados(escopo_do_usuario(user)))
+        arq['estudo'] = arq['estudo_id'].map(_nomes(repo.tabela("estudos"))).fillna('')
+        arq['produto'] = arq['produto_id'].map(_nomes(repo.tabela("produtos"))).fillna('')
+        vg = pd.concat([vg, arq], ignore_index=True)
+        if vg.duplicated(LOTE).any():
+            # Lote reaberto depois de arquivado: soma o arquivo à linha ativa
+            somas = vg.groupby(LOTE)[['Entradas', 'Saidas']].transform('sum')
+            vg = vg.assign(Entradas=somas['Entradas'], Saidas=somas['Saidas']).drop_duplicates(LOTE)
+            vg['Saldo Total'] = vg['Entradas'] - vg['Saidas']
+        vg = vg.sort_values(['estudo', 'produto', 'validade', 'lote'], ignore_index=True)
+    except Exception as e:
+        st.warning(f"Não foi possível carregar os lotes arquivados: {e}")
+
+if vg.empty:
+    st.warning("Nenhuma movimentação registrada.")
+    st.stop()
+
+# ---------------------------
+# Filtros superiores
+# ---------------------------
+col_esq, col_dir = st.columns([1, 1])
+
+with col_esq:
+    estudo_filter = st.multiselect("Filtrar por Estudo", sorted([x for x in vg['estudo'].unique() if x]))
+with col_dir:
+    produto_filter = st.multiselect("Filtrar por Produto", sorted([x for x in vg['produto'].unique() if x]))
+
+mascara = np.ones(len(vg), dtype=bool)
+if estudo_filter:
+    mascara &= vg['estudo'].isin(estudo_filter).to_numpy()
+if produto_filter:
+    mascara &= vg['produto'].isin(produto_filter).to_numpy()
+
+# Filtro opcional por período de validade
+c_chk, c_periodo = st.columns([1, 3])
+with c_chk:
+    considerar_validade = st.checkbox("Filtrar por intervalo de validade", value=False)
+
+if considerar_validade:
+    min_valid = vg.loc[mascara, "validade_dt"].min(skipna=True)
+    max_valid = vg.loc[mascara, "validade_dt"].max(skipna=True)
+    if pd.isna(min_valid) or pd.isna(max_valid):
+        default_range = (date.today(), date.today())
+    else:
+        default_range = (min_valid.date(), max_valid.date())
+    with c_periodo:
+        intervalo_validade = st.date_input(
+            "Intervalo de Validade",
+            value=default_range,
+            help="Selecione início e fim do intervalo de validade."
+        )
+    if isinstance(intervalo_validade, (list, tuple)) and len(intervalo_validade) == 2:
+        dt_ini, dt_fim = intervalo_validade
+    else:
+        dt_ini = dt_fim = intervalo_validade
+    dt_ini = pd.to_datetime(dt_ini) if dt_ini else None
+    dt_fim = pd.to_datetime(dt_fim) if dt_fim else None
+    if (dt_ini is not None) and (dt_fim is not None):
+        mascara &= vg["validade_dt"].between(dt_ini, dt_fim, inclusive="both").to_numpy()
+
+# ---------------------------
+# Filtro de saldos zerados
+# ---------------------------
+c_zero, _ = st.columns([1, 3])
+with c_zero:
+    apenas_saldos_zerados = st.checkbox("Mostrar apenas saldos zerados", value=False)
+
+if apenas_saldos_zerados:
+    mascara &= (vg['Saldo Total'] == 0).to_numpy()
+
+agrupado = vg[mascara]
+
+# ---------------------------
+# Tabela
+# ---------------------------
+if not agrupado.empty:
+    cols_show = ['Farol', 'estudo', 'produto', 'Validade (BR)', 'lote', 'Entradas', 'Saidas', 'Saldo Total',
+                 'taxa_diaria', 'dias_ate_consumir', 'qtd_em_risco']
+    st.dataframe(
+        agrupado[cols_show]
+                .replace([np.inf, -np.inf], np.nan)
+                .rename(columns={
+                    'estudo': 'Estudo',
+                    'produto': 'Produto',
+                    'lote': 'Lote',
+                    'Entradas': 'Entradas',
+                    'Saidas': 'Saídas',
+                    'Saldo Total': 'Saldo Total',
+                    'taxa_diaria': 'Consumo/dia',
+                    'dias_ate_consumir': 'Dias p/ consumir',
+                    'qtd_em_risco': 'Em risco de vencer'
+                }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Farol": st.column_config.Column(width="small"),
+            "Estudo": st.column_config.Column(width="medium"),
+            "Produto": st.column_config.Column(width="large"),
+            "Validade (BR)": st.column_config.Column(width="small"),
+            "Lote": st.column_config.Column(width="small"),
+            "Entradas": st.column_config.Column(width="small"),
+            "Saídas": st.column_config.Column(width="small"),
+            "Saldo Total": st.column_config.Column(width="small"),
+            "Consumo/dia": st.column_config.NumberColumn(width="small", format="%.1f",
+                                                         help="Média diária de Saídas do produto (janela recente com consumo)."),
+            "Dias p/ consumir": st.column_config.NumberColumn(width="small", format="%.0f",
+                                                              help="Dias até o lote acabar, consumindo os lotes por ordem de validade."),
+            "Em risco de vencer": st.column_config.NumberColumn(width="small", format="%.0f",
+                                                                help="Quantidade prevista para sobrar no lote na data de validade."),
+        }
+    )
+
+    st.download_button(
+        "⬇️ Exportar CSV",
+        agrupado[['estudo', 'produto', 'validade', 'lote', 'Entradas', 'Saidas', 'Saldo Total',
+                  'taxa_diaria', 'dias_ate_consumir', 'qtd_em_risco']].to_csv(index=False).encode("utf-8"),
+        file_name="visao_geral.csv",
+        mime="text/csv",
+    )
+
+    st.divider()
+    st.subheader("Métricas Gerais")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        st.metric("Total de Entradas", f"{agrupado['Entradas'].sum():.0f}")
+    with c2:
+        st.metric("Total de Saídas", f"{agrupado['Saidas'].sum():.0f}")
+    with c3:
+        st.metric("Saldo Geral", f"{agrupado['Saldo Total'].sum():.0f}")
+else:
+    st.info("Nenhum item para exibir com os filtros atuais.")
+
+# ---------------------------
+# Saldo por localização
+# ---------------------------
+st.divider()
+st.subheader("📍 Saldo por Localização")
+
+# Rollups do cubo de saldos (lote x localização), sem reler o ledger
+NIVEIS_LOCAL = {
+    "Localização": ["localizacao"],
+    "Estudo": ["estudo_id"],
+    "Produto": ["produto_id"],
+    "Lote": ["validade", "lote"],
+}
+c_niveis, c_zero_local = st.columns([3, 1])
+with c_niveis:
+    niveis = st.multiselect("Agrupar por", list(NIVEIS_LOCAL), default=["Localização", "Estudo"])
+with c_zero_local:
+    ocultar_zerados_local = st.checkbox("Ocultar saldos zerados", value=True)
+
+if niveis:
+    dims = [d for n in niveis for d in NIVEIS_LOCAL[n]]
+    # Estudo e produto sempre entram no rollup para aplicar os filtros do topo
+    dims_base = list(dict.fromkeys(["estudo_id", "produto_id"] + dims))
+    por_local = repo.derivado("cubo").rollup(dims_base)
+    por_local["estudo"] = por_local["estudo_id"].map(_nomes(repo.tabela("estudos")))
+    por_local["produto"] = por_local["produto_id"].map(_nomes(repo.tabela("produtos")))
+    if estudo_filter:
+        por_local = por_local[por_local["estudo"].isin(estudo_filter)]
+    if produto_filter:
+        por_local = por_local[por_local["produto"].isin(produto_filter)]
+    rotulos = {"localizacao": "localizacao", "estudo_id": "estudo", "produto_id": "produto",
+               "validade": "validade", "lote": "lote"}
+    chaves = [rotulos[d] for d in dims]
+    por_local = (
+        por_local.groupby(chaves, dropna=False)[["entradas", "saidas", "transf_entrada", "transf_saida", "saldo"]]
+                 .sum().reset_index()
+    )
+    if ocultar_zerados_local:
+        por_local = por_local[por_local["saldo"].round(6) != 0]
+    if "localizacao" in por_local.columns:
+        por_local["localizacao"] = por_local["localizacao"].replace("", "Sem localização")
+    if "validade" in por_local.columns:
+        por_local["validade"] = por_local["validade"].apply(fmt_date_br)
+    if por_local.empty:
+        st.info("Nenhum saldo para exibir com os filtros atuais.")
+    else:
+        st.dataframe(
+            por_local.sort_values(chaves).rename(columns={
+                "localizacao": "Localização",
+                "estudo": "Estudo",
+                "produto": "Produto",
+                "validade": "Validade (BR)",
+                "lote": "Lote",
+                "entradas": "Entradas",
+                "saidas": "Saídas",
+                "transf_entrada": "Transf. recebidas",
+                "transf_saida": "Transf. enviadas",
+                "saldo": "Saldo",
+            }),
+            use_container_width=True,
+            hide_index=True,
+            column_config={c: st.column_config.NumberColumn(format="%.0f") for c in
+                           ["Entradas", "Saídas", "Transf. recebidas", "Transf. enviadas", "Saldo"]},
+        )
+
+# ---------------------------
+# Previsão de consumo
+# ---------------------------
+st.divider()
+st.subheader("📉 Previsão de Consumo")
+st.caption(
+    f"Consumo médio diário das Saídas nos últimos {' e '.join(str(j) for j in JANELAS_DIAS)} dias; "
+    "a projeção usa a janela mais recente com consumo e esgota os lotes por ordem de validade."
+)
+
+if estudo_filter:
+    prev_produtos = prev_produtos[prev_produtos['estudo'].isin(estudo_filter)]
+    prev_lotes = prev_lotes[prev_lotes['estudo'].isin(estudo_filter)]
+if produto_filter:
+    prev_produtos = prev_produtos[prev_produtos['produto'].isin(produto_filter)]
+    prev_lotes = prev_lotes[prev_lotes['produto'].isin(produto_filter)]
+
+em_risco = prev_lotes[prev_lotes['em_risco']]
+c1, c2, c3 = st.columns(3)
+with c1:
+    st.metric("Produtos com estoque p/ até 30 dias", int((prev_produtos['dias_estoque'] <= 30).sum()))
+with c2:
+    st.metric("Lotes em risco de vencer", len(em_risco))
+with c3:
+    st.metric("Quantidade em risco", f"{em_risco['qtd_em_risco'].sum():.0f}")
+
+st.markdown("**Dias de estoque por produto**")
+if prev_produtos.empty:
+    st.info("Sem saldo para projetar com os filtros atuais.")
+else:
+    tabela_produtos = prev_produtos.sort_values(['dias_estoque', 'estudo', 'produto']).replace([np.inf, -np.inf], np.nan)
+    tabela_produtos['ruptura_prevista'] = tabela_produtos['ruptura_prevista'].apply(fmt_date_br)
+    colunas_consumo = {f"consumo_{j}d": f"Consumo/dia ({j}d)" for j in JANELAS_DIAS}
+    st.dataframe(
+        tabela_produtos[['estudo', 'produto', 'saldo_utilizavel', *colunas_consumo, 'dias_estoque', 'ruptura_prevista']]
+            .rename(columns={
+                'estudo': 'Estudo',
+                'produto': 'Produto',
+                'saldo_utilizavel': 'Saldo utilizável',
+                **colunas_consumo,
+                'dias_estoque': 'Dias de estoque',
+                'ruptura_prevista': 'Ruptura prevista'
+            }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            **{c: st.column_config.NumberColumn(format="%.1f") for c in colunas_consumo.values()},
+            "Saldo utilizável": st.column_config.NumberColumn(format="%.0f"),
+            "Dias de estoque": st.column_config.NumberColumn(format="%.0f", help="Vazio quando não houve Saídas nas janelas."),
+        }
+    )
+
+st.markdown("**Lotes que devem vencer antes de serem consumidos**")
+if em_risco.empty:
+    st.success("Nenhum lote em risco de vencer com o consumo atual.")
+else:
+    tabela_risco = em_risco.sort_values(['dias_para_vencer', 'estudo', 'produto']).replace([np.inf, -np.inf], np.nan)
+    tabela_risco['Farol'] = farois(tabela_risco['validade'])
+    tabela_risco['Validade (BR)'] = tabela_risco['validade'].apply(fmt_date_br)
+    st.dataframe(
+        tabela_risco[['Farol', 'estudo', 'produto', 'Validade (BR)', 'lote', 'saldo', 'dias_para_vencer',
+                      'dias_ate_consumir', 'qtd_em_risco']]
+            .rename(columns={
+                'estudo': 'Estudo',
+                'produto': 'Produto',
+                'lote': 'Lote',
+                'saldo': 'Saldo',
+                'dias_para_vencer': 'Dias p/ vencer',
+                'dias_ate_consumir': 'Dias p/ consumir',
+                'qtd_em_risco': 'Em risco de vencer'
+            }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Saldo": st.column_config.NumberColumn(format="%.0f"),
+            "Dias p/ vencer": st.column_config.NumberColumn(format="%.0f"),
+            "Dias p/ consumir": st.column_config.NumberColumn(format="%.0f", help="Vazio para lotes já vencidos ou sem consumo."),
+            "Em risco de vencer": st.column_config.NumberColumn(format="%.0f"),
+        }
+    )
@@ -1,169 +1,433 @@
-import streamlit as st
-import pandas as pd
-from datetime import date, datetime
-from database import get_data, insert_data, obter_saldo
-import time
-
-st.set_page_config(page_title="Movimentações", layout="wide")
-st.title("📝 Registro de Movimentações")
-
-# ---------------------------
-# Helpers
-# ---------------------------
-def fmt_date(d) -> str:
-    """Formata date/datetime/str para dd/mm/aaaa apenas para exibição."""
-    if d in (None, "", "N/A"):
-        return "—"
-    try:
-        if isinstance(d, (date, datetime)):
-            return d.strftime("%d/%m/%Y")
-        # tentar parsear string
-        dt = pd.to_datetime(d, errors="coerce")
-        if pd.isna(dt):
-            return str(d)
-        return dt.strftime("%d/%m/%Y")
-    except Exception:
-        return str(d)
-
-# Gatekeeper: apenas gestor
-user = st.session_state.get('user')
-if not user:
-    st.error("Faça login para continuar."); st.stop()
-if user.get('role') != 'gestor':
-    st.error("Acesso restrito a gestores."); st.stop()
-
-# ---------------------------
-# Carregar dimensões
-# ---------------------------
-def df_or_empty(records, cols_rename=None):
-    df = pd.DataFrame(records or [])
-    if cols_rename:
-        df = df.rename(columns=cols_rename)
-    return df
-
-estudos = df_or_empty(get_data("estudos", "id, nome"))
-produtos = df_or_empty(get_data("produtos", "id, nome, estudo_id, tipo_produto"))
-localizacoes = df_or_empty(get_data("localizacao", "nome"))
-tipos_acao = df_or_empty(get_data("tipo_acao", "nome"))
-
-# ---------------------------
-# Formulário
-# ---------------------------
-col1, col2 = st.columns(2)
-with col1:
-    tipo_transacao = st.selectbox("Tipo de Transação", ["Entrada", "Saída"])
-    estudo = st.selectbox("Estudo", estudos['nome'] if not estudos.empty else [])
-    estudo_id = int(estudos.loc[estudos['nome'] == estudo, 'id'].values[0]) if not estudos.empty and estudo else None
-
-with col2:
-    data_acao = date.today()
-    st.info(f"Data da Ação: **{fmt_date(data_acao)}**")
-    quantidade = st.number_input("Quantidade", min_value=1, step=1)
-
-# Produtos filtrados pelo estudo
-produtos_estudo = produtos[produtos['estudo_id'] == estudo_id] if (estudo_id is not None) else pd.DataFrame()
-produto = st.selectbox("Produto", produtos_estudo['nome'] if not produtos_estudo.empty else [])
-produto_id = int(produtos_estudo.loc[produtos_estudo['nome'] == produto, 'id'].values[0]) if not produtos_estudo.empty and produto else None
-tipo_produto = produtos_estudo.loc[produtos_estudo['nome'] == produto, 'tipo_produto'].values[0] if not produtos_estudo.empty and produto else ''
-
-st.markdown(f"**Tipo de Produto:** {tipo_produto if tipo_produto else '-'}")
-
-# Campos dependentes
-validade = None
-lote = None
-
-if tipo_transacao == 'Entrada':
-    cva, cvb = st.columns([1, 2])
-    with cva:
-        sem_validade = st.checkbox("Sem validade", value=True, help="Desmarque para informar uma data de validade.")
-    with cvb:
-        if sem_validade:
-            validade = None
-        else:
-            validade = st.date_input("Validade", value=date.today())
-    lote = st.text_input("Lote")
-else:
-    # Para saída, puxamos as opções existentes para ESTE estudo+produto
-    base_movs = df_or_empty(get_data("movimentacoes", "validade, lote, estudo_id, produto_id"))
-    if not base_movs.empty and (estudo_id is not None) and (produto_id is not None):
-        base_movs = base_movs[(base_movs["estudo_id"] == estudo_id) & (base_movs["produto_id"] == produto_id)]
-    else:
-        base_movs = base_movs.iloc[0:0]  # vazio
-
-    # Opções de validade (como labels dd/mm/aaaa)
-    if not base_movs.empty and "validade" in base_movs.columns:
-        vdates = pd.to_datetime(base_movs["validade"], errors="coerce").dt.date.dropna().drop_duplicates().sort_values().tolist()
-    else:
-        vdates = []
-    validade_labels = ["Sem validade"] + [fmt_date(d) for d in vdates]
-    validade_map = {"Sem validade": None}
-    validade_map.update({fmt_date(d): d for d in vdates})
-    validade_label = st.selectbox("Validade", validade_labels)
-    validade = validade_map.get(validade_label)
-
-    # Opções de lote
-    if not base_movs.empty and "lote" in base_movs.columns:
-        lotes = base_movs["lote"].dropna().drop_duplicates().sort_values().astype(str).tolist()
-    else:
-        lotes = []
-    lote = st.selectbox("Lote", ["—"] + lotes)
-    lote = None if (lote == "—") else lote
-
-    # Mostra saldo disponível dinâmico (informativo)
-    if (estudo_id is not None) and (produto_id is not None):
-        saldo_preview = obter_saldo(estudo_id, produto_id, validade, lote)
-        st.caption(
-            f"Saldo disponível para **{produto or '—'}** | "
-            f"**Validade:** {fmt_date(validade)} | **Lote:** {lote or '—'} → "
-            f"**{int(saldo_preview)}**"
-        )
-
-nota = st.text_input("Nota Fiscal")
-tipo_acao_sel = st.selectbox("Tipo de Ação", tipos_acao['nome'] if not tipos_acao.empty else [])
-consideracoes = st.text_area("Considerações")
-localizacao = st.selectbox("Localização", localizacoes['nome'] if not localizacoes.empty else [])
-
-responsavel = user.get('username')
-st.caption(f"Responsável: **{responsavel}**")
-
-# ---------------------------
-# Salvar
-# ---------------------------
-if st.button("Salvar Movimentação", type="primary"):
-    if (estudo_id is None) or (produto_id is None):
-        st.error("Selecione **Estudo** e **Produto**.")
-        st.stop()
-
-    if tipo_transacao == 'Saída':
-        saldo_atual = obter_saldo(estudo_id, produto_id, validade, lote)
-        if quantidade > (saldo_atual or 0):
-            st.error(
-                f"Não foi possível registrar a saída: quantidade informada (**{int(quantidade)}**) "
-                f"excede o saldo disponível (**{int(saldo_atual or 0)}**)\n\n"
-                f"**Produto:** {produto or '—'} | **Validade:** {fmt_date(validade)} | **Lote:** {lote or '—'}"
-            )
-            st.stop()
-
-    payload = {
-        "data": str(data_acao),  # mantemos ISO no banco; exibimos em BR no app
-        "tipo_transacao": tipo_transacao,
-        "estudo_id": estudo_id,
-        "produto_id": produto_id,
-        "tipo_produto": tipo_produto,
-        "quantidade": int(quantidade),
-        "validade": str(validade) if validade else None,
-        "lote": lote if lote else None,
-        "nota": nota if nota else None,
-        "tipo_acao": tipo_acao_sel if tipo_acao_sel else None,
-        "consideracoes": consideracoes if consideracoes else None,
-        "responsavel": responsavel,
-        "localizacao": localizacao if localizacao else None
-    }
-
-    try:
-        insert_data("movimentacoes", payload)
-        st.success("Movimentação registrada com sucesso!")
-        time.sleep(1.2)
-        st.rerun()
-    except Exception as e:
-        st.error(f"Erro ao salvar movimentação: {e}")
+import streamlit as st
+import pandas as pd
+from datetime import date, datetime
+from database import insert_data, obter_saldo, obter_movimentacoes_produtos
+from repositorio import repositorio_do_usuario
+from cubo import TRANSFERENCIA, CuboSaldos, montar_cubo, alocar_fefo, valor_gravado
+import re
+import time
+from memoria import registrar_sessao
+
+st.set_page_config(page_title="Movimentações", layout="wide")
+st.title("📝 Registro de Movimentações")
+
+# Acima deste número de produtos no estudo, o seletor ganha um campo de busca
+LIMIAR_BUSCA_PRODUTO = 50
+MAX_OPCOES_BUSCA = 50
+
+# Modo leitor: linhas de saída acumuladas no carrinho da sessão
+CHAVE_CARRINHO = "carrinho_saidas"
+CHAVE_AVISO_CARRINHO = "carrinho_aviso"
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def fmt_date(d) -> str:
+    """Formata date/datetime/str para dd/mm/aaaa apenas para exibição."""
+    if d in (None, "", "N/A"):
+        return "—"
+    try:
+        if isinstance(d, (date, datetime)):
+            return d.strftime("%d/%m/%Y")
+        # tentar parsear string
+        dt = pd.to_datetime(d, errors="coerce")
+        if pd.isna(dt):
+            return str(d)
+        return dt.strftime("%d/%m/%Y")
+    except Exception:
+        return str(d)
+
+def interpretar_codigo(codigo: str, quantidade: int):
+    """Lê "lote" ou "quantidade*lote" (prefixo de multiplicação dos leitores). Retorna (quantidade, lote)."""
+    m = re.fullmatch(r"\s*(\d+)\s*[*xX]\s*(.+?)\s*", codigo)
+    if m:
+        return int(m.group(1)), m.group(2)
+    return int(quantidade), codigo.strip()
+
+# Gatekeeper: apenas gestor
+registrar_sessao()
+user = st.session_state.get('user')
+if not user:
+    st.error("Faça login para continuar."); st.stop()
+if user.get('role') != 'gestor':
+    st.error("Acesso restrito a gestores."); st.stop()
+
+# ---------------------------
+# Carregar dimensões
+# ---------------------------
+def df_or_empty(records, cols_rename=None):
+    df = pd.DataFrame(records or [])
+    if cols_rename:
+        df = df.rename(columns=cols_rename)
+    return df
+
+# Dimensões em cache no repositório compartilhado (atualizadas pelo change feed)
+repo = repositorio_do_usuario(user)
+estudos = repo.tabela("estudos")
+produtos = repo.tabela("produtos")
+localizacoes = repo.tabela("localizacao")
+tipos_acao = repo.tabela("tipo_acao")
+
+# ---------------------------
+# Modo leitor (carrinho de saídas)
+# ---------------------------
+modo_leitor = st.toggle(
+    "⚡ Modo leitor",
+    help="Várias saídas em sequência: leia ou digite o lote (Enter adiciona ao carrinho) e registre todas de uma vez."
+)
+if modo_leitor:
+    carrinho = st.session_state.setdefault(CHAVE_CARRINHO, [])
+    aviso = st.session_state.pop(CHAVE_AVISO_CARRINHO, None)
+    if aviso:
+        st.success(aviso)
+
+    c_estudo, c_acao, c_local = st.columns(3)
+    with c_estudo:
+        # O carrinho é de um estudo só: troca de estudo liberada com o carrinho vazio
+        estudo = st.selectbox("Estudo", estudos['nome'] if not estudos.empty else [], disabled=bool(carrinho))
+        if carrinho:
+            estudo = carrinho[0]["estudo"]
+    with c_acao:
+        nomes_acao = tipos_acao['nome'].tolist() if not tipos_acao.empty else []
+        tipo_acao_sel = st.selectbox("Tipo de Ação", nomes_acao,
+                                     index=nomes_acao.index("Dispensação") if "Dispensação" in nomes_acao else 0)
+    with c_local:
+        # As saídas saem desta localização: fixa enquanto houver itens no carrinho
+        localizacao = st.selectbox("Localização", localizacoes['nome'] if not localizacoes.empty else [],
+                                   disabled=bool(carrinho))
+        if carrinho:
+            localizacao = carrinho[0]["localizacao"]
+    estudo_id = int(estudos.loc[estudos['nome'] == estudo, 'id'].values[0]) if not estudos.empty and estudo else None
+
+    # Saldos por lote na localização, do cubo em cache: a conferência de cada leitura não vai ao banco
+    lotes_estudo = repo.derivado("cubo").saldos_lote(localizacao or "")
+    lotes_estudo = lotes_estudo[(lotes_estudo["estudo_id"] == estudo_id) & (lotes_estudo["saldo"] > 0)]
+
+    with st.form("leitor", clear_on_submit=True):
+        c_codigo, c_qtd = st.columns([3, 1])
+        with c_codigo:
+            codigo = st.text_input("Código do lote", placeholder="Leia o código ou digite o lote (ex.: L123 ou 3*L123)")
+        with c_qtd:
+            qtd_padrao = st.number_input("Quantidade por leitura", min_value=1, step=1, value=1)
+        adicionar = st.form_submit_button("Adicionar ao carrinho")
+
+    if adicionar and codigo.strip():
+        qtd_lida, lote_lido = interpretar_codigo(codigo, qtd_padrao)
+        candidatos = lotes_estudo[lotes_estudo["lote"].str.casefold() == lote_lido.casefold()]
+        if candidatos.empty:
+            st.error(f"Lote **{lote_lido}** sem saldo em **{estudo or '—'}** / **{localizacao or 'sem localização'}**.")
+        elif len(candidatos) > 1:
+            nomes = produtos.set_index('id')['nome']
+            opcoes = "; ".join(f"{nomes.get(c.produto_id, c.produto_id)} (validade {fmt_date(c.validade)})"
+                               for c in candidatos.itertuples())
+            st.error(f"Lote **{lote_lido}** existe em mais de um produto/validade ({opcoes}). Registre pelo formulário normal.")
+        else:
+            lote_sel = candidatos.iloc[0]
+            chave = (int(lote_sel["produto_id"]), lote_sel["validade"], lote_sel["lote"])
+            no_carrinho = sum(l["quantidade"] for l in carrinho if (l["produto_id"], l["validade"], l["lote"]) == chave)
+            disponivel = int(lote_sel["saldo"]) - no_carrinho
+            prod = produtos[produtos['id'] == chave[0]]
+            nome_produto = prod['nome'].values[0] if not prod.empty else str(chave[0])
+            if qtd_lida > disponivel:
+                st.error(
+                    f"**{nome_produto}** | Lote **{chave[2]}**: quantidade (**{qtd_lida}**) excede o saldo "
+                    f"disponível em **{localizacao or 'sem localização'}** (**{disponivel}**, já descontado o carrinho)."
+                )
+            else:
+                linha = next((l for l in carrinho if (l["produto_id"], l["validade"], l["lote"]) == chave), None)
+                if linha is None:
+                    carrinho.append({
+                        "estudo": estudo, "estudo_id": estudo_id, "localizacao": localizacao,
+                        "produto_id": chave[0], "produto": nome_produto,
+                        "tipo_produto": prod['tipo_produto'].values[0] if not prod.empty else None,
+                        "validade": chave[1], "lote": chave[2], "quantidade": qtd_lida,
+                        # Como gravados no banco: a Saída cai no mesmo lote (chave acima é só para agrupar)
+                        "validade_gravada": valor_gravado(lote_sel["validade_gravada"]),
+                        "lote_gravado": valor_gravado(lote_sel["lote_gravado"]),
+                    })
+                else:
+                    linha["quantidade"] += qtd_lida
+                st.toast(f"+{qtd_lida} {nome_produto} ({chave[2]})")
+
+    if not carrinho:
+        st.info("Carrinho vazio. Leia o código de um lote para começar.")
+        st.stop()
+
+    st.dataframe(
+        pd.DataFrame(carrinho)[["produto", "validade", "lote", "quantidade"]]
+          .assign(validade=lambda d: d["validade"].apply(fmt_date))
+          .rename(columns={"produto": "Produto", "validade": "Validade", "lote": "Lote", "quantidade": "Quantidade"}),
+        use_container_width=True, hide_index=True
+    )
+    st.caption(f"{len(carrinho)} lote(s), {sum(l['quantidade'] for l in carrinho)} unidade(s) | "
+               f"Localização: **{localizacao or '—'}** | Responsável: **{user.get('username')}**")
+
+    b_registrar, b_desfazer, b_limpar = st.columns([2, 1, 1])
+    if b_desfazer.button("↩️ Remover último", use_container_width=True):
+        carrinho.pop()
+        st.rerun()
+    if b_limpar.button("🗑️ Limpar carrinho", use_container_width=True):
+        carrinho.clear()
+        st.rerun()
+    if b_registrar.button(f"Registrar {len(carrinho)} saída(s)", type="primary", use_container_width=True):
+        # Conferência final com o banco: uma consulta para todos os produtos do carrinho
+        atual = CuboSaldos(montar_cubo(pd.DataFrame(
+            obter_movimentacoes_produtos(estudo_id, {l["produto_id"] for l in carrinho})
+        )))
+        faltas = [
+            f"**{l['produto']}** | Lote **{l['lote']}**: {l['quantidade']} > saldo {int(saldo)}"
+            for l in carrinho
+            if l["quantidade"] > (saldo := atual.saldo(estudo_id, l["produto_id"], l["validade"], l["lote"],
+                                                       localizacao=localizacao or ""))
+        ]
+        if faltas:
+            st.error("Saldo insuficiente (alterado desde a leitura):\n\n" + "\n\n".join(faltas))
+            st.stop()
+        payload = [{
+            "data": str(date.today()),
+            "tipo_transacao": "Saída",
+            "estudo_id": l["estudo_id"],
+            "produto_id": l["produto_id"],
+            "tipo_produto": l["tipo_produto"],
+            "quantidade": int(l["quantidade"]),
+            "validade": l["validade_gravada"],
+            "lote": l["lote_gravado"],
+            "nota": None,
+            "tipo_acao": tipo_acao_sel or None,
+            "consideracoes": None,
+            "responsavel": user.get('username'),
+            "localizacao": localizacao or None,
+        } for l in carrinho]
+        try:
+            # Um único insert com todas as linhas: grava o carrinho inteiro ou nada
+            insert_data("movimentacoes", payload)
+        except Exception as e:
+            st.error(f"Erro ao registrar o carrinho: {e}")
+            st.stop()
+        st.session_state[CHAVE_AVISO_CARRINHO] = f"{len(payload)} saída(s) registrada(s)."
+        carrinho.clear()
+        st.rerun()
+    st.stop()
+
+# ---------------------------
+# Formulário
+# ---------------------------
+col1, col2 = st.columns(2)
+with col1:
+    tipo_transacao = st.selectbox("Tipo de Transação", ["Entrada", "Saída", TRANSFERENCIA],
+                                  help="Transferência move o saldo de um lote entre localizações (Saída na origem + Entrada no destino).")
+    estudo = st.selectbox("Estudo", estudos['nome'] if not estudos.empty else [])
+    estudo_id = int(estudos.loc[estudos['nome'] == estudo, 'id'].values[0]) if not estudos.empty and estudo else None
+
+with col2:
+    data_acao = date.today()
+    st.info(f"Data da Ação: **{fmt_date(data_acao)}**")
+    quantidade = st.number_input("Quantidade", min_value=1, step=1)
+
+# Produtos filtrados pelo estudo
+produtos_estudo = produtos[produtos['estudo_id'] == estudo_id] if (estudo_id is not None) else pd.DataFrame()
+opcoes_produto = produtos_estudo['nome'] if not produtos_estudo.empty else []
+# Catálogos grandes: busca (sem acentos, por partes do nome) restringe as opções
+if len(produtos_estudo) > LIMIAR_BUSCA_PRODUTO:
+    termo_produto = st.text_input("Buscar produto", help="Ignora acentos e aceita partes das palavras (ex.: \"sol sal\").")
+    if termo_produto.strip():
+        ranking = repo.derivado("indice_produtos").buscar(
+            termo_produto, limite=MAX_OPCOES_BUSCA, ids=set(produtos_estudo['id'])
+        )
+        opcoes_produto = produtos_estudo.set_index('id').loc[[pid for pid, _ in ranking], 'nome']
+produto = st.selectbox("Produto", opcoes_produto)
+produto_id = int(produtos_estudo.loc[produtos_estudo['nome'] == produto, 'id'].values[0]) if not produtos_estudo.empty and produto else None
+tipo_produto = produtos_estudo.loc[produtos_estudo['nome'] == produto, 'tipo_produto'].values[0] if not produtos_estudo.empty and produto else ''
+
+st.markdown(f"**Tipo de Produto:** {tipo_produto if tipo_produto else '-'}")
+
+# Campos dependentes
+validade = None
+lote = None
+alocacao = None
+
+# Saída sem escolher o lote: repartida entre os lotes pela validade mais próxima
+alocar_auto = tipo_transacao == 'Saída' and st.checkbox(
+    "Alocar automaticamente (FEFO)",
+    help="Reparte a quantidade entre os lotes do produto guardados na localização escolhida, da validade mais "
+         "próxima para a mais distante (lotes vencidos ficam de fora), e grava uma Saída por lote."
+)
+
+if tipo_transacao == 'Entrada':
+    cva, cvb = st.columns([1, 2])
+    with cva:
+        sem_validade = st.checkbox("Sem validade", value=True, help="Desmarque para informar uma data de validade.")
+    with cvb:
+        if sem_validade:
+            validade = None
+        else:
+            validade = st.date_input("Validade", value=date.today())
+    lote = st.text_input("Lote")
+elif alocar_auto:
+    # Proposta preenchida depois da escolha da localização (abaixo)
+    area_fefo = st.container()
+else:
+    # Para saída/transferência, puxamos as opções existentes para ESTE estudo+produto
+    base_movs = repo.tabela("movimentacoes")
+    if not base_movs.empty and (estudo_id is not None) and (produto_id is not None):
+        base_movs = base_movs[(base_movs["estudo_id"] == estudo_id) & (base_movs["produto_id"] == produto_id)]
+    else:
+        base_movs = base_movs.iloc[0:0]  # vazio
+
+    # Opções de validade (como labels dd/mm/aaaa)
+    if not base_movs.empty and "validade" in base_movs.columns:
+        vdates = pd.to_datetime(base_movs["validade"], errors="coerce").dt.date.dropna().drop_duplicates().sort_values().tolist()
+    else:
+        vdates = []
+    validade_labels = ["Sem validade"] + [fmt_date(d) for d in vdates]
+    validade_map = {"Sem validade": None}
+    validade_map.update({fmt_date(d): d for d in vdates})
+    validade_label = st.selectbox("Validade", validade_labels)
+    validade = validade_map.get(validade_label)
+
+    # Opções de lote
+    if not base_movs.empty and "lote" in base_movs.columns:
+        lotes = base_movs["lote"].dropna().drop_duplicates().sort_values().astype(str).tolist()
+    else:
+        lotes = []
+    lote = st.selectbox("Lote", ["—"] + lotes)
+    lote = None if (lote == "—") else lote
+
+    # Mostra saldo disponível dinâmico (informativo)
+    if (estudo_id is not None) and (produto_id is not None):
+        saldo_preview = obter_saldo(estudo_id, produto_id, validade, lote)
+        st.caption(
+            f"Saldo disponível para **{produto or '—'}** | "
+            f"**Validade:** {fmt_date(validade)} | **Lote:** {lote or '—'} → "
+            f"**{int(saldo_preview)}**"
+        )
+        # Saldo do lote em cada localização (cubo do repositório, sem nova consulta ao banco)
+        por_local = repo.derivado("cubo").saldos_por_local(estudo_id, produto_id, validade, lote)
+        por_local = {local or "Sem localização": v for local, v in por_local.items() if v}
+        if por_local:
+            st.caption("Por localização: " + " | ".join(f"**{local}:** {int(v)}" for local, v in sorted(por_local.items())))
+
+opcoes_local = localizacoes['nome'] if not localizacoes.empty else []
+if tipo_transacao == TRANSFERENCIA:
+    nota, tipo_acao_sel = None, TRANSFERENCIA
+    consideracoes = st.text_area("Considerações")
+    col_origem, col_destino = st.columns(2)
+    with col_origem:
+        localizacao = st.selectbox("Localização de origem", opcoes_local)
+    with col_destino:
+        destino = st.selectbox("Localização de destino", opcoes_local)
+else:
+    nota = st.text_input("Nota Fiscal")
+    tipo_acao_sel = st.selectbox("Tipo de Ação", tipos_acao['nome'] if not tipos_acao.empty else [])
+    consideracoes = st.text_area("Considerações")
+    localizacao = st.selectbox("Localização", opcoes_local)
+
+if alocar_auto and (estudo_id is not None) and (produto_id is not None):
+    # Proposta a partir dos saldos por lote NA localização escolhida (cubo em cache); conferida de novo ao salvar
+    with area_fefo:
+        lotes_produto = repo.derivado("cubo").saldos_lote(localizacao or "")
+        lotes_produto = lotes_produto[(lotes_produto["estudo_id"] == estudo_id) & (lotes_produto["produto_id"] == produto_id)]
+        alocacao, falta = alocar_fefo(lotes_produto, quantidade)
+        if not alocacao.empty:
+            st.dataframe(
+                alocacao.assign(validade=alocacao["validade"].apply(fmt_date), lote=alocacao["lote"].replace("", "—"))
+                        [["validade", "lote", "saldo", "quantidade"]]
+                        .rename(columns={"validade": "Validade", "lote": "Lote", "saldo": "Saldo", "quantidade": "Quantidade"}),
+                use_container_width=True, hide_index=True,
+                column_config={c: st.column_config.NumberColumn(format="%.0f") for c in ["Saldo", "Quantidade"]},
+            )
+        if falta > 0:
+            st.warning(f"Saldo não vencido em **{localizacao or 'sem localização'}** insuficiente: "
+                       f"faltam **{int(falta)}** de **{int(quantidade)}**.")
+        else:
+            st.caption(f"{len(alocacao)} saída(s) serão registradas para **{produto or '—'}** "
+                       f"em **{localizacao or 'sem localização'}**.")
+
+responsavel = user.get('username')
+st.caption(f"Responsável: **{responsavel}**")
+
+# ---------------------------
+# Salvar
+# ---------------------------
+if st.button("Salvar Movimentação", type="primary"):
+    if (estudo_id is None) or (produto_id is None):
+        st.error("Selecione **Estudo** e **Produto**.")
+        st.stop()
+
+    if alocar_auto:
+        # Conferência final com o banco: a alocação é refeita sobre os saldos atuais do produto
+        atual = CuboSaldos(montar_cubo(pd.DataFrame(obter_movimentacoes_produtos(estudo_id, [produto_id]))))
+        alocacao, falta = alocar_fefo(atual.saldos_lote(localizacao or ""), quantidade)
+        if falta > 0:
+            st.error(
+                f"Não foi possível registrar a saída: quantidade informada (**{int(quantidade)}**) "
+                f"excede o saldo não vencido (**{int(quantidade - falta)}**) de **{produto or '—'}** "
+                f"em **{localizacao or 'sem localização'}**."
+            )
+            st.stop()
+    elif tipo_transacao == 'Saída':
+        # Saldo na localização em que a Saída será gravada (como no leitor e no FEFO)
+        saldo_atual = obter_saldo(estudo_id, produto_id, validade, lote, localizacao=localizacao or "")
+        if quantidade > (saldo_atual or 0):
+            st.error(
+                f"Não foi possível registrar a saída: quantidade informada (**{int(quantidade)}**) "
+                f"excede o saldo em **{localizacao or 'sem localização'}** (**{int(saldo_atual or 0)}**)\n\n"
+                f"**Produto:** {produto or '—'} | **Validade:** {fmt_date(validade)} | **Lote:** {lote or '—'}"
+            )
+            st.stop()
+
+    if tipo_transacao == TRANSFERENCIA:
+        if not localizacao or not destino or localizacao == destino:
+            st.error("Escolha localizações de **origem** e **destino** diferentes.")
+            st.stop()
+        saldo_origem = obter_saldo(estudo_id, produto_id, validade, lote, localizacao=localizacao)
+        if quantidade > (saldo_origem or 0):
+            st.error(
+                f"Não foi possível registrar a transferência: quantidade informada (**{int(quantidade)}**) "
+                f"excede o saldo em **{localizacao}** (**{int(saldo_origem or 0)}**)\n\n"
+                f"**Produto:** {produto or '—'} | **Validade:** {fmt_date(validade)} | **Lote:** {lote or '—'}"
+            )
+            st.stop()
+
+    payload = {
+        "data": str(data_acao),  # mantemos ISO no banco; exibimos em BR no app
+        "tipo_transacao": tipo_transacao,
+        "estudo_id": estudo_id,
+        "produto_id": produto_id,
+        "tipo_produto": tipo_produto,
+        "quantidade": int(quantidade),
+        "validade": str(validade) if validade else None,
+        "lote": lote if lote else None,
+        "nota": nota if nota else None,
+        "tipo_acao": tipo_acao_sel if tipo_acao_sel else None,
+        "consideracoes": consideracoes if consideracoes else None,
+        "responsavel": responsavel,
+        "localizacao": localizacao if localizacao else None
+    }
+
+    if alocar_auto:
+        # Uma Saída por lote alocado, num único insert: grava todas ou nenhuma
+        payload = [
+            {**payload, "quantidade": int(a.quantidade),
+             "validade": valor_gravado(a.validade_gravada), "lote": valor_gravado(a.lote_gravado)}
+            for a in alocacao.itertuples()
+        ]
+    elif tipo_transacao == TRANSFERENCIA:
+        # Par Saída (origem) + Entrada (destino) num único insert: grava os dois ou nenhum
+        payload = [
+            {**payload, "tipo_transacao": "Saída"},
+            {**payload, "tipo_transacao": "Entrada", "localizacao": destino},
+        ]
+
+    try:
+        insert_data("movimentacoes", payload)
+        if alocar_auto:
+            st.success(f"{len(payload)} saída(s) registrada(s): " +
+                       ", ".join(f"{p['lote'] or '—'} ({p['quantidade']})" for p in payload))
+        else:
+            st.success("Transferência registrada com sucesso!" if tipo_transacao == TRANSFERENCIA
+                       else "Movimentação registrada com sucesso!")
+        time.sleep(1.2)
+        st.rerun()
+    except Exception as e:
+        st.error(f"Erro ao salvar movimentação: {e}")
@@ -1,88 +1,179 @@
-# 0_Gestão_de_Acessos.py
-import streamlit as st
-import pandas as pd
-import time
-from database import conectar, criar_usuario, atualizar_usuario, deletar_usuario, get_data
-
-st.set_page_config(page_title="Gestão de Acessos", layout="wide")
-st.title("🔐 Gestão de Acessos")
-
-# Gatekeeper
-user = st.session_state.get('user')
-if not user:
-    st.error("Faça login para continuar."); st.stop()
-if user['role'] != 'gestor':
-    st.error("Acesso restrito a gestores."); st.stop()
-
-# Não precisamos mais do objeto 'conn' do SQLite
-# As funções de get_data, etc., já cuidam da conexão
-
-st.subheader("Usuários cadastrados")
-# Substitua a consulta pd.read_sql() por get_data()
-df = pd.DataFrame(get_data("users", "id, username, role, is_active"))
-
-if not df.empty:
-    df = df.sort_values(by='username')
-
-st.dataframe(df, width='stretch', hide_index=True)
-
-st.divider()
-st.subheader("➕ Criar novo usuário")
-col1, col2, col3 = st.columns([2,2,2])
-with col1:
-    novo_user = st.text_input("Usuário *")
-with col2:
-    novo_pass = st.text_input("Senha *", type="password")
-with col3:
-    novo_role = st.selectbox("Perfil *", ["visualizador", "gestor"], index=0)
-
-if st.button("Criar usuário", type="primary"):
-    if not novo_user or not novo_pass:
-        st.warning("Informe usuário e senha.")
-    else:
-        try:
-            # A função criar_usuario já foi adaptada para o Supabase
-            criar_usuario(novo_user, novo_pass, novo_role, True)
-            st.success("Usuário criado.")
-            time.sleep(1.5)
-            st.rerun()
-            
-        except Exception as e:
-            st.error(f"Erro ao criar: {e}")
-
-st.divider()
-st.subheader("✏️ Editar usuário")
-if not df.empty:
-    sel = st.selectbox("Selecione o ID", df['id'].tolist())
-    registro = df[df['id']==sel].iloc[0]
-    e_user = st.text_input("Usuário", registro['username'])
-    e_role = st.selectbox("Perfil", ["visualizador","gestor"], index=0 if registro['role']=="visualizador" else 1)
-    e_active = st.checkbox("Ativo", bool(registro['is_active']))
-    e_pass = st.text_input("Nova senha (opcional)", type="password", help="Deixe em branco para manter a atual")
-
-    colA, colB = st.columns(2)
-    if colA.button("Salvar alterações", type="primary"):
-        try:
-            # A função atualizar_usuario já foi adaptada para o Supabase
-            atualizar_usuario(sel,
-                              username=e_user if e_user != registro['username'] else None,
-                              password=e_pass if e_pass else None,
-                              role=e_role if e_role != registro['role'] else None,
-                              is_active=e_active if e_active != bool(registro['is_active']) else None)
-            st.success("Usuário atualizado.")
-            time.sleep(1.5)
-            st.rerun()
-        except Exception as e:
-            st.error(f"Erro ao atualizar: {e}")
-
-    if colB.button("Excluir usuário", type="secondary"):
-        if registro['username'] == 'admin':
-            st.warning("Não é permitido excluir o admin padrão.")
-        else:
-            # A função deletar_usuario já foi adaptada para o Supabase
-            deletar_usuario(sel)
-            st.success("Usuário excluído.")
-            time.sleep(1.5)
-            st.rerun()
-
+# 0_Gestão_de_Acessos.py
+import streamlit as st
+import pandas as pd
+import time
+from database import (conectar, criar_usuario, atualizar_usuario, deletar_usuario, get_data,
+                      obter_usuario, definir_estudos_usuario)
+from repositorio import repositorios_ativos
+from auditoria import TABELAS_AUDITADAS, alteracoes_do_periodo, legivel
+from datetime import date
+from memoria import registrar_sessao, relatorio as relatorio_memoria, resumo as resumo_memoria, IDADE_MINIMA_S
+
+st.set_page_config(page_title="Gestão de Acessos", layout="wide")
+st.title("🔐 Gestão de Acessos")
+
+# Gatekeeper
+registrar_sessao()
+user = st.session_state.get('user')
+if not user:
+    st.error("Faça login para continuar."); st.stop()
+if user['role'] != 'gestor':
+    st.error("Acesso restrito a gestores."); st.stop()
+
+# Não precisamos mais do objeto 'conn' do SQLite
+# As funções de get_data, etc., já cuidam da conexão
+
+st.subheader("Usuários cadastrados")
+# Substitua a consulta pd.read_sql() por get_data()
+df = pd.DataFrame(get_data("users", "id, username, role, is_active, todos_estudos"))
+
+# Estudos atribuídos (escopo de dados de cada usuário: todos_estudos ou só os atribuídos, nenhum se vazio)
+df_estudos = pd.DataFrame(get_data("estudos", "id, nome"))
+nomes_estudo = dict(zip(df_estudos['id'], df_estudos['nome'])) if not df_estudos.empty else {}
+atribuicoes = pd.DataFrame(get_data("usuarios_estudos", "usuario_id, estudo_id"))
+estudos_por_usuario = (
+    atribuicoes.groupby('usuario_id')['estudo_id'].apply(sorted).to_dict() if not atribuicoes.empty else {}
+)
+
+if not df.empty:
+    df = df.sort_values(by='username')
+    df['estudos'] = [
+        "(Todos)" if todos else ", ".join(nomes_estudo.get(e, str(e)) for e in estudos_por_usuario.get(uid, [])) or "(Nenhum)"
+        for uid, todos in zip(df['id'], df['todos_estudos'].fillna(False).astype(bool))
+    ]
+
+st.dataframe(df, width='stretch', hide_index=True)
+
+st.divider()
+st.subheader("➕ Criar novo usuário")
+col1, col2, col3 = st.columns([2,2,2])
+with col1:
+    novo_user = st.text_input("Usuário *")
+with col2:
+    novo_pass = st.text_input("Senha *", type="password")
+with col3:
+    novo_role = st.selectbox("Perfil *", ["visualizador", "gestor"], index=0)
+novo_todos = st.checkbox("Todos os estudos", value=True, key="novo_todos")
+novos_estudos = st.multiselect(
+    "Estudos", list(nomes_estudo), format_func=lambda e: nomes_estudo[e], disabled=novo_todos,
+    help="Estudos que o usuário pode ver (sem nenhum, ele não vê dados)."
+)
+
+if st.button("Criar usuário", type="primary"):
+    if not novo_user or not novo_pass:
+        st.warning("Informe usuário e senha.")
+    else:
+        try:
+            # A função criar_usuario já foi adaptada para o Supabase
+            # Restrito desde a criação: se atribuir os estudos falhar, ele fica sem nenhum
+            criar_usuario(novo_user, novo_pass, novo_role, True, todos_estudos=novo_todos)
+            if not novo_todos and novos_estudos:
+                definir_estudos_usuario(obter_usuario(novo_user)["id"], novos_estudos)
+            st.success("Usuário criado.")
+            time.sleep(1.5)
+            st.rerun()
+            
+        except Exception as e:
+            st.error(f"Erro ao criar: {e}")
+
+st.divider()
+st.subheader("✏️ Editar usuário")
+if not df.empty:
+    sel = st.selectbox("Selecione o ID", df['id'].tolist())
+    registro = df[df['id']==sel].iloc[0]
+    e_user = st.text_input("Usuário", registro['username'])
+    e_role = st.selectbox("Perfil", ["visualizador","gestor"], index=0 if registro['role']=="visualizador" else 1)
+    e_active = st.checkbox("Ativo", bool(registro['is_active']))
+    todos_atual = bool(registro['todos_estudos']) if pd.notna(registro['todos_estudos']) else False
+    e_todos = st.checkbox("Todos os estudos", value=todos_atual, key=f"todos_{sel}")
+    estudos_atuais = [e for e in estudos_por_usuario.get(sel, []) if e in nomes_estudo]
+    e_estudos = st.multiselect(
+        "Estudos", list(nomes_estudo), default=estudos_atuais, format_func=lambda e: nomes_estudo[e],
+        disabled=e_todos,
+        help="Estudos que o usuário pode ver (sem nenhum, ele não vê dados). Vale a partir do próximo login."
+    )
+    e_pass = st.text_input("Nova senha (opcional)", type="password", help="Deixe em branco para manter a atual")
+
+    colA, colB = st.columns(2)
+    if colA.button("Salvar alterações", type="primary"):
+        try:
+            # A função atualizar_usuario já foi adaptada para o Supabase
+            atualizar_usuario(sel,
+                              username=e_user if e_user != registro['username'] else None,
+                              password=e_pass if e_pass else None,
+                              role=e_role if e_role != registro['role'] else None,
+                              is_active=e_active if e_active != bool(registro['is_active']) else None)
+            if e_todos != todos_atual or (not e_todos and sorted(e_estudos) != estudos_atuais):
+                definir_estudos_usuario(sel, e_estudos, todos=e_todos)
+            st.success("Usuário atualizado.")
+            time.sleep(1.5)
+            st.rerun()
+        except Exception as e:
+            st.error(f"Erro ao atualizar: {e}")
+
+    if colB.button("Excluir usuário", type="secondary"):
+        if registro['username'] == 'admin':
+            st.warning("Não é permitido excluir o admin padrão.")
+        else:
+            # A função deletar_usuario já foi adaptada para o Supabase
+            deletar_usuario(sel)
+            st.success("Usuário excluído.")
+            time.sleep(1.5)
+            st.rerun()
+
+st.divider()
+with st.expander("🕓 Auditoria"):
+    # Alterações de um período (consulta indexada por data na tabela auditoria)
+    c_periodo, c_tabela = st.columns([2, 1])
+    with c_periodo:
+        periodo = st.date_input("Período (UTC)", value=(date.today(), date.today()))
+    with c_tabela:
+        tabela_aud = st.selectbox("Tabela", ["(Todas)"] + list(TABELAS_AUDITADAS))
+    inicio_aud, fim_aud = (periodo if isinstance(periodo, (list, tuple)) and len(periodo) == 2
+                           else (periodo[0] if isinstance(periodo, (list, tuple)) else periodo,) * 2)
+    try:
+        aud = legivel(alteracoes_do_periodo(inicio_aud, fim_aud, None if tabela_aud == "(Todas)" else tabela_aud))
+        if aud.empty:
+            st.info("Nenhuma alteração no período.")
+        else:
+            st.caption(f"{aud[['tabela', 'registro_id', 'em']].drop_duplicates().shape[0]} alteração(ões), "
+                       f"{len(aud)} campo(s).")
+            st.dataframe(aud.rename(columns={
+                "em": "Quando (UTC)", "usuario": "Usuário", "operacao": "Operação", "tabela": "Tabela",
+                "registro_id": "Registro", "campo": "Campo", "antes": "Antes", "depois": "Depois",
+            }), width='stretch', hide_index=True)
+    except Exception as e:
+        st.warning(f"Não foi possível carregar a auditoria: {e}")
+
+with st.expander("📈 Cache compartilhado de movimentações"):
+    # Um repositório por escopo de estudos em uso (todos os estudos ou os de cada grupo de usuários)
+    for escopo, repo in sorted(repositorios_ativos().items(), key=lambda kv: (kv[0] is not None, kv[0] or ())):
+        stats = repo.estatisticas()
+        st.markdown("**Escopo:** " + ("todos os estudos" if escopo is None else
+                                      ", ".join(nomes_estudo.get(e, str(e)) for e in escopo)))
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Versão", stats["versao"])
+        m2.metric("Cargas no banco", stats["atualizacoes"])
+        m3.metric("Leituras atendidas", stats["leituras"], help=f"{stats['esperas']} aguardaram a carga de outra sessão")
+        m4.metric("Memória (MB)", f"{stats['memoria_total_bytes'] / 1e6:.1f}")
+        st.json(stats, expanded=False)
+
+with st.expander("🧠 Memória"):
+    # DataFrames guardados pelo processo: repositórios, relatórios, st.cache_data e session_state das sessões
+    resumo_mem = resumo_memoria()
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Total contabilizado (MB)", f"{resumo_mem['total_bytes'] / 1e6:.1f}")
+    m2.metric("Orçamento (MB)", f"{resumo_mem['orcamento_bytes'] / 1e6:.0f}" if resumo_mem["orcamento_bytes"] else "sem limite",
+              help="CEMEC_MEMORIA_MB: acima dele, os itens descartáveis usados há mais tempo saem da memória "
+                   f"(exceto os usados nos últimos {IDADE_MINIMA_S:.0f} s).")
+    m3.metric("Sessões", resumo_mem["sessoes"])
+    m4.metric("Itens descartados", resumo_mem["despejos"],
+              help=f"{resumo_mem['bytes_despejados'] / 1e6:.1f} MB liberados desde o início do processo")
+    maiores = relatorio_memoria(top=20)
+    if maiores.empty:
+        st.info("Nada em memória ainda.")
+    else:
+        st.dataframe(maiores, width='stretch', hide_index=True,
+                     column_config={"MB": st.column_config.NumberColumn(format="%.2f")})
+
 # A chamada 'conn.close()' não é mais necessária, pois a conexão é gerenciada pelo Streamlit
\ No newline at end of file
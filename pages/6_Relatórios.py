@@ -0,0 +1,107 @@
+import streamlit as st
+import pandas as pd
+from repositorio import repositorio_do_usuario, escopo_do_usuario
+from arquivamento import movimentacoes_arquivadas, versao_arquivo
+from relatorios import DIMENSOES, MEDIDAS, obter_motor, rotulo_mes
+from memoria import registrar_sessao
+
+st.set_page_config(page_title="Relatórios", layout="wide")
+st.title("📈 Relatórios")
+
+# ---------------------------
+# Gatekeeper (gestor e visualizador)
+# ---------------------------
+registrar_sessao()
+user = st.session_state.get('user')
+if not user:
+    st.error("Faça login para continuar.")
+    st.stop()
+
+# ---------------------------
+# Base mensal (agregada uma vez por versão do ledger, reagregando só os meses alterados)
+# ---------------------------
+escopo = escopo_do_usuario(user)
+repo = repositorio_do_usuario(user)
+motor = obter_motor(escopo)
+
+incluir_arquivados = st.checkbox("Incluir arquivados", value=False,
+                                 help="Soma as movimentações dos lotes encerrados que foram movidos para o arquivo.")
+try:
+    # Dados e versão lidos juntos (ler a versão antes de `tabela` recarregar
+    # guardaria a base nova sob a versão antiga)
+    movs, versao = repo.tabela_com_versao("movimentacoes")
+    estudos, versao_estudos = repo.tabela_com_versao("estudos")
+    produtos, versao_produtos = repo.tabela_com_versao("produtos")
+    arquivados = versao_arq = None
+    if incluir_arquivados:
+        try:
+            versao_arq = versao_arquivo(escopo)
+            arquivados = movimentacoes_arquivadas(escopo, versao_arq)
+            if not arquivados.empty:
+                # Arquivamento interrompido: não conta duas vezes o que ainda está no ledger
+                arquivados = arquivados[~arquivados["id"].isin(movs["id"])]
+        except Exception as e:
+            versao_arq = None
+            st.warning(f"Não foi possível carregar as movimentações arquivadas: {e}")
+    base = motor.base(movs, versao, arquivados, versao_arq)
+except Exception as e:
+    st.error(f"Erro ao carregar dados: {e}")
+    st.stop()
+
+meses = sorted(int(m) for m in base["mes"].unique() if m > 0) if not base.empty else []
+if not meses:
+    st.warning("Nenhuma movimentação registrada.")
+    st.stop()
+
+# ---------------------------
+# Configuração do relatório
+# ---------------------------
+c_linhas, c_colunas, c_medida = st.columns([2, 2, 1])
+with c_linhas:
+    linhas = st.multiselect("Linhas", list(DIMENSOES), default=["estudo", "tipo_produto"],
+                            format_func=DIMENSOES.get)
+with c_colunas:
+    colunas = st.multiselect("Colunas", [d for d in DIMENSOES if d not in linhas], default=["mes"],
+                             format_func=DIMENSOES.get)
+with c_medida:
+    medida = st.selectbox("Medida", list(MEDIDAS), index=list(MEDIDAS).index("saidas"), format_func=MEDIDAS.get)
+
+c_periodo, c_acum = st.columns([3, 1])
+with c_periodo:
+    if len(meses) > 1:
+        inicio, fim = st.select_slider("Período", options=meses, value=(meses[max(0, len(meses) - 12)], meses[-1]),
+                                       format_func=rotulo_mes)
+    else:
+        inicio = fim = meses[0]
+        st.caption(f"Período: {rotulo_mes(inicio)}")
+with c_acum:
+    acumulado = st.checkbox("Saldo acumulado", value=False, disabled=not (medida == "saldo" and colunas == ["mes"]),
+                            help="Com a medida Saldo líquido e só o Mês nas colunas: estoque ao fim de cada mês.")
+
+# ---------------------------
+# Pivô
+# ---------------------------
+chave_base = (versao, versao_estudos, versao_produtos, versao_arq)
+pivo = motor.pivot(base, linhas, colunas, medida, meses=(inicio, fim), acumulado=acumulado,
+                   estudos=estudos, produtos=produtos, chave_base=chave_base)
+
+if pivo.empty:
+    st.info("Nenhum dado para exibir com as opções atuais.")
+else:
+    numericas = [c for c in pivo.columns if c not in [DIMENSOES[d] for d in linhas]]
+    st.dataframe(
+        pivo,
+        width='stretch',
+        hide_index=True,
+        column_config={c: st.column_config.NumberColumn(format="%.0f") for c in numericas},
+    )
+    st.caption(
+        f"{MEDIDAS[medida]} de {rotulo_mes(inicio)} a {rotulo_mes(fim)}. "
+        "Transferências entre localizações não entram em Entradas/Saídas."
+    )
+    st.download_button(
+        "⬇️ Exportar CSV",
+        pivo.to_csv(index=False).encode("utf-8"),
+        file_name=f"relatorio_{medida}_{rotulo_mes(inicio)}_{rotulo_mes(fim)}.csv",
+        mime="text/csv",
+    )
@@ -0,0 +1,34 @@
+# perf.py
+"""
+Modo de medição do tempo de inicialização.
+
+Ative com a variável de ambiente CEMEC_PERF_STARTUP=1: cada etapa marcada
+com `marcar()` é registrada (em ms desde a importação deste módulo, que é o
+primeiro import do app.py) e impressa no log do servidor. O app.py também
+exibe o resumo na barra lateral.
+"""
+import os
+import sys
+import time
+
+ATIVO = os.environ.get("CEMEC_PERF_STARTUP", "").strip().lower() in ("1", "true", "sim")
+
+_T0 = time.perf_counter()
+_marcas = []
+
+def marcar(etapa: str):
+    """Registra o instante (ms desde o início do processo do app) de uma etapa."""
+    if not ATIVO:
+        return
+    ms = (time.perf_counter() - _T0) * 1000
+    _marcas.append((etapa, ms))
+    print(f"[startup] {etapa}: {ms:.0f} ms", file=sys.stderr, flush=True)
+
+def marcar_uma_vez(etapa: str):
+    """Como `marcar`, mas ignora a etapa se ela já tiver sido registrada."""
+    if ATIVO and all(e != etapa for e, _ in _marcas):
+        marcar(etapa)
+
+def marcas():
+    """Lista (etapa, ms) das etapas já registradas, na ordem em que ocorreram."""
+    return list(_marcas)
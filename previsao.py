@@ -0,0 +1,119 @@
+# previsao.py
+"""
+Previsão de consumo e de dias de estoque a partir do histórico de Saídas.
+
+Tudo é calculado em lote sobre o ledger inteiro (agrupamentos vetorizados do
+pandas, sem laço por produto):
+
+- Taxa de consumo por Estudo + Produto: soma das Saídas nas janelas de
+  JANELAS_DIAS dias até hoje (sem transferências entre localizações),
+  dividida pelo tamanho da janela. A taxa usada na
+  projeção é a da janela mais curta que teve consumo (a mais recente); sem
+  Saídas em nenhuma janela, a taxa é zero e o estoque não tem previsão de fim.
+- Dias de estoque: saldo utilizável do produto (lotes não vencidos) / taxa diária.
+- Risco de vencimento por lote: os lotes com saldo são consumidos em ordem de
+  validade (FEFO). Um lote está em risco quando a projeção só chega ao fim dele
+  depois da validade; a quantidade em risco é o que ainda sobraria no
+  vencimento. Lotes já vencidos ficam fora da fila, com o saldo todo em risco.
+"""
+from datetime import date
+import numpy as np
+import pandas as pd
+from cubo import TRANSFERENCIA
+
+JANELAS_DIAS = (30, 90)
+PRODUTO = ["estudo_id", "produto_id"]
+LOTE = PRODUTO + ["validade", "lote"]
+
+def _dias_desde(datas, hoje):
+    return (pd.Timestamp(hoje) - pd.to_datetime(datas, errors="coerce")).dt.days
+
+def taxas_consumo(df, hoje: date = None) -> pd.DataFrame:
+    """Consumo diário por Estudo + Produto em cada janela e a taxa usada na projeção."""
+    hoje = hoje or date.today()
+    colunas = [f"consumo_{j}d" for j in JANELAS_DIAS]
+    saidas = df[df["tipo_transacao"] == "Saída"] if not df.empty else df
+    if "tipo_acao" in saidas.columns:
+        # Transferências entre localizações não são consumo
+        saidas = saidas[saidas["tipo_acao"] != TRANSFERENCIA]
+    if saidas.empty:
+        # Colunas numéricas tipadas: vazias como object, a divisão em prever() deixa de ser vetorizada
+        return pd.DataFrame(columns=PRODUTO + colunas + ["taxa_diaria"]).astype(
+            {c: float for c in colunas + ["taxa_diaria"]})
+    idade = _dias_desde(saidas["data"], hoje)
+    qtd = pd.to_numeric(saidas["quantidade"], errors="coerce").fillna(0)
+    # Uma coluna por janela: quantidade se a Saída cai na janela, senão 0
+    base = saidas[PRODUTO].assign(**{
+        col: qtd.where((idade >= 0) & (idade < j), 0.0) for col, j in zip(colunas, JANELAS_DIAS)
+    })
+    taxas = base.groupby(PRODUTO, sort=False)[colunas].sum()
+    taxas = taxas / np.array(JANELAS_DIAS, dtype=float)
+    # Janela mais recente com consumo; bfill percorre as janelas da mais curta para a mais longa
+    taxas["taxa_diaria"] = taxas[colunas].where(taxas[colunas] > 0).bfill(axis=1).iloc[:, 0].fillna(0.0)
+    return taxas.reset_index()
+
+def saldos_por_lote(df) -> pd.DataFrame:
+    """Saldo de cada lote (Estudo + Produto + Validade + Lote)."""
+    if df.empty:
+        return pd.DataFrame(columns=LOTE + ["saldo"])
+    qtd = pd.to_numeric(df["quantidade"], errors="coerce").fillna(0)
+    sinal = np.select([df["tipo_transacao"] == "Entrada", df["tipo_transacao"] == "Saída"], [1.0, -1.0], 0.0)
+    base = df[LOTE].assign(saldo=qtd * sinal)
+    return base.groupby(LOTE, dropna=False, sort=False)["saldo"].sum().reset_index()
+
+def prever(df, hoje: date = None):
+    """
+    Retorna (produtos, lotes):
+    - produtos: por Estudo + Produto, saldo (total e utilizável), consumos por
+      janela, taxa diária, dias de estoque e data prevista de ruptura;
+    - lotes: por lote com saldo positivo, na ordem FEFO, dias de estoque
+      acumulados até o fim do lote, dias para vencer, `em_risco` e
+      `qtd_em_risco`.
+    """
+    hoje = hoje or date.today()
+    taxas = taxas_consumo(df, hoje)
+    lotes = saldos_por_lote(df)
+    lotes = lotes[lotes["saldo"] > 0]
+    if lotes.empty:
+        return _vazio_produtos(taxas), _vazio_lotes()
+
+    # FEFO: validade mais próxima primeiro; lotes sem validade por último
+    lotes = lotes.assign(validade_dt=pd.to_datetime(lotes["validade"], errors="coerce"))
+    lotes = lotes.sort_values(PRODUTO + ["validade_dt", "lote"], kind="mergesort", na_position="last")
+    lotes = lotes.merge(taxas[PRODUTO + ["taxa_diaria"]], on=PRODUTO, how="left")
+    lotes["taxa_diaria"] = lotes["taxa_diaria"].fillna(0.0)
+
+    taxa = lotes["taxa_diaria"].to_numpy()
+    dias_vencer = (lotes["validade_dt"] - pd.Timestamp(hoje)).dt.days.to_numpy(dtype=float)
+    # Lotes já vencidos não entram na fila de consumo: o saldo inteiro está em risco
+    vencido = dias_vencer < 0
+    lotes["saldo_utilizavel"] = np.where(vencido, 0.0, lotes["saldo"].to_numpy())
+    saldo = lotes["saldo_utilizavel"].to_numpy()
+    acumulado = lotes.groupby(PRODUTO, sort=False)["saldo_utilizavel"].cumsum().to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dias_consumir = np.where(vencido, np.nan, np.where(taxa > 0, acumulado / taxa, np.inf))
+    # Consumo previsto até a validade, descontado o que os lotes anteriores (FEFO) absorvem
+    consumido = np.clip(taxa * np.clip(np.nan_to_num(dias_vencer), 0, None) - (acumulado - saldo), 0, saldo)
+    em_risco = vencido | (~np.isnan(dias_vencer) & (dias_consumir > dias_vencer))
+    lotes["dias_ate_consumir"] = dias_consumir
+    lotes["dias_para_vencer"] = dias_vencer
+    lotes["em_risco"] = em_risco
+    lotes["qtd_em_risco"] = np.where(vencido, lotes["saldo"].to_numpy(), np.where(em_risco, saldo - consumido, 0.0))
+
+    produtos = lotes.groupby(PRODUTO, sort=False)[["saldo", "saldo_utilizavel"]].sum().reset_index()
+    produtos = produtos.merge(taxas, on=PRODUTO, how="left")
+    produtos = produtos.fillna({c: 0.0 for c in taxas.columns if c not in PRODUTO})
+    with np.errstate(divide="ignore", invalid="ignore"):
+        produtos["dias_estoque"] = np.where(produtos["taxa_diaria"] > 0,
+                                            produtos["saldo_utilizavel"] / produtos["taxa_diaria"], np.inf)
+    fim = produtos["dias_estoque"].where(np.isfinite(produtos["dias_estoque"]))
+    produtos["ruptura_prevista"] = pd.Timestamp(hoje) + pd.to_timedelta(np.floor(fim), unit="D")
+    return produtos, lotes.drop(columns="validade_dt").reset_index(drop=True)
+
+def _vazio_produtos(taxas):
+    return pd.DataFrame(columns=PRODUTO + ["saldo", "saldo_utilizavel"] + [c for c in taxas.columns if c not in PRODUTO]
+                        + ["dias_estoque", "ruptura_prevista"])
+
+def _vazio_lotes():
+    return pd.DataFrame(columns=LOTE + ["saldo", "taxa_diaria", "saldo_utilizavel", "dias_ate_consumir",
+                                        "dias_para_vencer", "em_risco", "qtd_em_risco"]).astype({"em_risco": bool})
@@ -0,0 +1,299 @@
+# relatorios.py
+"""
+Relatórios dinâmicos (pivôs) sobre o ledger: Entradas, Saídas, saldo líquido e
+número de movimentações por qualquer combinação de Estudo, Tipo de Produto,
+Produto, Mês, Responsável, Tipo de Ação e Localização.
+
+Duas camadas de agregação, ambas vetorizadas (groupby do pandas):
+
+1. Base mensal (`BaseMensal`): o ledger agregado por mês e por todas as
+   dimensões (ids, sem nomes). Fica guardada em partições por mês com uma
+   assinatura (hash das linhas do mês); quando o ledger muda, só os meses cuja
+   assinatura mudou são reagregados — um lançamento novo reprocessa o mês
+   corrente, não anos de histórico.
+2. Pivôs (`MotorRelatorios.pivot`): saem da base mensal, que tem ordens de
+   grandeza menos linhas que o ledger, e ficam guardados por (dimensões,
+   medida, período) enquanto a base e os nomes não mudam.
+
+Transferências entre localizações (cubo.TRANSFERENCIA) ficam fora de Entradas
+e Saídas, mas entram no saldo líquido: no total de um lote elas se anulam, e
+por localização mostram o que entrou e saiu de cada local.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+import pandas as pd
+import streamlit as st
+from cubo import TRANSFERENCIA, copia_de_leitura
+from integridade import chave_texto
+from memoria import tamanho
+
+# Dimensões disponíveis -> rótulo
+DIMENSOES = {
+    "estudo": "Estudo",
+    "tipo_produto": "Tipo de Produto",
+    "produto": "Produto",
+    "mes": "Mês",
+    "responsavel": "Responsável",
+    "tipo_acao": "Tipo de Ação",
+    "localizacao": "Localização",
+}
+# Medidas -> rótulo
+MEDIDAS = {
+    "entradas": "Entradas",
+    "saidas": "Saídas",
+    "saldo": "Saldo líquido",
+    "movimentacoes": "Movimentações",
+}
+# Chaves da base mensal (ids e textos como gravados; nomes só no pivô)
+CHAVES_BASE = ["mes", "estudo_id", "produto_id", "tipo_produto", "responsavel", "tipo_acao", "localizacao"]
+COLUNAS_BASE = CHAVES_BASE + ["entradas", "saidas", "saldo", "movimentacoes"]
+# Colunas do ledger que entram na base (e na assinatura de cada mês)
+_COLUNAS_LEDGER = ["id", "data", "tipo_transacao", "quantidade", "estudo_id", "produto_id",
+                   "tipo_produto", "responsavel", "tipo_acao", "localizacao"]
+MAX_PIVOS_EM_CACHE = 64
+SEM_VALOR = "(não informado)"
+
+def rotulo_mes(mes: int) -> str:
+    """202405 -> '2024-05'."""
+    return f"{mes // 100}-{mes % 100:02d}"
+
+def _mes(datas):
+    """Mês de cada data como inteiro AAAAMM (0 para data inválida)."""
+    dt = pd.to_datetime(datas, errors="coerce")
+    return (dt.dt.year * 100 + dt.dt.month).fillna(0).astype("int64").to_numpy()
+
+def _colunas_ledger(df):
+    """Só as colunas usadas, criando como vazias as que faltarem (bases antigas)."""
+    faltando = {c: None for c in _COLUNAS_LEDGER if c not in df.columns}
+    return df.assign(**faltando)[_COLUNAS_LEDGER] if faltando else df[_COLUNAS_LEDGER]
+
+def agregar_mensal(df) -> pd.DataFrame:
+    """Ledger -> base mensal (uma linha por mês e combinação das dimensões)."""
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_BASE)
+    qtd = pd.to_numeric(df["quantidade"], errors="coerce").fillna(0).to_numpy()
+    entrada = (df["tipo_transacao"] == "Entrada").to_numpy()
+    saida = (df["tipo_transacao"] == "Saída").to_numpy()
+    transf = (df["tipo_acao"] == TRANSFERENCIA).to_numpy()
+    base = pd.DataFrame({
+        "mes": _mes(df["data"]),
+        "estudo_id": df["estudo_id"].to_numpy(),
+        "produto_id": df["produto_id"].to_numpy(),
+        "tipo_produto": chave_texto(df["tipo_produto"]).to_numpy(),
+        "responsavel": chave_texto(df["responsavel"]).to_numpy(),
+        "tipo_acao": chave_texto(df["tipo_acao"]).to_numpy(),
+        "localizacao": chave_texto(df["localizacao"]).to_numpy(),
+        "entradas": np.where(entrada & ~transf, qtd, 0.0),
+        "saidas": np.where(saida & ~transf, qtd, 0.0),
+        "saldo": np.select([entrada, saida], [qtd, -qtd], 0.0),
+        "movimentacoes": 1,
+    })
+    return base.groupby(CHAVES_BASE, sort=False).sum().reset_index()
+
+class BaseMensal:
+    """Base mensal mantida por partições de mês, reagregando só os meses alterados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._particoes = {}      # mês -> (assinatura, agregado do mês)
+        self._versao = None       # versão do ledger refletida em `_base`
+        self._base = pd.DataFrame(columns=COLUNAS_BASE)
+        self.meses_reagregados = 0
+        self.bytes = 0            # base + partições (memoria.py)
+        self.usado_em = 0.0
+
+    def atualizar(self, df, versao) -> pd.DataFrame:
+        """
+        Base mensal de `df`. `versao` identifica o conteúdo de `df` (ex.: versão
+        da tabela no repositório): se não mudou desde a última chamada, a base
+        guardada é devolvida sem olhar o ledger.
+        """
+        with self._lock:
+            self.usado_em = time.monotonic()
+            if versao is not None and versao == self._versao:
+                return self._base
+            df = _colunas_ledger(df)
+            meses = _mes(df["data"]) if not df.empty else np.array([], dtype="int64")
+            # Assinatura por mês: soma dos hashes das linhas + contagem
+            hashes = pd.util.hash_pandas_object(df, index=False).to_numpy() if not df.empty else np.array([], dtype="uint64")
+            assinaturas = (
+                pd.DataFrame({"mes": meses, "h": hashes})
+                  .groupby("mes", sort=False)["h"].agg(["sum", "size"])
+            )
+            novas = {m: (int(s), int(n)) for m, s, n in zip(assinaturas.index, assinaturas["sum"], assinaturas["size"])}
+            alterados = [m for m, a in novas.items() if self._particoes.get(m, (None,))[0] != a]
+            if alterados or set(self._particoes) - set(novas):
+                if alterados:
+                    linhas = df[np.isin(meses, alterados)]
+                    agregado = agregar_mensal(linhas)
+                    for mes, parte in agregado.groupby("mes", sort=False):
+                        self._particoes[mes] = (novas[mes], parte)
+                self._particoes = {m: p for m, p in self._particoes.items() if m in novas}
+                partes = [p for _, p in self._particoes.values()]
+                self._base = (pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS_BASE))
+                self.meses_reagregados += len(alterados)
+                self.bytes = tamanho(self._base) + sum(tamanho(p) for _, p in self._particoes.values())
+            self._versao = versao
+            return self._base
+
+    def limpar(self):
+        """Descarta base e partições; a próxima atualização reagrega tudo."""
+        with self._lock:
+            self._particoes = {}
+            self._versao = None
+            self._base = pd.DataFrame(columns=COLUNAS_BASE)
+            self.bytes = 0
+
+class MotorRelatorios:
+    """Base mensal do ledger ativo (e do arquivo) e cache LRU dos pivôs calculados."""
+
+    def __init__(self):
+        self._ativo = BaseMensal()
+        self._arquivo = BaseMensal()
+        self._lock = threading.Lock()
+        self._pivos = OrderedDict()   # chave -> [DataFrame, bytes, último uso]
+        self.stats = {"pivos_calculados": 0, "pivos_do_cache": 0}
+
+    def base(self, movs, versao, arquivados=None, versao_arquivo=None) -> pd.DataFrame:
+        """
+        Base mensal do ledger ativo, somada à do arquivo quando `arquivados` é
+        dado. `versao_arquivo` é a versão do arquivo (arquivamento.versao_arquivo),
+        a mesma que a página usa na chave dos pivôs; sem ela a base do arquivo é
+        reconferida mês a mês.
+        """
+        base = self._ativo.atualizar(movs, versao)
+        if arquivados is None:
+            return base
+        arq = self._arquivo.atualizar(arquivados, versao_arquivo)
+        if arq.empty:
+            return base
+        return pd.concat([base, arq], ignore_index=True).groupby(CHAVES_BASE, sort=False).sum().reset_index()
+
+    def pivot(self, base, linhas, colunas=(), medida="saldo", meses=None, acumulado=False,
+              estudos=None, produtos=None, chave_base=None) -> pd.DataFrame:
+        """
+        Pivô de `medida` com `linhas` no índice e `colunas` nas colunas (listas
+        de chaves de DIMENSOES), no intervalo `meses` = (AAAAMM inicial, final).
+        `estudos`/`produtos`: DataFrames id, nome (e tipo_produto) para os
+        rótulos. Com `acumulado` (saldo com Mês nas colunas), cada mês mostra o
+        saldo ao fim dele, contando o histórico anterior ao período.
+        `chave_base` identifica a base e os nomes; sem ela o pivô não é guardado.
+        """
+        linhas, colunas = tuple(linhas), tuple(colunas)
+        invalidas = set(linhas + colunas) - set(DIMENSOES)
+        if invalidas or medida not in MEDIDAS:
+            raise ValueError(f"Dimensões ou medida inválidas: {sorted(invalidas) or medida}")
+        acumulado = acumulado and medida == "saldo" and colunas == ("mes",)
+        chave = None if chave_base is None else (chave_base, linhas, colunas, medida, meses, acumulado)
+        if chave is not None:
+            with self._lock:
+                guardado = self._pivos.get(chave)
+                if guardado is not None:
+                    self._pivos.move_to_end(chave)
+                    guardado[2] = time.monotonic()
+                    self.stats["pivos_do_cache"] += 1
+                    return copia_de_leitura(guardado[0])
+
+        pronto = _calcular_pivot(base, linhas, colunas, medida, meses, acumulado, estudos, produtos)
+        bytes_ = tamanho(pronto) if chave is not None else 0
+        with self._lock:
+            self.stats["pivos_calculados"] += 1
+            if chave is not None:
+                self._pivos[chave] = [pronto, bytes_, time.monotonic()]
+                while len(self._pivos) > MAX_PIVOS_EM_CACHE:
+                    self._pivos.popitem(last=False)
+        return copia_de_leitura(pronto)
+
+    def entradas_memoria(self) -> list:
+        """Bases mensais e pivôs guardados, com tamanho, último uso e como descartá-los (memoria.py)."""
+        entradas = [{"nome": f"base mensal ({nome})", "bytes": b.bytes, "usado_em": b.usado_em,
+                     "descartar": b.limpar, "ordem": 1}
+                    for nome, b in (("ativo", self._ativo), ("arquivo", self._arquivo)) if b.bytes]
+        with self._lock:
+            pivos = list(self._pivos.items())
+        for chave, (_, bytes_, usado_em) in pivos:
+            _, linhas, colunas, medida, meses, _ = chave
+            nome = f"pivô {'+'.join(linhas) or '-'} x {'+'.join(colunas) or '-'}: {medida}"
+            if meses is not None:
+                nome += f" ({rotulo_mes(meses[0])} a {rotulo_mes(meses[1])})"
+            entradas.append({"nome": nome, "bytes": bytes_, "usado_em": usado_em,
+                             "descartar": partial(self.descartar_pivo, chave), "ordem": 0})
+        return entradas
+
+    def descartar_pivo(self, chave):
+        with self._lock:
+            self._pivos.pop(chave, None)
+
+def _rotular(base, dimensoes, estudos, produtos):
+    """Colunas com os rótulos das dimensões pedidas (nomes no lugar de ids)."""
+    rotulos = {}
+    for dim in dimensoes:
+        if dim == "mes":
+            rotulos[dim] = base["mes"].map(rotulo_mes)
+        elif dim == "estudo":
+            rotulos[dim] = base["estudo_id"].map(_nomes(estudos, "nome"))
+        elif dim == "produto":
+            rotulos[dim] = base["produto_id"].map(_nomes(produtos, "nome"))
+        elif dim == "tipo_produto":
+            # Movimentações antigas sem tipo gravado herdam o tipo do cadastro do produto
+            vazio = base["tipo_produto"] == ""
+            rotulos[dim] = base["tipo_produto"].where(~vazio, base["produto_id"].map(_nomes(produtos, "tipo_produto")))
+        else:
+            rotulos[dim] = base[dim]
+        rotulos[dim] = rotulos[dim].fillna("").replace("", SEM_VALOR)
+    return pd.DataFrame(rotulos, index=base.index)
+
+def _nomes(df_dim, coluna):
+    if df_dim is None or df_dim.empty or coluna not in df_dim.columns:
+        return pd.Series(dtype=object)
+    return df_dim.set_index("id")[coluna]
+
+def _calcular_pivot(base, linhas, colunas, medida, meses, acumulado, estudos, produtos):
+    base = base[base["mes"] > 0] if not base.empty else base
+    if meses is not None and not base.empty:
+        inicio, fim = meses
+        # Acumulado: o saldo ao fim de cada mês inclui o histórico anterior ao período
+        base = base[(base["mes"] <= fim) & ((base["mes"] >= inicio) | acumulado)]
+    dims = list(linhas + colunas)
+    if base.empty:
+        return pd.DataFrame(columns=[DIMENSOES[d] for d in linhas] + [MEDIDAS[medida]])
+    if not dims:
+        return pd.DataFrame({MEDIDAS[medida]: [base[medida].sum()]})
+
+    tabela = _rotular(base, dims, estudos, produtos).assign(valor=base[medida].to_numpy())
+    agregado = tabela.groupby(dims, sort=True)["valor"].sum()
+    if not colunas:
+        return agregado.rename(MEDIDAS[medida]).reset_index().rename(columns=DIMENSOES)
+
+    pivo = agregado.unstack(list(colunas), fill_value=0) if linhas else agregado.to_frame().T
+    if acumulado:
+        pivo = pivo.cumsum(axis=1)
+        if meses is not None:
+            pivo = pivo.loc[:, [c for c in pivo.columns if c >= rotulo_mes(meses[0])]]
+    else:
+        pivo["Total"] = pivo.sum(axis=1)
+    if linhas:
+        pivo.loc[("Total",) * len(linhas) if len(linhas) > 1 else "Total", :] = pivo.sum(axis=0)
+    if isinstance(pivo.columns, pd.MultiIndex):
+        pivo.columns = [" / ".join(map(str, c)) for c in pivo.columns]
+    else:
+        pivo.columns = [str(c) for c in pivo.columns]
+    pivo.index.names = [DIMENSOES[d] for d in linhas] if linhas else [None]
+    return pivo.reset_index() if linhas else pivo.reset_index(drop=True)
+
+# Motores criados no processo, por escopo (para a contabilidade de memória)
+_motores = {}
+
+@st.cache_resource
+def obter_motor(escopo: tuple = None) -> MotorRelatorios:
+    """Motor de relatórios do processo para um escopo de estudos (compartilhado pelas sessões)."""
+    motor = MotorRelatorios()
+    _motores[escopo] = motor
+    return motor
+
+def motores_ativos() -> dict:
+    """Escopo -> motor de relatórios, para todos os motores criados no processo."""
+    return dict(_motores)
@@ -0,0 +1,469 @@
+# repositorio.py
+"""
+Repositório do ledger compartilhado entre as sessões do processo.
+
+Uma única instância por processo e escopo de estudos (`obter_repositorio`)
+guarda `movimentacoes`, as tabelas de dimensão e os agregados derivados delas.
+Usuários com estudos atribuídos (tabela usuarios_estudos) usam um repositório
+que só busca e processa as linhas desses estudos. As atualizações são
+single-flight: se várias sessões pedem o ledger com o cache vencido, só uma
+leitura vai ao banco e as demais esperam por ela. As sessões recebem cópias
+(cubo.copia_de_leitura: rasas com o Copy-on-Write do pandas 3, profundas antes
+dele): alterar colunas na página não afeta o que está guardado aqui.
+
+O repositório assina o change feed (notificacoes.py): cada linha inserida,
+alterada ou excluída é aplicada como patch na tabela em cache, sem reler a
+tabela inteira. O TTL fica só como rede de segurança, mais longo quando há uma
+fonte remota de eventos (Supabase Realtime ou barramento em arquivo) ativa.
+"""
+import os
+import threading
+import time
+from datetime import date
+from functools import partial
+import numpy as np
+import pandas as pd
+import streamlit as st
+from supabase_db import get_data, COLUNA_ESTUDO
+from notificacoes import obter_feed, evento
+from busca import indice_produtos
+from integridade import chave_texto, verificar_ledger
+from previsao import prever
+from cubo import CuboSaldos, montar_cubo, lotes_visao_geral, copia_de_leitura, LOTE
+from memoria import tamanho
+
+TTL_SEGUNDOS = float(os.environ.get("CEMEC_LEDGER_TTL", "60"))
+TTL_COM_FEED_SEGUNDOS = float(os.environ.get("CEMEC_LEDGER_TTL_FEED", "900"))
+
+# Tabelas carregadas (e colunas), na ordem da leitura
+TABELAS = {
+    "movimentacoes": "*",
+    "estudos": "id, nome",
+    "produtos": "id, nome, estudo_id, tipo_produto",
+    "localizacao": "id, nome",
+    "tipo_acao": "id, nome",
+    "tipo_produto": "id, nome",
+}
+
+# ---------------------------
+# Carga e agregados derivados
+# ---------------------------
+def _carregar_do_banco(estudos=None):
+    return {nome: pd.DataFrame(get_data(nome, cols, estudos=estudos) or []) for nome, cols in TABELAS.items()}
+
+def _nomes_por_id(df_dim):
+    """Série id -> nome de uma dimensão (vazia se a tabela não tiver linhas)."""
+    if df_dim.empty:
+        return pd.Series(dtype=object)
+    return df_dim.set_index("id")["nome"]
+
+def _ledger(dados):
+    """Movimentações enriquecidas com os nomes de estudo e produto."""
+    df = dados["movimentacoes"].copy()
+    if df.empty:
+        return df
+    df["estudo"] = df["estudo_id"].map(_nomes_por_id(dados["estudos"]))
+    df["produto"] = df["produto_id"].map(_nomes_por_id(dados["produtos"]))
+    return df
+
+def _saldos_lote(dados):
+    """Entradas, Saídas e Saldo por Estudo + Produto + Validade + Lote (ids)."""
+    df = dados["movimentacoes"]
+    chaves = ["estudo_id", "produto_id", "validade", "lote"]
+    if df.empty:
+        return pd.DataFrame(columns=chaves + ["Entradas", "Saidas", "Saldo"])
+    qtd = df["quantidade"].astype(float)
+    base = df[chaves].assign(
+        Entradas=qtd.where(df["tipo_transacao"] == "Entrada", 0.0),
+        Saidas=qtd.where(df["tipo_transacao"] == "Saída", 0.0),
+    )
+    saldos = base.groupby(chaves, dropna=False, sort=False)[["Entradas", "Saidas"]].sum().reset_index()
+    saldos["Saldo"] = saldos["Entradas"] - saldos["Saidas"]
+    return saldos
+
+def _aplicar_patch(df, ev, cols):
+    """Nova versão de `df` com o evento aplicado, ou None se só uma recarga resolve."""
+    tipo = ev.get("tipo")
+    registro = ev.get("antigo") if tipo == "DELETE" else ev.get("novo")
+    if tipo not in ("INSERT", "UPDATE", "DELETE") or not registro or registro.get("id") is None:
+        return None
+    if not df.empty and "id" not in df.columns:
+        return None
+    restante = df[df["id"] != registro["id"]] if not df.empty else df
+    if tipo == "DELETE":
+        return restante.reset_index(drop=True)
+    if cols != "*":
+        registro = {c.strip(): registro.get(c.strip()) for c in cols.split(",")}
+    novo = pd.DataFrame([registro])
+    if restante.empty:
+        return novo
+    return pd.concat([restante, novo], ignore_index=True)
+
+def _indice_produtos(dados):
+    return indice_produtos(dados["produtos"], dados["estudos"])
+
+def _previsao(dados):
+    """Previsão de consumo (previsao.py) com os nomes de estudo e produto."""
+    produtos, lotes = prever(dados["movimentacoes"])
+    estudos, nomes = _nomes_por_id(dados["estudos"]), _nomes_por_id(dados["produtos"])
+    for df in (produtos, lotes):
+        df["estudo"] = df["estudo_id"].map(estudos)
+        df["produto"] = df["produto_id"].map(nomes)
+    return produtos, lotes
+
+def _visao_geral(dados):
+    """
+    Linhas por lote da Visão Geral (cubo.lotes_visao_geral) com nomes e as
+    colunas da previsão, já ordenadas, e a previsão por produto e por lote.
+    Usa os derivados `cubo` e `previsao` já calculados, sem refazê-los.
+    """
+    prev_produtos, prev_lotes = dados["previsao"]
+    lotes = lotes_visao_geral(dados["cubo"].rollup(LOTE))
+    lotes["estudo"] = lotes["estudo_id"].map(_nomes_por_id(dados["estudos"])).fillna("")
+    lotes["produto"] = lotes["produto_id"].map(_nomes_por_id(dados["produtos"])).fillna("")
+    if not prev_lotes.empty:
+        chaves = prev_lotes[LOTE].assign(validade=chave_texto(prev_lotes["validade"]), lote=chave_texto(prev_lotes["lote"]))
+        colunas = ["taxa_diaria", "dias_ate_consumir", "qtd_em_risco"]
+        lotes = lotes.merge(chaves.assign(**{c: prev_lotes[c].to_numpy() for c in colunas}), on=LOTE, how="left")
+    else:
+        lotes = lotes.assign(taxa_diaria=np.nan, dias_ate_consumir=np.nan, qtd_em_risco=np.nan)
+    lotes = lotes.sort_values(["estudo", "produto", "validade", "lote"], na_position="last", ignore_index=True)
+    return lotes, prev_produtos, prev_lotes
+
+# Pseudo-dependência para derivados que usam a data de hoje
+DIA = "@dia"
+
+# Derivado -> (função, tabelas de que depende). Só é recalculado quando a
+# versão de alguma dessas tabelas (ou o dia, com DIA) muda. Uma dependência
+# pode ser outro derivado: ele é calculado antes (ou lido do cache) e chega à
+# função em `dados[nome]`, compartilhado (não deve ser alterado).
+DERIVADOS = {
+    "ledger": (_ledger, ("movimentacoes", "estudos", "produtos")),
+    "saldos_lote": (_saldos_lote, ("movimentacoes",)),
+    "indice_produtos": (_indice_produtos, ("produtos", "estudos")),
+    "integridade": (lambda dados: verificar_ledger(dados["movimentacoes"]), ("movimentacoes",)),
+    "previsao": (_previsao, ("movimentacoes", "estudos", "produtos", DIA)),
+    "cubo": (lambda dados: CuboSaldos(montar_cubo(dados["movimentacoes"])), ("movimentacoes",)),
+    "visao_geral": (_visao_geral, ("cubo", "previsao", "estudos", "produtos", DIA)),
+}
+
+# ---------------------------
+# Repositório
+# ---------------------------
+class RepositorioMovimentacoes:
+    """Ledger + dimensões + derivados, com atualização single-flight sob lock."""
+
+    def __init__(self, ttl: float = TTL_SEGUNDOS, carregar=_carregar_do_banco, derivados=None,
+                 feed=None, ttl_com_feed: float = TTL_COM_FEED_SEGUNDOS, escopo=None):
+        self._ttl = ttl
+        self._ttl_com_feed = ttl_com_feed
+        self._feed = feed
+        self._carregar = carregar
+        self._derivadores = dict(DERIVADOS if derivados is None else derivados)
+        # Ids de estudo carregados (None = todos); eventos de outros estudos são ignorados
+        self.escopo = None if escopo is None else frozenset(escopo)
+
+        self._lock = threading.Lock()            # protege todo o estado abaixo
+        self._em_voo = None                      # Event da atualização em andamento
+        self._dados = None                       # tabela -> DataFrame
+        self._derivados = {}                     # nome -> (versões das dependências, valor)
+        self._locks_derivados = {}               # nome -> Lock (um cálculo por derivado)
+        self._usos = {}                          # nome do derivado -> último uso (monotonic)
+        self._usado_em = 0.0                     # último uso das tabelas (qualquer leitura)
+        self._tamanhos = {}                      # tabelas ou derivado -> (versão, bytes)
+        self._versao = 0                         # muda a cada alteração de qualquer tabela
+        self._versoes = dict.fromkeys(TABELAS, 0)
+        self._geracao = 0                        # incrementada a cada invalidação
+        self._invalido = True
+        self._carregado_em = 0.0
+        self._ultimo_erro = None
+        self._stats = {
+            "leituras": 0,        # chamadas de leitura atendidas
+            "atualizacoes": 0,    # cargas completas feitas no banco
+            "esperas": 0,         # leituras que aguardaram a carga de outra sessão
+            "falhas": 0,
+            "invalidacoes": 0,
+            "patches": 0,         # eventos do change feed aplicados sem recarga
+            "derivados_calculados": 0,
+            "derivados_descartados": 0,  # pelo orçamento de memória (memoria.py)
+            "liberacoes": 0,             # tabelas descartadas pelo orçamento de memória
+            "ultima_carga_ms": None,
+        }
+
+    # --- Atualização ---
+    @property
+    def ttl(self) -> float:
+        if self._feed is not None and self._feed.remoto_ativo:
+            return self._ttl_com_feed
+        return self._ttl
+
+    def _vencido(self):
+        return self._invalido or (time.monotonic() - self._carregado_em) > self.ttl
+
+    def _garantir_atual(self):
+        """Tabelas atuais (recarregando se vencidas), como visto por esta leitura."""
+        with self._lock:
+            self._stats["leituras"] += 1
+            self._usado_em = time.monotonic()
+            if self._dados is not None and not self._vencido():
+                return self._dados
+            evento = self._em_voo
+            lider = evento is None
+            if lider:
+                evento = self._em_voo = threading.Event()
+                geracao = self._geracao
+            else:
+                self._stats["esperas"] += 1
+
+        if not lider:
+            evento.wait()
+            with self._lock:
+                if self._dados is None:
+                    raise RuntimeError("Falha ao carregar movimentações.") from self._ultimo_erro
+                return self._dados
+
+        try:
+            t0 = time.perf_counter()
+            dados = self._carregar()
+            with self._lock:
+                self._dados = dados
+                self._versao += 1
+                for tabela in self._versoes:
+                    self._versoes[tabela] += 1
+                self._carregado_em = time.monotonic()
+                # Uma invalidação durante a carga pode não estar refletida nela
+                self._invalido = self._geracao != geracao
+                self._ultimo_erro = None
+                self._stats["atualizacoes"] += 1
+                self._stats["ultima_carga_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            return dados
+        except Exception as e:
+            with self._lock:
+                self._ultimo_erro = e
+                self._stats["falhas"] += 1
+                anteriores = self._dados
+            # Com dados anteriores, seguimos servindo-os (desatualizados) em vez de falhar
+            if anteriores is None:
+                raise
+            return anteriores
+        finally:
+            with self._lock:
+                self._em_voo = None
+            evento.set()
+
+    def invalidar(self, tabela: str = None):
+        """Marca o cache como vencido; a próxima leitura recarrega do banco."""
+        with self._lock:
+            if tabela is not None and tabela not in TABELAS:
+                return
+            self._geracao += 1
+            self._invalido = True
+            self._stats["invalidacoes"] += 1
+
+    def _no_escopo(self, ev):
+        """O evento visto por este repositório: None se a linha é de um estudo fora do escopo."""
+        coluna = COLUNA_ESTUDO.get(ev.get("tabela"))
+        novo = ev.get("novo") or {}
+        if self.escopo is None or coluna is None or ev.get("tipo") == "DELETE" or coluna not in novo:
+            return ev
+        if novo[coluna] in self.escopo:
+            return ev
+        if ev.get("tipo") == "UPDATE":
+            # Linha que saiu do escopo: some daqui como se tivesse sido excluída
+            return evento(ev["tabela"], "DELETE", antigo={"id": novo.get("id")})
+        return None
+
+    def aplicar_evento(self, ev: dict):
+        """Aplica um evento do change feed: patch incremental quando possível, senão invalida."""
+        tabela = ev.get("tabela")
+        if tabela not in TABELAS:
+            return
+        ev = self._no_escopo(ev)
+        if ev is None:
+            return
+        with self._lock:
+            if self._dados is None:
+                return
+            # Uma carga em andamento pode ou não conter a alteração: recarrega de novo
+            novo_df = None if self._em_voo is not None else _aplicar_patch(self._dados[tabela], ev, TABELAS[tabela])
+            if novo_df is None:
+                self._geracao += 1
+                self._invalido = True
+                self._stats["invalidacoes"] += 1
+                return
+            self._dados = {**self._dados, tabela: novo_df}
+            self._versao += 1
+            self._versoes[tabela] += 1
+            self._stats["patches"] += 1
+
+    # --- Leitura ---
+    def tabela(self, nome: str) -> pd.DataFrame:
+        """Cópia de leitura (cubo.copia_de_leitura) de uma das tabelas carregadas."""
+        return copia_de_leitura(self._garantir_atual()[nome])
+
+    def tabela_com_versao(self, nome: str):
+        """
+        (cópia de leitura da tabela, versão dela), lidas juntas: a versão
+        descreve exatamente os dados devolvidos, mesmo com uma recarga ou um
+        patch chegando entre as duas leituras.
+        """
+        atuais = self._garantir_atual()
+        with self._lock:
+            df = (self._dados if self._dados is not None else atuais)[nome]
+            versao = self._versoes[nome]
+        return copia_de_leitura(df), versao
+
+    def _assinatura(self, nome, usados=None):
+        """Versões das dependências de `nome`; a de um derivado é a assinatura dele (a de `usados`, se dada)."""
+        return tuple(date.today().toordinal() if t == DIA
+                     else (usados[t][0] if usados is not None else self._assinatura(t)) if t in self._derivadores
+                     else self._versoes[t]
+                     for t in self._derivadores[nome][1])
+
+    def derivado(self, nome: str):
+        """
+        Agregado derivado, calculado uma única vez por versão das tabelas de que
+        depende. DataFrames (soltos ou em tupla) são devolvidos como cópia
+        (cubo.copia_de_leitura);
+        outros objetos (ex.: o índice de busca) são compartilhados e não devem
+        ser alterados.
+        """
+        return _copia_rasa(self._calcular(nome)[1])
+
+    def _calcular(self, nome: str):
+        """(assinatura, valor guardado) do derivado, recalculado se a assinatura mudou."""
+        atuais = self._garantir_atual()
+        funcao, dependencias = self._derivadores[nome]
+        # Derivados de que este depende, cada um com a assinatura dos dados que usou
+        usados = {d: self._calcular(d) for d in dependencias if d in self._derivadores}
+        with self._lock:
+            # Dados e assinatura lidos juntos: um patch que chegue depois muda os
+            # dois, e o cálculo abaixo fica guardado sob a assinatura dos dados que usou
+            dados = self._dados if self._dados is not None else atuais
+            assinatura = self._assinatura(nome, usados)
+            cache = self._derivados.get(nome)
+            self._usos[nome] = time.monotonic()
+            lock_nome = self._locks_derivados.setdefault(nome, threading.Lock())
+        if cache is None or cache[0] != assinatura:
+            with lock_nome:
+                with self._lock:
+                    cache = self._derivados.get(nome)
+                if cache is None or cache[0] != assinatura:
+                    cache = (assinatura, funcao({**dados, **{d: v for d, (_, v) in usados.items()}}))
+                    with self._lock:
+                        if self._assinatura(nome) == assinatura:
+                            self._derivados[nome] = cache
+                        self._stats["derivados_calculados"] += 1
+        return cache
+
+    # --- Memória (memoria.py) ---
+    def _bytes(self, chave, versao, valor):
+        """Tamanho de `valor`, medido uma vez por versão."""
+        medido = self._tamanhos.get(chave)
+        if medido is None or medido[0] != versao:
+            medido = self._tamanhos[chave] = (versao, tamanho(valor))
+        return medido[1]
+
+    def entradas_memoria(self) -> list:
+        """Tabelas carregadas e cada derivado, com tamanho, último uso e como descartá-los."""
+        with self._lock:
+            dados, derivados, usos = self._dados, dict(self._derivados), dict(self._usos)
+            versao, usado_em = self._versao, self._usado_em
+        entradas = []
+        if dados is not None:
+            entradas.append({"nome": "tabelas", "bytes": self._bytes("@tabelas", versao, dados),
+                             "usado_em": usado_em, "descartar": self.liberar, "ordem": 2})
+        for nome, (assinatura, valor) in derivados.items():
+            entradas.append({"nome": f"derivado:{nome}", "bytes": self._bytes(nome, assinatura, valor),
+                             "usado_em": usos.get(nome, 0.0), "descartar": partial(self.descartar_derivado, nome),
+                             "ordem": 0})
+        return entradas
+
+    def descartar_derivado(self, nome: str):
+        """Tira um derivado da memória; o próximo pedido recalcula."""
+        with self._lock:
+            if self._derivados.pop(nome, None) is not None:
+                self._stats["derivados_descartados"] += 1
+
+    def liberar(self) -> bool:
+        """
+        Tira tabelas e derivados da memória; a próxima leitura recarrega do
+        banco. Não faz nada (retorna False) com uma carga em andamento.
+        """
+        with self._lock:
+            if self._em_voo is not None:
+                return False
+            if self._dados is not None:
+                self._dados = None
+                self._derivados = {}
+                self._stats["liberacoes"] += 1
+            return True
+
+    @property
+    def versao(self) -> int:
+        return self._versao
+
+    def versao_tabela(self, nome: str) -> int:
+        """Versão dos dados de uma tabela (muda a cada recarga ou patch dela)."""
+        return self._versoes[nome]
+
+    def estatisticas(self) -> dict:
+        """Contadores de leitura/atualização e memória ocupada pelo repositório."""
+        with self._lock:
+            dados = dict(self._dados or {})
+            derivados = dict(self._derivados)
+            stats = dict(self._stats)
+            idade = (time.monotonic() - self._carregado_em) if self._dados is not None else None
+            stats.update({
+                "versao": self._versao,
+                "idade_s": None if idade is None else round(idade, 1),
+                "ttl_s": self.ttl,
+                "fontes_feed": dict(self._feed.fontes) if self._feed is not None else {},
+                "atualizando": self._em_voo is not None,
+                "escopo": None if self.escopo is None else sorted(self.escopo),
+            })
+        stats["linhas"] = {nome: len(df) for nome, df in dados.items()}
+        stats["memoria_bytes"] = {
+            nome: int(df.memory_usage(deep=True).sum())
+            for nome, df in list(dados.items()) + [(f"derivado:{n}", d) for n, (_, d) in derivados.items()]
+            if isinstance(df, pd.DataFrame)
+        }
+        stats["memoria_total_bytes"] = sum(stats["memoria_bytes"].values())
+        return stats
+
+def _copia_rasa(valor):
+    if isinstance(valor, pd.DataFrame):
+        return copia_de_leitura(valor)
+    if isinstance(valor, tuple):
+        return tuple(_copia_rasa(v) for v in valor)
+    return valor
+
+# Repositórios criados no processo, por escopo (para o painel de Gestão de Acessos)
+_repositorios = {}
+
+@st.cache_resource
+def obter_repositorio(escopo: tuple = None) -> RepositorioMovimentacoes:
+    """
+    Instância única do repositório no processo para um escopo de estudos
+    (None = todos), compartilhada pelas sessões com o mesmo escopo. Só as linhas
+    desses estudos são buscadas no banco.
+    """
+    feed = obter_feed()
+    repo = RepositorioMovimentacoes(feed=feed, escopo=escopo,
+                                    carregar=partial(_carregar_do_banco, estudos=escopo))
+    feed.assinar(repo.aplicar_evento)
+    _repositorios[escopo] = repo
+    return repo
+
+def escopo_do_usuario(user) -> tuple:
+    """Estudos do usuário logado como chave de escopo (None = sem restrição)."""
+    estudos = (user or {}).get("estudos")
+    return None if estudos is None else tuple(sorted(estudos))
+
+def repositorio_do_usuario(user) -> RepositorioMovimentacoes:
+    """Repositório com os estudos que o usuário pode ver."""
+    return obter_repositorio(escopo_do_usuario(user))
+
+def repositorios_ativos() -> dict:
+    """Escopo -> repositório, para todos os repositórios criados no processo."""
+    return dict(_repositorios)
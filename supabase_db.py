@@ -1,84 +1,175 @@
-
-# supabase_db.py
-import hashlib
-import streamlit as st
-from supabase import create_client, Client
-import os # Importa a biblioteca os
-
-# --- Configuração da Conexão com o Supabase ---
-@st.cache_resource
-def init_connection():
-    # Lê as variáveis de ambiente diretamente do Render
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
-    return create_client(url, key)
-
-supabase: Client = init_connection()
-# --- Helpers de Autenticação (adaptados) ---
-def _hash_password(password: str) -> str:
-    # A função de hash pode ser mantida, mas a do Supabase é mais robusta.
-    # Para simplicidade, vamos usar a mesma para não precisar refazer o hash de todos os usuários.
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
-
-def verificar_senha(password: str, password_hash: str) -> bool:
-    return _hash_password(password) == password_hash
-
-def obter_usuario(username: str):
-    response = supabase.table("users").select("*").eq("username", username).limit(1).execute()
-    if not response.data:
-        return None
-    user = response.data[0]
-    return {
-        "id": user.get("id"),
-        "username": user.get("username"),
-        "password_hash": user.get("password_hash"),
-        "role": user.get("role"),
-        "is_active": user.get("is_active")
-    }
-
-def criar_usuario(username: str, password: str, role: str = 'visualizador', is_active: bool = True):
-    data, count = supabase.table("users").insert({
-        "username": username,
-        "password_hash": _hash_password(password),
-        "role": role,
-        "is_active": is_active
-    }).execute()
-    return data
-
-def atualizar_usuario(user_id: int, username: str = None, password: str = None, role: str = None, is_active: bool = None):
-    update_data = {}
-    if username is not None:
-        update_data["username"] = username
-    if password is not None:
-        update_data["password_hash"] = _hash_password(password)
-    if role is not None:
-        update_data["role"] = role
-    if is_active is not None:
-        update_data["is_active"] = is_active
-    
-    if update_data:
-        supabase.table("users").update(update_data).eq("id", user_id).execute()
-
-def deletar_usuario(user_id: int):
-    supabase.table("users").delete().eq("id", user_id).execute()
-
-# --- Funções de Consulta de Dados (adaptadas) ---
-
-def get_data(table_name, select_cols="*", limit=50000):
-    """Busca dados de uma tabela no Supabase com um limite opcional."""
-    response = supabase.table(table_name).select(select_cols).limit(limit).execute()
-    return response.data
-
-def insert_data(table_name, data):
-    response = supabase.table(table_name).insert(data).execute()
-    return response.data
-
-def update_data(table_name, data, eq_col, eq_val):
-    response = supabase.table(table_name).update(data).eq(eq_col, eq_val).execute()
-    return response.data
-
-def delete_data(table_name, eq_col, eq_val):
-    response = supabase.table(table_name).delete().eq(eq_col, eq_val).execute()
-
-    return response.data
-
+# supabase_db.py
+import hashlib
+from urllib.parse import quote
+import streamlit as st
+import os # Importa a biblioteca os
+import perf
+
+# --- Configuração da Conexão com o Supabase ---
+# O cliente é criado sob demanda, no primeiro acesso ao banco, e não na
+# importação do módulo: o pacote `supabase` é pesado e atrasava o cold start.
+@st.cache_resource
+def init_connection():
+    # CEMEC_BACKEND=local (ou local:demo): banco em memória, sem Supabase (ver backend_local.py)
+    backend = os.environ.get("CEMEC_BACKEND", "supabase")
+    if backend.startswith("local"):
+        from backend_local import cliente_local
+        return cliente_local(backend.partition(":")[2])
+    from supabase import create_client
+    perf.marcar("import supabase")
+    # Lê as variáveis de ambiente diretamente do Render
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    client = create_client(url, key)
+    perf.marcar("cliente supabase")
+    return client
+
+# --- Escrita identificada (trilha de auditoria, ver auditoria.py) ---
+# Definido aqui, e não em auditoria.py, para o login não importar pandas
+CABECALHO_USUARIO = "x-cemec-usuario"
+
+def _usuario_atual():
+    """Username da sessão logada, ou None fora de uma sessão (bootstrap, scripts)."""
+    try:
+        return (st.session_state.get("user") or {}).get("username")
+    except Exception:
+        return None
+
+def _executar(consulta):
+    """Executa uma escrita enviando o usuário do app no cabeçalho lido pelo trigger de auditoria."""
+    usuario = _usuario_atual()
+    headers = getattr(consulta, "headers", None)
+    if usuario and headers is not None:
+        # Sempre codificado (cabeçalhos só levam ASCII); quem grava a trilha decodifica
+        headers[CABECALHO_USUARIO] = quote(usuario, safe="")
+    return consulta.execute()
+
+# --- Helpers de Autenticação (adaptados) ---
+def _hash_password(password: str) -> str:
+    # A função de hash pode ser mantida, mas a do Supabase é mais robusta.
+    # Para simplicidade, vamos usar a mesma para não precisar refazer o hash de todos os usuários.
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+def verificar_senha(password: str, password_hash: str) -> bool:
+    return _hash_password(password) == password_hash
+
+def obter_usuario(username: str):
+    response = init_connection().table("users").select("*").eq("username", username).limit(1).execute()
+    if not response.data:
+        return None
+    user = response.data[0]
+    return {
+        "id": user.get("id"),
+        "username": user.get("username"),
+        "password_hash": user.get("password_hash"),
+        "role": user.get("role"),
+        "is_active": user.get("is_active"),
+        "todos_estudos": bool(user.get("todos_estudos")),
+    }
+
+def criar_usuario(username: str, password: str, role: str = 'visualizador', is_active: bool = True,
+                  todos_estudos: bool = True):
+    data, count = _executar(init_connection().table("users").insert({
+        "username": username,
+        "password_hash": _hash_password(password),
+        "role": role,
+        "is_active": is_active,
+        "todos_estudos": todos_estudos,
+    }))
+    return data
+
+def atualizar_usuario(user_id: int, username: str = None, password: str = None, role: str = None, is_active: bool = None):
+    update_data = {}
+    if username is not None:
+        update_data["username"] = username
+    if password is not None:
+        update_data["password_hash"] = _hash_password(password)
+    if role is not None:
+        update_data["role"] = role
+    if is_active is not None:
+        update_data["is_active"] = is_active
+    
+    if update_data:
+        _executar(init_connection().table("users").update(update_data).eq("id", user_id))
+
+def deletar_usuario(user_id: int):
+    _executar(init_connection().table("usuarios_estudos").delete().eq("usuario_id", user_id))
+    _executar(init_connection().table("users").delete().eq("id", user_id))
+
+# --- Escopo por estudo (users.todos_estudos + tabela usuarios_estudos: usuario_id, estudo_id) ---
+# Só users.todos_estudos libera todos os estudos; sem ele, valem as linhas de
+# usuarios_estudos, e nenhuma linha é nenhum estudo (na dúvida, acesso a menos).
+def obter_estudos_usuario(user_id: int):
+    """Ids dos estudos atribuídos ao usuário (lista vazia = nenhum), ou None se ele vê todos."""
+    usuario = init_connection().table("users").select("todos_estudos").eq("id", user_id).limit(1).execute()
+    if usuario.data and usuario.data[0].get("todos_estudos"):
+        return None
+    response = init_connection().table("usuarios_estudos").select("estudo_id").eq("usuario_id", user_id).execute()
+    return sorted({r["estudo_id"] for r in response.data or []})
+
+def definir_estudos_usuario(user_id: int, estudo_ids, todos: bool = False):
+    """
+    Define o escopo do usuário: `todos` libera todos os estudos; senão, só
+    `estudo_ids` (vazio = nenhum). Cada passo só tira acesso antes de dar: uma
+    falha no meio deixa o usuário com menos estudos, nunca com mais.
+    """
+    conexao = init_connection()
+    novos = set() if todos else {int(e) for e in estudo_ids}
+    if not todos:
+        _executar(conexao.table("users").update({"todos_estudos": False}).eq("id", user_id))
+    atuais = {r["estudo_id"] for r in
+              conexao.table("usuarios_estudos").select("estudo_id").eq("usuario_id", user_id).execute().data or []}
+    if atuais - novos:
+        _executar(conexao.table("usuarios_estudos").delete()
+                  .eq("usuario_id", user_id).in_("estudo_id", sorted(atuais - novos)))
+    if novos - atuais:
+        _executar(conexao.table("usuarios_estudos").upsert(
+            [{"usuario_id": user_id, "estudo_id": e} for e in sorted(novos - atuais)],
+            on_conflict="usuario_id,estudo_id",
+        ))
+    if todos:
+        _executar(conexao.table("users").update({"todos_estudos": True}).eq("id", user_id))
+
+# --- Funções de Consulta de Dados (adaptadas) ---
+
+# Coluna que liga cada tabela a um estudo, para o filtro de escopo do usuário
+COLUNA_ESTUDO = {
+    "movimentacoes": "estudo_id", "produtos": "estudo_id", "estudos": "id",
+    "movimentacoes_arquivo": "estudo_id", "lotes_arquivados": "estudo_id",
+}
+
+def get_data(table_name, select_cols="*", limit=50000, estudos=None):
+    """
+    Busca dados de uma tabela no Supabase com um limite opcional.
+    `estudos`: ids de estudo do escopo do usuário; em tabelas ligadas a estudo
+    (COLUNA_ESTUDO), só essas linhas são buscadas (filtro aplicado na consulta).
+    """
+    if estudos is not None and not estudos and table_name in COLUNA_ESTUDO:
+        return []  # usuário sem nenhum estudo atribuído
+    query = init_connection().table(table_name).select(select_cols)
+    if estudos is not None and table_name in COLUNA_ESTUDO:
+        query = query.in_(COLUNA_ESTUDO[table_name], list(estudos))
+    response = query.limit(limit).execute()
+    return response.data
+
+def insert_data(table_name, data):
+    response = _executar(init_connection().table(table_name).insert(data))
+    return response.data
+
+def update_data(table_name, data, eq_col, eq_val):
+    response = _executar(init_connection().table(table_name).update(data).eq(eq_col, eq_val))
+    return response.data
+
+def delete_data(table_name, eq_col, eq_val):
+    response = _executar(init_connection().table(table_name).delete().eq(eq_col, eq_val))
+
+    return response.data
+
+def upsert_data(table_name, data, on_conflict="id"):
+    response = _executar(init_connection().table(table_name).upsert(data, on_conflict=on_conflict))
+    return response.data
+
+def delete_in(table_name, col, values):
+    """Exclui numa única requisição as linhas com `col` em `values`."""
+    response = _executar(init_connection().table(table_name).delete().in_(col, list(values)))
+    return response.data
@@ -0,0 +1,287 @@
+# teste_carga.py
+"""
+Teste de carga: várias sessões simultâneas executando os scripts reais do app
+(API de testes do Streamlit, AppTest) contra o backend local em memória
+(backend_local.py), com latência de rede simulada.
+
+Cada sessão faz login e percorre a Visão Geral (abrir, filtrar por estudo,
+"apenas saldos zerados"). Os gestores também registram uma Entrada e uma Saída
+em Movimentações e editam um lançamento em Lançamentos.
+
+    python teste_carga.py --sessoes 20 --rodadas 3 --movs 20000 --latencia-ms 30
+
+Relata p50/p95/p99 por interação, chamadas ao backend por rerun e memória por
+sessão (session_state de cada sessão, caches contabilizados por memoria.py e
+crescimento do RSS do processo).
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+os.environ["CEMEC_BACKEND"] = "local"  # antes de importar o app: nada de Supabase aqui
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.testing.v1 import AppTest
+
+import backend_local
+import memoria
+from supabase_db import _hash_password
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+SENHA = "carga"
+CHAVE_SESSAO = "_carga_sessao"
+TIMEOUT = 120
+
+def _permitir_apptests_concorrentes():
+    """
+    Cada AppTest.run() instala um Runtime simulado global e o descarta ao fim;
+    com sessões em paralelo, uma run encontra o Runtime já descartado por
+    outra. Mantém um Runtime simulado de reserva para esses casos, isola o
+    estado de páginas que o AppTest reinicia a cada run e serializa a
+    compilação das páginas.
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.runtime import Runtime
+
+    reserva = MagicMock(spec=Runtime)
+    reserva.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    reserva.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance if cls._instance is not None else reserva)
+
+    # AppTest zera PagesManager.uses_pages_directory a cada run; se isso cai no
+    # meio da run de outra sessão, ela executa o app.py no lugar da página.
+    # O app sempre usa a pasta pages/, então o reset vai para uma subclasse.
+    from streamlit.runtime.pages_manager import PagesManager
+    from streamlit.testing.v1 import app_test
+    PagesManager.uses_pages_directory = True
+    app_test.PagesManager = type("PagesManagerCarga", (PagesManager,), {})
+
+    # Cada AppTest tem seu ScriptCache; no Python 3.11, compile() em várias
+    # threads ao mesmo tempo pode falhar ("AST constructor recursion depth
+    # mismatch"). Serializa a compilação das páginas.
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    compilar = ScriptCache.get_bytecode
+    lock_compilacao = threading.Lock()
+
+    def get_bytecode(self, script_path):
+        with lock_compilacao:
+            return compilar(self, script_path)
+    ScriptCache.get_bytecode = get_bytecode
+
+def _contar_reruns(contagem):
+    """Conta as execuções de script por sessão simulada, inclusive as disparadas por st.rerun()."""
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+    original = LocalScriptRunner._on_script_finished
+
+    def _on_script_finished(self, *args, **kwargs):
+        try:
+            sessao = self._session_state[CHAVE_SESSAO]
+        except KeyError:
+            sessao = None
+        contagem[sessao] += 1
+        return original(self, *args, **kwargs)
+    LocalScriptRunner._on_script_finished = _on_script_finished
+
+# ---------------------------
+# Medição
+# ---------------------------
+def _sessao_atual():
+    """Sessão simulada dona da chamada ao backend (lida do session_state do script em execução)."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    try:
+        return ctx.session_state[CHAVE_SESSAO] if CHAVE_SESSAO in ctx.session_state else None
+    except Exception:
+        return None
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+class Sessao:
+    """Uma sessão simulada: um AppTest com login próprio, medindo cada interação."""
+
+    def __init__(self, k, papel, cliente, medicoes, reruns):
+        self.id = f"s{k:03d}"
+        self.usuario = f"{papel}{k:03d}"
+        self.papel = papel
+        self._cliente = cliente
+        self._medicoes = medicoes
+        self._reruns = reruns
+        self.at = AppTest.from_file(os.path.join(RAIZ, "app.py"), default_timeout=TIMEOUT)
+        self.at.session_state[CHAVE_SESSAO] = self.id
+
+    def medir(self, interacao, executar):
+        chamadas, reruns = self._cliente.chamadas[self.id], self._reruns[self.id]
+        t0 = time.perf_counter()
+        executar()
+        duracao = time.perf_counter() - t0
+        self._medicoes.append((
+            interacao, duracao,
+            self._cliente.chamadas[self.id] - chamadas,
+            self._reruns[self.id] - reruns,
+        ))
+        if self.at.exception:
+            raise RuntimeError(f"{self.usuario} / {interacao}: {self.at.exception[0].value}")
+
+    def widget(self, tipo, rotulo):
+        for w in getattr(self.at, tipo):
+            if w.label == rotulo:
+                return w
+        mensagens = [e.value for e in list(self.at.error) + list(self.at.warning)]
+        raise LookupError(f"{tipo} '{rotulo}' não encontrado (mensagens na página: {mensagens})")
+
+    def abrir(self, pagina, interacao):
+        self.at.switch_page(pagina)
+        self.medir(interacao, self.at.run)
+
+    # --- Fluxos ---
+    def login(self):
+        self.medir("login: abrir app", self.at.run)
+        self.widget("text_input", "Usuário").input(self.usuario)
+        self.widget("text_input", "Senha").input(SENHA)
+        self.medir("login: entrar", lambda: self.widget("button", "Entrar").click().run())
+
+    def visao_geral(self, rodada):
+        self.abrir("pages/0_Visão_Geral.py", "visão geral: abrir")
+        estudos = self.widget("multiselect", "Filtrar por Estudo")
+        if estudos.options:
+            opcao = estudos.options[(hash(self.id) + rodada) % len(estudos.options)]
+            self.medir("visão geral: filtrar estudo", lambda: estudos.select(opcao).run())
+        zerados = self.widget("checkbox", "Mostrar apenas saldos zerados")
+        self.medir("visão geral: saldos zerados", lambda: zerados.check().run())
+
+    def movimentacoes(self, rodada):
+        self.abrir("pages/1_movimentações.py", "movimentações: abrir")
+        lote = f"CARGA-{self.id}-{rodada}"
+        self.widget("number_input", "Quantidade").set_value(10)
+        self.widget("text_input", "Lote").input(lote)
+        self.medir("movimentações: registrar entrada",
+                   lambda: self.widget("button", "Salvar Movimentação").click().run())
+
+        self.widget("selectbox", "Tipo de Transação").select("Saída")
+        self.medir("movimentações: trocar para saída", self.at.run)
+        lotes = self.widget("selectbox", "Lote")
+        if lote in lotes.options:
+            lotes.select(lote)
+            self.widget("number_input", "Quantidade").set_value(1)
+            self.medir("movimentações: registrar saída",
+                       lambda: self.widget("button", "Salvar Movimentação").click().run())
+
+    def lancamentos(self, rodada):
+        self.abrir("pages/2_Lançamentos.py", "lançamentos: abrir")
+        selecao = self.widget("selectbox", "Selecione o lançamento para editar")
+        selecao.select(selecao.options[-1])
+        self.medir("lançamentos: selecionar", self.at.run)
+        self.widget("text_input", "Nota Fiscal").input(f"NF carga {self.id}-{rodada}")
+        self.medir("lançamentos: salvar edição",
+                   lambda: self.widget("button", "Salvar Alterações").click().run())
+
+    def percorrer(self, rodadas):
+        self.login()
+        for rodada in range(rodadas):
+            self.visao_geral(rodada)
+            if self.papel == "gestor":
+                self.movimentacoes(rodada)
+                self.lancamentos(rodada)
+
+    def memoria_bytes(self) -> int:
+        return memoria.tamanho(dict(self.at.session_state.items()))
+
+# ---------------------------
+# Execução
+# ---------------------------
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def executar(n_sessoes, rodadas, n_movs, latencia_ms, fracao_gestores):
+    papeis = ["gestor" if k < round(n_sessoes * fracao_gestores) else "visualizador" for k in range(n_sessoes)]
+    usuarios = [
+        {"username": f"{papel}{k:03d}", "password_hash": _hash_password(SENHA), "role": papel, "is_active": True,
+         "todos_estudos": True}
+        for k, papel in enumerate(papeis)
+    ]
+    cliente = backend_local.ClienteLocal(
+        backend_local.dados_demo(n_movs=n_movs, usuarios=usuarios),
+        latencia_ms=latencia_ms,
+        identificar=_sessao_atual,
+    )
+    backend_local.configurar(cliente)
+    _permitir_apptests_concorrentes()
+    reruns = Counter()
+    _contar_reruns(reruns)
+
+    medicoes, erros, sessoes = [], [], []
+    largada = threading.Barrier(n_sessoes)
+    rss_inicial = _rss_bytes()
+
+    def rodar(k, papel):
+        sessao = Sessao(k, papel, cliente, medicoes, reruns)
+        sessoes.append(sessao)
+        largada.wait()
+        try:
+            sessao.percorrer(rodadas)
+        except Exception as e:
+            erros.append(f"{sessao.usuario}: {type(e).__name__}: {e}")
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=rodar, args=(k, p), name=f"carga-{k}") for k, p in enumerate(papeis)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - t0
+
+    _relatorio(medicoes, sessoes, erros, total, _rss_bytes() - rss_inicial, n_sessoes, n_movs, latencia_ms)
+    return 1 if erros else 0
+
+def _relatorio(medicoes, sessoes, erros, total, rss_delta, n_sessoes, n_movs, latencia_ms):
+    por_interacao = defaultdict(list)
+    for interacao, duracao, chamadas, reruns in medicoes:
+        por_interacao[interacao].append((duracao, chamadas / max(reruns, 1)))
+
+    print(f"\n{n_sessoes} sessões | ledger de {n_movs} movimentações | latência simulada {latencia_ms:.0f} ms | {total:.1f} s no total\n")
+    print(f"{'interação':<38}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'chamadas/rerun':>16}")
+    for interacao, valores in por_interacao.items():
+        duracoes = [d * 1000 for d, _ in valores]
+        chamadas = statistics.mean(c for _, c in valores)
+        print(f"{interacao:<38}{len(valores):>5}{_percentil(duracoes, 50):>10.0f}"
+              f"{_percentil(duracoes, 95):>10.0f}{_percentil(duracoes, 99):>10.0f}{chamadas:>16.1f}")
+
+    memorias = [s.memoria_bytes() for s in sessoes]
+    if memorias:
+        print(f"\nsession_state por sessão: média {statistics.mean(memorias) / 1e3:.1f} KB, "
+              f"máx {max(memorias) / 1e3:.1f} KB")
+    print(f"Caches contabilizados (memoria.py): {memoria.resumo()['total_bytes'] / 1e6:.1f} MB")
+    print(f"RSS do processo: +{rss_delta / 1e6:.1f} MB (≈ {rss_delta / max(n_sessoes, 1) / 1e6:.2f} MB por sessão, "
+          f"incluindo o cache compartilhado)")
+    if erros:
+        print(f"\n{len(erros)} sessão(ões) com erro:")
+        for erro in erros:
+            print(f"  - {erro}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessoes", type=int, default=10, help="sessões simultâneas")
+    parser.add_argument("--rodadas", type=int, default=2, help="repetições do roteiro por sessão (após o login)")
+    parser.add_argument("--movs", type=int, default=5000, help="tamanho do ledger de demonstração")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="latência simulada por chamada ao backend")
+    parser.add_argument("--gestores", type=float, default=0.5, help="fração de sessões com perfil gestor")
+    args = parser.parse_args()
+    sys.exit(executar(args.sessoes, args.rodadas, args.movs, args.latencia_ms, args.gestores))
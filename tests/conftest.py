@@ -0,0 +1,24 @@
+# conftest.py
+import os
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("CEMEC_BACKEND", "local")
+
+@pytest.fixture
+def banco():
+    """Fábrica de bancos em memória: `banco(dados)` cria um ClienteLocal e o torna o cliente do processo."""
+    import backend_local
+    from supabase_db import init_connection
+
+    def criar(dados=None, cliente=None):
+        cliente = cliente or backend_local.ClienteLocal(dados)
+        backend_local.configurar(cliente)
+        init_connection.clear()
+        return cliente
+
+    yield criar
+    backend_local.configurar(None)
+    init_connection.clear()
@@ -0,0 +1,58 @@
+# test_arquivamento.py
+from datetime import date
+import pandas as pd
+import pytest
+import arquivamento
+import database
+from cubo import TRANSFERENCIA, lotes_visao_geral, montar_cubo
+
+HOJE = date(2030, 1, 1)
+
+def _mov(id_, tipo, quantidade, data="2020-01-01", lote="A", localizacao="G", tipo_acao="Recebimento"):
+    return {"id": id_, "data": data, "tipo_transacao": tipo, "estudo_id": 1, "produto_id": 1,
+            "quantidade": quantidade, "validade": "2021-01-01", "lote": lote, "localizacao": localizacao,
+            "tipo_acao": tipo_acao}
+
+MOVS = [
+    _mov(1, "Entrada", 10),
+    _mov(2, "Saída", 4, "2020-02-01", tipo_acao=TRANSFERENCIA),
+    _mov(3, "Entrada", 4, "2020-02-01", localizacao="F", tipo_acao=TRANSFERENCIA),
+    _mov(4, "Saída", 6, "2020-03-01", tipo_acao="Dispensação"),
+    _mov(5, "Saída", 4, "2020-03-01", localizacao="F", tipo_acao="Dispensação"),
+]
+
+def test_lote_com_transferencia_encerrado_com_entradas_e_saidas_da_visao_geral():
+    resumo, ids = arquivamento.lotes_encerrados(pd.DataFrame(MOVS), hoje=HOJE)
+    assert sorted(ids) == [1, 2, 3, 4, 5]
+    linha = resumo.iloc[0]
+    visao = lotes_visao_geral(montar_cubo(pd.DataFrame(MOVS))).iloc[0]
+    assert (linha.entradas, linha.saidas, linha.movimentacoes) == (10, 10, 5)
+    assert (linha.entradas, linha.saidas) == (visao.Entradas, visao.Saidas)
+    assert list(resumo.columns) == arquivamento.COLUNAS_RESUMO
+
+def test_arquivamento_interrompido_refeito_sem_somar_duas_vezes(banco, monkeypatch):
+    cliente = banco({"movimentacoes": MOVS})
+    original = database.delete_in
+    def queda(*args):
+        raise RuntimeError("queda")
+    monkeypatch.setattr(database, "delete_in", queda)
+    with pytest.raises(RuntimeError):
+        arquivamento.arquivar(0, executar=True, hoje=HOJE)
+    monkeypatch.setattr(database, "delete_in", original)
+    relatorio = arquivamento.arquivar(0, executar=True, hoje=HOJE)
+    assert relatorio["executado"] and relatorio["pendentes"] == 5
+    assert arquivamento.arquivar(0, executar=True, hoje=HOJE)["executado"] is False
+    tabelas = cliente.dump()
+    assert tabelas["movimentacoes"] == [] and len(tabelas["movimentacoes_arquivo"]) == 5
+    (resumo,) = tabelas["lotes_arquivados"]
+    assert (resumo["entradas"], resumo["saidas"], resumo["movimentacoes"]) == (10, 10, 5)
+
+def test_refazer_resumos_corrige_resumo_gravado_com_transferencias(banco):
+    antigo = {"estudo_id": 1, "produto_id": 1, "validade": "2021-01-01", "lote": "A", "entradas": 14,
+              "saidas": 14, "movimentacoes": 5, "primeira_data": "2020-01-01", "ultima_data": "2020-03-01",
+              "arquivado_em": "2024-01-01T00:00:00+00:00"}
+    cliente = banco({"movimentacoes_arquivo": MOVS, "lotes_arquivados": [antigo]})
+    assert arquivamento.refazer_resumos() == 1
+    (resumo,) = cliente.dump()["lotes_arquivados"]
+    assert (resumo["entradas"], resumo["saidas"]) == (10, 10)
+    assert resumo["arquivado_em"] > antigo["arquivado_em"]
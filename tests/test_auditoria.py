@@ -0,0 +1,23 @@
+# test_auditoria.py
+import supabase_db
+from auditoria import historico, legivel
+
+def test_usuario_com_acentos_e_gravado_decodificado(banco, monkeypatch):
+    cliente = banco({"estudos": []})
+    monkeypatch.setattr(supabase_db, "_usuario_atual", lambda: "João Araújo 50%")
+    supabase_db.insert_data("estudos", {"nome": "Estudo 01"})
+    supabase_db.update_data("estudos", {"nome": "Estudo 1"}, "id", 1)
+
+    assert [r["usuario"] for r in cliente.dump()["auditoria"]] == ["João Araújo 50%"] * 2
+    trilha = legivel(historico("estudos", 1))
+    assert list(trilha["usuario"]) == ["João Araújo 50%"] * 2
+    assert list(zip(trilha["operacao"], trilha["antes"], trilha["depois"])) == [
+        ("INSERT", "—", "Estudo 01"), ("UPDATE", "Estudo 01", "Estudo 1")]
+
+def test_cabecalho_do_usuario_vai_so_em_ascii(monkeypatch):
+    class Consulta:
+        headers = {}
+        def execute(self):
+            return self.headers
+    monkeypatch.setattr(supabase_db, "_usuario_atual", lambda: "Zé")
+    assert supabase_db._executar(Consulta())[supabase_db.CABECALHO_USUARIO] == "Z%C3%A9"
@@ -0,0 +1,48 @@
+# test_busca.py
+import pandas as pd
+from busca import IndiceBusca, indice_produtos, normalizar
+
+def _indice():
+    return IndiceBusca([
+        (1, {"nome": "Solução Salina", "estudo": "Alfa", "tipo_produto": "Medicamento"}),
+        (2, {"nome": "Soro Fisiológico", "estudo": "Solar", "tipo_produto": "Medicamento"}),
+        (3, {"nome": "Seringa 5ml", "estudo": "Alfa", "tipo_produto": "Material"}),
+        (4, {"nome": "Sol", "estudo": "Beta", "tipo_produto": "Medicamento"}),
+    ])
+
+def test_normalizar_remove_acentos_e_maiusculas():
+    assert normalizar("Solução FISIOLÓGICA") == "solucao fisiologica"
+    assert normalizar(None) == ""
+
+def test_ranking_exato_antes_de_prefixo_e_nome_antes_de_estudo():
+    ids = [d for d, _ in _indice().buscar("sol")]
+    # "Sol" casa exato no nome; "Solução" por prefixo no nome; "Solar" só pelo estudo
+    assert ids == [4, 1, 2]
+
+def test_consulta_sem_acento_e_todos_os_tokens_precisam_casar():
+    indice = _indice()
+    assert [d for d, _ in indice.buscar("SOLUCAO sal")] == [1]
+    assert indice.buscar("solucao seringa") == []
+
+def test_erro_de_digitacao_casa_por_trigrama_com_pontuacao_menor():
+    indice = _indice()
+    ((doc, pontos),) = indice.buscar("salna")
+    assert doc == 1
+    assert pontos < indice.buscar("salina")[0][1]
+
+def test_filtro_de_ids_e_limite():
+    indice = _indice()
+    assert [d for d, _ in indice.buscar("sol", ids={1, 2})] == [1, 2]
+    assert len(indice.buscar("medicamento", limite=2)) == 2
+    assert indice.buscar("   ") == []
+
+def test_empate_desfeito_pelo_nome():
+    ids = [d for d, _ in _indice().buscar("alfa")]
+    assert ids == [3, 1]   # mesmo peso (estudo): "seringa" antes de "solucao"
+
+def test_indice_produtos_usa_nome_do_estudo():
+    produtos = pd.DataFrame([{"id": 10, "nome": "Dipirona", "estudo_id": 7, "tipo_produto": "Medicamento"}])
+    estudos = pd.DataFrame([{"id": 7, "nome": "Estudo Gama"}])
+    indice = indice_produtos(produtos, estudos)
+    assert [d for d, _ in indice.buscar("gama")] == [10]
+    assert len(indice_produtos(produtos.iloc[0:0], estudos)) == 0
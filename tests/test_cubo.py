@@ -0,0 +1,48 @@
+# test_cubo.py
+from datetime import date
+import pandas as pd
+from cubo import CuboSaldos, montar_cubo, alocar_fefo
+
+HOJE = date(2026, 1, 1)
+
+def _mov(id_, tipo, quantidade, validade, lote, localizacao):
+    return {"id": id_, "data": "2025-12-01", "tipo_transacao": tipo, "estudo_id": 1, "produto_id": 1,
+            "quantidade": quantidade, "validade": validade, "lote": lote, "localizacao": localizacao,
+            "tipo_acao": None}
+
+def _cubo_lote_dividido():
+    """Lote A (validade mais próxima) dividido entre Geladeira e Armário; lote B só na Geladeira."""
+    return CuboSaldos(montar_cubo(pd.DataFrame([
+        _mov(1, "Entrada", 5, "2027-01-01", "A", "Geladeira"),
+        _mov(2, "Entrada", 5, "2027-01-01", "A", "Armário"),
+        _mov(3, "Entrada", 10, "2028-01-01", "B", "Geladeira"),
+    ])))
+
+def test_fefo_aloca_so_o_saldo_da_localizacao():
+    cubo = _cubo_lote_dividido()
+    alocacao, falta = alocar_fefo(cubo.saldos_lote("Geladeira"), 8, hoje=HOJE)
+    assert falta == 0
+    assert list(zip(alocacao["lote"], alocacao["quantidade"])) == [("A", 5.0), ("B", 3.0)]
+
+def test_fefo_falta_quando_o_lote_esta_em_outra_localizacao():
+    cubo = _cubo_lote_dividido()
+    alocacao, falta = alocar_fefo(cubo.saldos_lote("Armário"), 8, hoje=HOJE)
+    assert list(zip(alocacao["lote"], alocacao["quantidade"])) == [("A", 5.0)]
+    assert falta == 3
+
+def test_fefo_sem_localizacao_usa_o_saldo_total_do_lote():
+    alocacao, falta = alocar_fefo(_cubo_lote_dividido().saldos_lote(), 8, hoje=HOJE)
+    assert list(zip(alocacao["lote"], alocacao["quantidade"])) == [("A", 8.0)]
+    assert falta == 0
+
+def test_fefo_devolve_validade_e_lote_como_gravados():
+    cubo = CuboSaldos(montar_cubo(pd.DataFrame([
+        _mov(1, "Entrada", 5, "2027-01-01", " A ", "Geladeira"),
+        _mov(2, "Entrada", 5, "N/A", "N/A", "Geladeira"),
+    ])))
+    alocacao, _ = alocar_fefo(cubo.saldos_lote("Geladeira"), 10, hoje=HOJE)
+    # Agrupado pela chave normalizada, gravado de volta com o valor do banco
+    assert list(alocacao["lote"]) == ["A", ""]
+    assert list(alocacao["lote_gravado"]) == [" A ", "N/A"]
+    assert list(alocacao["validade_gravada"]) == ["2027-01-01", "N/A"]
+    assert list(cubo.saldos_lote()["lote_gravado"]) == [" A ", "N/A"]
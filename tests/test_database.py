@@ -0,0 +1,72 @@
+# test_database.py
+import subprocess
+import sys
+from pathlib import Path
+import backend_local
+import database
+
+def _mov(id_, tipo, quantidade, localizacao="Geladeira", lote="A", validade="2027-01-01"):
+    return {"id": id_, "data": "2025-12-01", "tipo_transacao": tipo, "estudo_id": 1, "produto_id": 1,
+            "quantidade": quantidade, "validade": validade, "lote": lote, "localizacao": localizacao,
+            "tipo_acao": None}
+
+MOVS = [
+    _mov(1, "Entrada", 10),
+    _mov(2, "Entrada", 4, localizacao="Armário"),
+    _mov(3, "Saída", 3),
+    _mov(4, "Entrada", 7, lote=None, validade=None, localizacao=None),
+]
+
+class FuncaoAusente(Exception):
+    """Como o APIError do postgrest para uma função que não existe no banco."""
+    code = "PGRST202"
+
+class ClienteSemFuncao(backend_local.ClienteLocal):
+    """Banco sem a migração 0004: o RPC saldo_lote não existe."""
+    chamadas_rpc = 0
+
+    def rpc(self, funcao, params=None):
+        self.chamadas_rpc += 1
+        raise FuncaoAusente(funcao)
+
+def _saldos():
+    return (database.obter_saldo(1, 1, "2027-01-01", "A"),
+            database.obter_saldo(1, 1, "2027-01-01", "A", localizacao="Geladeira"),
+            database.obter_saldo(1, 1, "N/A", "", localizacao=""))
+
+def test_obter_saldo_pelo_rpc(banco, monkeypatch):
+    monkeypatch.setitem(database._saldo_rpc, "disponivel", True)
+    banco({"movimentacoes": MOVS})
+    assert _saldos() == (11, 7, 7)
+
+def test_obter_saldo_sem_a_funcao_no_banco_soma_as_movimentacoes(banco, monkeypatch):
+    monkeypatch.setitem(database._saldo_rpc, "disponivel", True)
+    cliente = banco(cliente=ClienteSemFuncao({"movimentacoes": MOVS}))
+    assert _saldos() == (11, 7, 7)
+    assert cliente.chamadas_rpc == 1  # a ausência é lembrada: só a primeira chamada tenta o RPC
+
+def test_importar_database_nao_carrega_pandas():
+    # Login e gravações não usam pandas: importá-lo custaria segundos no primeiro acesso
+    codigo = "import sys, database; print('pandas' in sys.modules)"
+    saida = subprocess.run([sys.executable, "-c", codigo], cwd=Path(__file__).resolve().parent.parent,
+                           capture_output=True, text=True, check=True).stdout
+    assert saida.strip() == "False"
+
+def test_bootstrap_que_falha_e_refeito_no_login(banco, monkeypatch):
+    for chave, valor in {"iniciado": False, "admin_criado": False, "avisado": True, "erro": None}.items():
+        monkeypatch.setitem(database._bootstrap, chave, valor)
+    monkeypatch.setattr(database, "_bootstrap_thread", None)
+    cliente = banco({"users": []})
+    get_data = database.get_data
+    def fora_do_ar(*args, **kwargs):
+        raise ConnectionError("banco fora do ar")
+    monkeypatch.setattr(database, "get_data", fora_do_ar)
+    database.iniciar_bootstrap()
+    database._bootstrap_thread.join(5)
+    assert "banco fora do ar" in database.erro_bootstrap()
+    database.iniciar_bootstrap()                      # dentro de NOVA_TENTATIVA_S: não refaz
+    assert not database._bootstrap["iniciado"]
+    monkeypatch.setattr(database, "get_data", get_data)
+    assert database.aguardar_bootstrap() is None      # o login refaz na hora
+    assert database._bootstrap["admin_criado"]
+    assert [u["username"] for u in cliente.dump()["users"]] == ["admin"]
@@ -0,0 +1,87 @@
+# test_integridade.py
+import pandas as pd
+from integridade import chave_texto, saldos_corridos, verificar_alteracao, verificar_ledger
+
+def _mov(id_, data, tipo, quantidade, lote="A", validade="2027-01-01", produto_id=1):
+    return {"id": id_, "data": data, "tipo_transacao": tipo, "estudo_id": 1, "produto_id": produto_id,
+            "quantidade": quantidade, "validade": validade, "lote": lote}
+
+def _ledger(*movs):
+    return pd.DataFrame(list(movs))
+
+def test_ledger_integro():
+    lotes, linhas = verificar_ledger(_ledger(
+        _mov(1, "2025-01-01", "Entrada", 10),
+        _mov(2, "2025-01-02", "Saída", 10),
+    ))
+    assert lotes.empty and linhas.empty
+
+def test_ledger_que_fica_negativo_no_meio_do_historico():
+    # Saída antes da Entrada: negativo em 02/01, zerado no fim
+    lotes, linhas = verificar_ledger(_ledger(
+        _mov(1, "2025-01-03", "Entrada", 5),
+        _mov(2, "2025-01-02", "Saída", 5),
+        _mov(3, "2025-01-01", "Entrada", 5, lote="B"),
+    ))
+    assert len(lotes) == 1
+    lote = lotes.iloc[0]
+    assert (lote["lote"], lote["primeiro_id"], lote["menor_saldo"], lote["linhas_negativas"], lote["saldo_final"]) == \
+        ("A", 2, -5.0, 1, 0.0)
+    assert list(linhas["id"]) == [2]
+
+def test_mesma_data_segue_a_ordem_dos_ids():
+    base = saldos_corridos(_ledger(
+        _mov(2, "2025-01-01", "Saída", 3),
+        _mov(1, "2025-01-01", "Entrada", 5),
+    ))
+    assert list(base["id"]) == [1, 2]
+    assert list(base["saldo_corrido"]) == [5.0, 2.0]
+
+def test_lote_e_validade_ausentes_formam_o_mesmo_lote():
+    # None, '', 'N/A' e espaços valem o mesmo lote vazio: a Saída desconta da Entrada
+    assert list(chave_texto(pd.Series([None, "", "N/A", " L1 ", float("nan")]))) == ["", "", "", "L1", ""]
+    lotes, _ = verificar_ledger(_ledger(
+        _mov(1, "2025-01-01", "Entrada", 5, lote=None, validade=None),
+        _mov(2, "2025-01-02", "Saída", 3, lote="N/A", validade=""),
+        _mov(3, "2025-01-03", "Saída", 2, lote="", validade="N/A"),
+    ))
+    assert lotes.empty
+
+def test_edicao_que_deixaria_o_saldo_negativo_e_barrada():
+    df = _ledger(
+        _mov(1, "2025-01-01", "Entrada", 10),
+        _mov(2, "2025-01-02", "Saída", 6),
+        _mov(3, "2025-01-03", "Saída", 4),
+    )
+    lotes, linhas = verificar_alteracao(df, 1, {"quantidade": 8})
+    assert list(lotes["lote"]) == ["A"] and lotes.iloc[0]["menor_saldo"] == -2.0
+    assert list(linhas["id"]) == [3]
+
+def test_exclusao_de_entrada_com_saidas_e_barrada():
+    df = _ledger(_mov(1, "2025-01-01", "Entrada", 10), _mov(2, "2025-01-02", "Saída", 6))
+    lotes, _ = verificar_alteracao(df, 1)
+    assert lotes.iloc[0]["menor_saldo"] == -6.0
+
+def test_edicao_permitida():
+    df = _ledger(
+        _mov(1, "2025-01-01", "Entrada", 10),
+        _mov(2, "2025-01-02", "Saída", 6),
+        _mov(3, "2025-01-01", "Entrada", 3, lote="B"),
+    )
+    # Menos saída, e mudança de lote que o outro lote cobre
+    assert verificar_alteracao(df, 2, {"quantidade": 2})[0].empty
+    assert verificar_alteracao(df, 2, {"quantidade": 3, "lote": "B"})[0].empty
+
+def test_edicao_que_move_a_saida_para_lote_sem_saldo_e_barrada():
+    df = _ledger(_mov(1, "2025-01-01", "Entrada", 10), _mov(2, "2025-01-02", "Saída", 6))
+    lotes, _ = verificar_alteracao(df, 2, {"lote": "C"})
+    assert list(lotes["lote"]) == ["C"]
+
+def test_lote_ja_negativo_so_barra_se_piorar():
+    df = _ledger(
+        _mov(1, "2025-01-01", "Saída", 5),
+        _mov(2, "2025-01-02", "Entrada", 2),
+    )
+    assert verificar_alteracao(df, 1, {"quantidade": 3})[0].empty       # menor saldo -5 -> -3
+    assert verificar_alteracao(df, 2, {"quantidade": 1})[0].empty       # menor saldo continua -5
+    assert verificar_alteracao(df, 1, {"quantidade": 7})[0].iloc[0]["menor_saldo"] == -7.0  # piora
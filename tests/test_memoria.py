@@ -0,0 +1,59 @@
+# test_memoria.py
+import time
+import pandas as pd
+import memoria
+import repositorio
+from repositorio import TABELAS, RepositorioMovimentacoes
+
+def _entrada(nome, bytes_, idade, ordem=0, descartaveis=None, ocupada=False):
+    def descartar():
+        if ocupada:
+            return False
+        descartaveis.append(nome)
+    return {"nome": nome, "bytes": bytes_, "usado_em": time.monotonic() - idade,
+            "descartar": descartar if descartaveis is not None else None, "ordem": ordem}
+
+def test_descarta_da_usada_ha_mais_tempo_ate_caber(monkeypatch):
+    descartadas = []
+    todas = [
+        _entrada("recente", 100, 1, descartaveis=descartadas),          # dentro de IDADE_MINIMA_S
+        _entrada("antiga", 100, 500, descartaveis=descartadas),
+        _entrada("media", 100, 200, descartaveis=descartadas),
+        _entrada("sessao", 100, 900),                                   # session_state: não descartável
+        _entrada("mais_antiga", 100, 800, descartaveis=descartadas),
+    ]
+    monkeypatch.setattr(memoria, "entradas", lambda: todas)
+    assert memoria.aplicar_orcamento(300) == [todas[4], todas[1]]
+    assert descartadas == ["mais_antiga", "antiga"]
+    assert memoria.aplicar_orcamento(0) == []                        # sem orçamento, sem despejo
+
+def test_empate_derivado_antes_da_base_e_ocupada_fica(monkeypatch):
+    descartadas = []
+    todas = [
+        _entrada("tabelas", 100, 100, ordem=2, descartaveis=descartadas),
+        _entrada("derivado", 100, 100, ordem=0, descartaveis=descartadas),
+        _entrada("em_carga", 100, 900, ordem=2, descartaveis=descartadas, ocupada=True),
+    ]
+    todas[0]["usado_em"] = todas[1]["usado_em"]
+    monkeypatch.setattr(memoria, "entradas", lambda: todas)
+    assert [e["nome"] for e in memoria.aplicar_orcamento(200)] == ["derivado"]
+    assert descartadas == ["derivado"]
+
+def test_orcamento_descarta_derivados_e_tabelas_do_repositorio(monkeypatch):
+    cargas = []
+    def carregar():
+        cargas.append(1)
+        dados = {nome: pd.DataFrame() for nome in TABELAS}
+        dados["movimentacoes"] = pd.DataFrame({"id": range(1000), "quantidade": 1.0})
+        return dados
+    repo = RepositorioMovimentacoes(carregar=carregar,
+                                    derivados={"total": (lambda d: d["movimentacoes"]["quantidade"].sum(),
+                                                         ("movimentacoes",))})
+    monkeypatch.setitem(repositorio._repositorios, ("teste",), repo)
+    monkeypatch.setattr(memoria, "IDADE_MINIMA_S", -1.0)
+    assert repo.derivado("total") == 1000
+    nomes = lambda: {e["nome"] for e in repo.entradas_memoria()}
+    assert nomes() == {"tabelas", "derivado:total"}
+    memoria.aplicar_orcamento(1)
+    assert nomes() == set()
+    assert repo.derivado("total") == 1000 and len(cargas) == 2       # recarregado sob demanda
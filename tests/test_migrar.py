@@ -0,0 +1,52 @@
+# test_migrar.py
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+import migrar
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+@pytest.fixture
+def banco():
+    b = migrar.conectar("sqlite:///:memory:")
+    yield b
+    b.fechar()
+
+def test_mesmas_versoes_nos_dois_dialetos():
+    versoes = lambda d: [(v, n) for v, n, _ in migrar.migracoes_disponiveis(d)]
+    assert versoes("sqlite") == versoes("postgres")
+
+def test_aplica_pendentes_uma_vez(banco):
+    todas = [v for v, _, _ in migrar.migracoes_disponiveis("sqlite")]
+    assert migrar.migrar(banco, ate=2) == todas[:2]
+    assert [v for v, _, _ in migrar.pendentes(banco)] == todas[2:]
+    assert migrar.migrar(banco) == todas[2:]
+    assert migrar.migrar(banco) == []
+    assert migrar.versoes_aplicadas(banco) == set(todas)
+
+def test_consultas_quentes_servidas_por_indice(banco):
+    migrar.migrar(banco)
+    situacoes = {descricao: situacao for descricao, _, _, situacao, _ in migrar.verificar_indices(banco)}
+    assert set(situacoes.values()) == {"ok"}, situacoes
+
+def test_migracao_com_erro_nao_aplica_nada(banco, tmp_path, monkeypatch):
+    (tmp_path / "sqlite").mkdir()
+    (tmp_path / "sqlite" / "0001_ok.sql").write_text("create table a (id integer);", encoding="utf-8")
+    (tmp_path / "sqlite" / "0002_quebrada.sql").write_text("create table b (id integer);\nselect * from nada;",
+                                                           encoding="utf-8")
+    monkeypatch.setattr(migrar, "PASTA_MIGRACOES", tmp_path)
+    with pytest.raises(Exception):
+        migrar.migrar(banco)
+    assert migrar.versoes_aplicadas(banco) == {1}
+    tabelas = {l[0] for l in banco.consultar("select name from sqlite_master where type = 'table'")}
+    assert "a" in tabelas and "b" not in tabelas
+
+def test_linha_de_comando_status(tmp_path):
+    url = f"sqlite:///{tmp_path / 'estoque.db'}"
+    rodar = lambda *args: subprocess.run([sys.executable, "migrar.py", "--url", url, *args],
+                                         cwd=RAIZ, capture_output=True, text=True, check=True).stdout
+    assert "pendente" in rodar("--status") and "aplicada" not in rodar("--status")
+    rodar("--ate", "1")
+    linhas = rodar("--status").splitlines()
+    assert linhas[0].endswith(": aplicada") and all(l.endswith(": pendente") for l in linhas[1:])
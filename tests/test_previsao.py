@@ -0,0 +1,71 @@
+# test_previsao.py
+from datetime import date
+import math
+import pandas as pd
+from cubo import TRANSFERENCIA
+from previsao import prever, taxas_consumo
+
+HOJE = date(2026, 1, 31)
+
+def _mov(tipo, quantidade, data, produto_id=1, validade="2026-06-30", lote="L2", tipo_acao=None):
+    return {"estudo_id": 1, "produto_id": produto_id, "tipo_transacao": tipo, "quantidade": quantidade,
+            "data": data, "validade": validade, "lote": lote, "tipo_acao": tipo_acao}
+
+def _df(*movs):
+    return pd.DataFrame(list(movs))
+
+def test_taxa_usa_a_janela_mais_recente_com_consumo_e_ignora_transferencias():
+    df = _df(
+        _mov("Saída", 60, "2026-01-20"),
+        _mov("Saída", 500, "2026-01-25", tipo_acao=TRANSFERENCIA),
+        _mov("Saída", 90, "2025-12-01", produto_id=2),     # só na janela de 90 dias
+    )
+    taxas = taxas_consumo(df, HOJE).set_index("produto_id")
+    assert taxas.loc[1, "consumo_30d"] == 2.0
+    assert taxas.loc[1, "taxa_diaria"] == 2.0
+    assert taxas.loc[2, "consumo_30d"] == 0.0
+    assert taxas.loc[2, "taxa_diaria"] == 1.0
+
+def test_fefo_risco_de_vencimento_e_dias_de_estoque():
+    df = _df(
+        _mov("Entrada", 100, "2025-12-01", validade="2026-02-10", lote="L1"),
+        _mov("Saída", 60, "2026-01-20", validade="2026-02-10", lote="L1"),
+        _mov("Entrada", 100, "2025-12-01"),
+    )
+    produtos, lotes = prever(df, HOJE)
+    l1, l2 = lotes.itertuples()
+    # Taxa de 2/dia: o L1 (40) leva 20 dias e vence em 10 -> sobram 20 no vencimento
+    assert (l1.lote, l1.dias_ate_consumir, l1.dias_para_vencer) == ("L1", 20.0, 10.0)
+    assert l1.em_risco and l1.qtd_em_risco == 20.0
+    # O L2 só começa depois do L1: acaba no dia 70, vence no 150
+    assert (l2.lote, l2.dias_ate_consumir, l2.em_risco, l2.qtd_em_risco) == ("L2", 70.0, False, 0.0)
+    p = produtos.iloc[0]
+    assert (p.saldo, p.dias_estoque) == (140.0, 70.0)
+    assert p.ruptura_prevista == pd.Timestamp("2026-04-11")
+
+def test_lote_vencido_fica_fora_da_fila_com_saldo_todo_em_risco():
+    df = _df(
+        _mov("Entrada", 30, "2025-06-01", validade="2026-01-01", lote="V"),
+        _mov("Entrada", 10, "2025-06-01"),
+        _mov("Saída", 30, "2026-01-10", validade="2026-01-01", lote="V"),
+        _mov("Entrada", 30, "2025-06-01", validade="2026-01-01", lote="V"),
+    )
+    produtos, lotes = prever(df, HOJE)
+    vencido = lotes.set_index("lote").loc["V"]
+    assert vencido.saldo_utilizavel == 0.0 and vencido.em_risco and vencido.qtd_em_risco == 30.0
+    assert math.isnan(vencido.dias_ate_consumir)
+    assert produtos.iloc[0].saldo_utilizavel == 10.0
+
+def test_sem_consumo_nao_ha_ruptura_e_lote_com_validade_vence_inteiro():
+    df = _df(_mov("Entrada", 10, "2026-01-01"), _mov("Entrada", 5, "2026-01-01", validade=None, lote="S"))
+    produtos, lotes = prever(df, HOJE)
+    assert math.isinf(produtos.iloc[0].dias_estoque)
+    assert pd.isna(produtos.iloc[0].ruptura_prevista)
+    com_validade, sem_validade = lotes.itertuples()
+    assert com_validade.em_risco and com_validade.qtd_em_risco == 10.0
+    assert not sem_validade.em_risco and sem_validade.qtd_em_risco == 0.0
+
+def test_sem_saldo_retorna_tabelas_vazias():
+    produtos, lotes = prever(_df(_mov("Entrada", 5, "2026-01-01"), _mov("Saída", 5, "2026-01-02")), HOJE)
+    assert produtos.empty and lotes.empty
+    assert "em_risco" in lotes.columns and "dias_estoque" in produtos.columns
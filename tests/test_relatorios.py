@@ -0,0 +1,79 @@
+# test_relatorios.py
+import pandas as pd
+import relatorios
+from cubo import TRANSFERENCIA
+from relatorios import BaseMensal, MotorRelatorios, agregar_mensal
+
+def _mov(id_, data, tipo="Entrada", quantidade=10, produto_id=1, tipo_acao="Compra", localizacao="A"):
+    return {"id": id_, "data": data, "tipo_transacao": tipo, "quantidade": quantidade, "estudo_id": 1,
+            "produto_id": produto_id, "tipo_produto": "Medicamento", "responsavel": "ana",
+            "tipo_acao": tipo_acao, "localizacao": localizacao}
+
+def _ledger():
+    return pd.DataFrame([
+        _mov(1, "2026-01-05"),
+        _mov(2, "2026-01-20", "Saída", 4, tipo_acao="Dispensação"),
+        _mov(3, "2026-02-10", produto_id=2),
+        _mov(4, "2026-03-01", "Saída", 3, tipo_acao=TRANSFERENCIA),
+        _mov(5, "2026-03-01", "Entrada", 3, tipo_acao=TRANSFERENCIA, localizacao="B"),
+    ])
+
+def _totais(base):
+    return base.groupby("mes")[["entradas", "saidas", "saldo", "movimentacoes"]].sum()
+
+def test_transferencias_fora_de_entradas_e_saidas_mas_no_saldo():
+    totais = _totais(agregar_mensal(_ledger()))
+    assert totais.loc[202603].tolist() == [0, 0, 0, 2]
+    por_local = agregar_mensal(_ledger()).set_index("localizacao")
+    assert por_local.loc["B", "saldo"] == 3
+
+def test_base_mensal_reagrega_so_os_meses_alterados():
+    base = BaseMensal()
+    df = _ledger()
+    base.atualizar(df, 1)
+    assert base.meses_reagregados == 3
+    base.atualizar(df, 1)                               # mesma versão: nada a fazer
+    assert base.meses_reagregados == 3
+    df = pd.concat([df, pd.DataFrame([_mov(6, "2026-02-28", "Saída", 2)])], ignore_index=True)
+    resultado = base.atualizar(df, 2)
+    assert base.meses_reagregados == 4                  # só fevereiro
+    pd.testing.assert_frame_equal(_totais(resultado), _totais(agregar_mensal(df)))
+
+def test_base_mensal_descarta_mes_que_sumiu_do_ledger():
+    base = BaseMensal()
+    base.atualizar(_ledger(), 1)
+    sem_janeiro = _ledger().iloc[2:]
+    resultado = base.atualizar(sem_janeiro, 2)
+    assert sorted(resultado["mes"].unique()) == [202602, 202603]
+    assert base.meses_reagregados == 3
+
+def test_base_soma_o_arquivo():
+    motor = MotorRelatorios()
+    arquivo = pd.DataFrame([_mov(90, "2025-12-01", quantidade=50)])
+    base = motor.base(_ledger(), 1, arquivo, "v1")
+    assert _totais(base).loc[202512, "entradas"] == 50
+    assert _totais(base)["saldo"].sum() == 50 + 10 - 4 + 10
+
+def test_pivot_acumulado_inclui_historico_anterior_ao_periodo():
+    motor = MotorRelatorios()
+    base = motor.base(_ledger(), 1)
+    pivo = motor.pivot(base, ["estudo"], ["mes"], "saldo", meses=(202602, 202603), acumulado=True,
+                       estudos=pd.DataFrame([{"id": 1, "nome": "Alfa"}]))
+    assert list(pivo.columns) == ["Estudo", "2026-02", "2026-03"]
+    assert pivo.iloc[0].tolist() == ["Alfa", 16, 16]
+
+def test_pivos_guardados_em_lru(monkeypatch):
+    monkeypatch.setattr(relatorios, "MAX_PIVOS_EM_CACHE", 2)
+    motor = MotorRelatorios()
+    base = motor.base(_ledger(), 1)
+    pedir = lambda linhas, medida: motor.pivot(base, linhas, medida=medida, chave_base=(1,))
+    pedir(["produto"], "saldo")
+    pedir(["mes"], "entradas")
+    pedir(["produto"], "saldo")                         # do cache; passa a ser o mais recente
+    pedir(["estudo"], "saidas")                         # descarta ["mes"], o menos usado
+    assert motor.stats == {"pivos_calculados": 3, "pivos_do_cache": 1}
+    pedir(["produto"], "saldo")
+    pedir(["mes"], "entradas")
+    assert motor.stats == {"pivos_calculados": 4, "pivos_do_cache": 2}
+    motor.pivot(base, ["produto"], medida="saldo")       # sem chave_base: não é guardado
+    assert motor.stats["pivos_calculados"] == 5 and len(motor.entradas_memoria()) == 3
@@ -0,0 +1,145 @@
+# test_repositorio.py
+import threading
+import pandas as pd
+import pytest
+from notificacoes import evento
+from repositorio import TABELAS, RepositorioMovimentacoes
+
+def _dados(*movs):
+    dados = {nome: pd.DataFrame() for nome in TABELAS}
+    dados["movimentacoes"] = pd.DataFrame(list(movs))
+    return dados
+
+def _mov(id_, estudo_id=1, quantidade=1):
+    return {"id": id_, "estudo_id": estudo_id, "produto_id": 1, "quantidade": quantidade,
+            "tipo_transacao": "Entrada", "validade": None, "lote": "A"}
+
+class CargaLenta:
+    """Carga que só termina quando liberada, contando as chamadas."""
+
+    def __init__(self, dados):
+        self.dados = dados
+        self.chamadas = 0
+        self.entrou = threading.Event()
+        self.liberar = threading.Event()
+
+    def __call__(self):
+        self.chamadas += 1
+        self.entrou.set()
+        assert self.liberar.wait(5)
+        return self.dados
+
+def test_atualizacao_single_flight():
+    carga = CargaLenta(_dados(_mov(1)))
+    repo = RepositorioMovimentacoes(carregar=carga, derivados={})
+    resultados = []
+    leitores = [threading.Thread(target=lambda: resultados.append(len(repo.tabela("movimentacoes"))))
+                for _ in range(8)]
+    leitores[0].start()
+    assert carga.entrou.wait(5)
+    for t in leitores[1:]:
+        t.start()
+    while repo.estatisticas()["esperas"] < 7:
+        pass
+    carga.liberar.set()
+    for t in leitores:
+        t.join(5)
+    assert resultados == [1] * 8
+    assert carga.chamadas == 1
+    assert repo.estatisticas()["atualizacoes"] == 1
+
+def test_falha_na_carga_serve_os_dados_anteriores_e_sem_eles_propaga():
+    respostas = [RuntimeError("sem rede"), _dados(_mov(1)), RuntimeError("sem rede")]
+    def carregar():
+        r = respostas.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+    repo = RepositorioMovimentacoes(carregar=carregar, derivados={})
+    with pytest.raises(RuntimeError):
+        repo.tabela("movimentacoes")
+    assert len(repo.tabela("movimentacoes")) == 1      # tenta de novo na leitura seguinte
+    repo.invalidar()
+    assert len(repo.tabela("movimentacoes")) == 1      # falhou: segue com os dados anteriores
+    assert repo.estatisticas()["falhas"] == 2
+
+def test_evento_aplicado_como_patch_sem_recarga():
+    chamadas = []
+    repo = RepositorioMovimentacoes(carregar=lambda: chamadas.append(1) or _dados(_mov(1), _mov(2)), derivados={})
+    _, versao = repo.tabela_com_versao("movimentacoes")
+    repo.aplicar_evento(evento("movimentacoes", "INSERT", novo=_mov(3)))
+    repo.aplicar_evento(evento("movimentacoes", "UPDATE", novo=_mov(1, quantidade=9)))
+    repo.aplicar_evento(evento("movimentacoes", "DELETE", antigo={"id": 2}))
+    movs, nova_versao = repo.tabela_com_versao("movimentacoes")
+    assert dict(zip(movs["id"], movs["quantidade"])) == {1: 9, 3: 1}
+    assert nova_versao == versao + 3
+    assert len(chamadas) == 1 and repo.estatisticas()["patches"] == 3
+
+def test_eventos_fora_do_escopo_sao_ignorados_e_linha_que_sai_do_escopo_some():
+    repo = RepositorioMovimentacoes(carregar=lambda: _dados(_mov(1), _mov(2)), derivados={}, escopo=(1,))
+    repo.tabela("movimentacoes")
+    repo.aplicar_evento(evento("movimentacoes", "INSERT", novo=_mov(3, estudo_id=2)))
+    repo.aplicar_evento(evento("movimentacoes", "UPDATE", novo=_mov(2, estudo_id=2)))
+    repo.aplicar_evento(evento("movimentacoes", "INSERT", novo=_mov(4, estudo_id=1)))
+    assert sorted(repo.tabela("movimentacoes")["id"]) == [1, 4]
+
+def test_evento_durante_a_carga_invalida_em_vez_de_aplicar():
+    carga = CargaLenta(_dados(_mov(1)))
+    repo = RepositorioMovimentacoes(carregar=carga, derivados={})
+    carga.liberar.set()
+    repo.tabela("movimentacoes")
+    carga.liberar.clear(); carga.entrou.clear()
+    repo.invalidar()
+    leitor = threading.Thread(target=repo.tabela, args=("movimentacoes",))
+    leitor.start()
+    assert carga.entrou.wait(5)
+    repo.aplicar_evento(evento("movimentacoes", "INSERT", novo=_mov(2)))
+    carga.liberar.set()
+    leitor.join(5)
+    assert repo.estatisticas()["patches"] == 0
+    repo.tabela("movimentacoes")
+    assert carga.chamadas == 3   # a carga em voo pode não ter visto o evento: recarrega
+
+def test_derivado_calculado_uma_vez_por_versao_das_dependencias():
+    calculos = []
+    derivados = {"total": (lambda d: calculos.append(1) or d["movimentacoes"]["quantidade"].sum(), ("movimentacoes",)),
+                 "n_estudos": (lambda d: calculos.append(2) or len(d["estudos"]), ("estudos",))}
+    repo = RepositorioMovimentacoes(carregar=lambda: _dados(_mov(1), _mov(2)), derivados=derivados)
+    assert repo.derivado("total") == 2 and repo.derivado("total") == 2
+    repo.derivado("n_estudos")
+    repo.aplicar_evento(evento("movimentacoes", "INSERT", novo=_mov(3, quantidade=5)))
+    assert repo.derivado("total") == 7
+    repo.derivado("n_estudos")          # estudos não mudou: não recalcula
+    assert calculos == [1, 2, 1]
+
+def test_tabela_entregue_e_copia():
+    repo = RepositorioMovimentacoes(carregar=lambda: _dados(_mov(1)), derivados={})
+    df = repo.tabela("movimentacoes")
+    df["quantidade"] = 100
+    assert list(repo.tabela("movimentacoes")["quantidade"]) == [1]
+
+def test_derivado_que_depende_de_outro_reusa_o_calculado():
+    calculos = []
+    derivados = {
+        "total": (lambda d: calculos.append("total") or d["movimentacoes"]["quantidade"].sum(), ("movimentacoes",)),
+        "dobro": (lambda d: calculos.append("dobro") or d["total"] * 2, ("total",)),
+        "n_estudos": (lambda d: calculos.append("n_estudos") or len(d["estudos"]), ("estudos",)),
+    }
+    repo = RepositorioMovimentacoes(carregar=lambda: _dados(_mov(1), _mov(2)), derivados=derivados)
+    assert repo.derivado("total") == 2
+    assert repo.derivado("dobro") == 4 and repo.derivado("dobro") == 4
+    assert calculos == ["total", "dobro"]
+    repo.aplicar_evento(evento("movimentacoes", "INSERT", novo=_mov(3, quantidade=5)))
+    assert repo.derivado("dobro") == 14
+    assert repo.derivado("total") == 7
+    assert calculos == ["total", "dobro", "total", "dobro"]
+
+def test_visao_geral_usa_o_cubo_e_a_previsao_do_repositorio():
+    from repositorio import DERIVADOS
+    repo = RepositorioMovimentacoes(carregar=lambda: _dados(_mov(1), _mov(2, quantidade=4)), derivados=DERIVADOS)
+    repo.derivado("cubo")
+    repo.derivado("previsao")
+    calculados = repo.estatisticas()["derivados_calculados"]
+    lotes, _, _ = repo.derivado("visao_geral")
+    assert repo.estatisticas()["derivados_calculados"] == calculados + 1
+    assert lotes[["Entradas", "Saldo Total"]].values.tolist() == [[5, 5]]